@@ -1,41 +1,147 @@
-
 from __future__ import absolute_import
 
 from io import BytesIO
+import os
+import shutil
+import signal
 import subprocess
+import sys
+import threading
+
+
+__all__ = ['run', 'run_pipe', 'run_stream', 'pipe_with_input']
+
+try:
+    _string_types = (basestring,)
+except NameError:  # Python 3
+    _string_types = (str,)
 
+# None on Windows, which has no SIGPIPE
+_SIGPIPE = getattr(signal, 'SIGPIPE', None)
+
+if _SIGPIPE is not None and sys.version_info[0] < 3:
+    def _restore_sigpipe():
+        # Python ignores SIGPIPE and Python 2 passes that on to the commands,
+        # which then fail with EPIPE instead of being ended by the signal
+        signal.signal(_SIGPIPE, signal.SIG_DFL)
+    _popen_kwargs = {'preexec_fn': _restore_sigpipe}
+else:
+    _popen_kwargs = {}
 
-__all__ = ['run', 'run_pipe', 'pipe_with_input']
 
 def run(command_args, input_=None):
-    stdin = subprocess.PIPE if (input_ is not None) else None
-    input_data = input_
-    if isinstance(input_data, basestring):
-        input_data = open(input_, 'rb')
-    if hasattr(input_data, 'read'):
-        input_data = input_data.read()
-    process = subprocess.Popen(command_args, stdout=subprocess.PIPE, stdin=stdin)
-    stdout_data, _stderr_data = process.communicate(input=input_data)
-    if hasattr(input_, 'close'):
-        input_.close()
-    if process.returncode != 0:
-        return None
-    return BytesIO(stdout_data)
+    return run_stream((command_args,), input_=input_)
 
 def run_pipe(input_=None, *commands):
     if isinstance(input_, (tuple, list)):
         commands = (input_,) + commands
         input_ = None
-    else:
-        input_ = input_.read()
     assert len(commands) >= 1
+    return run_stream(commands, input_=input_)
+
+def _feed(fp, pipe):
+    try:
+        shutil.copyfileobj(fp, pipe)
+    except (IOError, OSError):
+        # the command exited without reading all of its input, its return
+        # code tells whether that is a problem
+        pass
+    finally:
+        try:
+            pipe.close()
+        except (IOError, OSError):
+            pass
+
+def run_stream(commands, input_=None, output=None):
+    """
+    Run ``commands`` as a pipeline where each command's stdout is connected
+    to the next command's stdin by an OS pipe, so no intermediate output is
+    held in memory.
+
+    ``input_`` is a filename or a file-like object for the first command's
+    stdin. ``output`` is a filename, a file descriptor or a file object with a
+    ``fileno()`` the last command writes to directly, in which case True is
+    returned. Without ``output`` the final output is returned as a BytesIO.
+    Returns None if any of the commands fail. Like in a shell, a command
+    killed by SIGPIPE because a later one stopped reading its output doesn't
+    count as failed if the last command succeeded.
+    """
+    assert len(commands) >= 1
+    opened = []
+    feeder = None
+    processes = []
+    output_filename = None
+    try:
+        stdin = None
+        fp = None
+        if isinstance(input_, _string_types):
+            stdin = open(input_, 'rb')
+            opened.append(stdin)
+        elif input_ is not None:
+            stdin = subprocess.PIPE
+            fp = input_
+
+        if output is None:
+            stdout = subprocess.PIPE
+        elif isinstance(output, _string_types):
+            output_filename = output
+            stdout = open(output, 'wb')
+            opened.append(stdout)
+        elif isinstance(output, int):
+            stdout = output
+        else:
+            output.flush()
+            stdout = output.fileno()
 
-    last_output_data = input_
-    for command_args in commands:
-        last_output_data = run(command_args, last_output_data)
-        if last_output_data is None:
-            break
-    return last_output_data
+        for i, command_args in enumerate(commands):
+            is_last = (i == len(commands) - 1)
+            process = subprocess.Popen(
+                command_args,
+                stdin=stdin,
+                stdout=stdout if is_last else subprocess.PIPE,
+                **_popen_kwargs
+            )
+            if processes:
+                # only the next command should hold the read end, so the
+                # previous one gets SIGPIPE if the next one exits early
+                processes[-1].stdout.close()
+            processes.append(process)
+            stdin = process.stdout
+
+        if fp is not None:
+            feeder = threading.Thread(target=_feed, args=(fp, processes[0].stdin))
+            feeder.daemon = True
+            feeder.start()
+
+        output_data = None
+        if output is None:
+            output_data = processes[-1].stdout.read()
+            processes[-1].stdout.close()
+        returncodes = [process.wait() for process in processes]
+        failed = returncodes[-1] != 0 or any(
+            returncode != 0 and (_SIGPIPE is None or returncode != -_SIGPIPE)
+            for returncode in returncodes[:-1]
+        )
+    except (Exception, KeyboardInterrupt):
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+        raise
+    finally:
+        if feeder is not None:
+            feeder.join()
+        for f in opened:
+            f.close()
+        if hasattr(input_, 'close'):
+            input_.close()
+
+    if failed:
+        if output_filename is not None and os.path.exists(output_filename):
+            os.unlink(output_filename)
+        return None
+    if output is None:
+        return BytesIO(output_data)
+    return True
 
 def pipe_with_input(filename_or_fp, *commands):
     filename = None
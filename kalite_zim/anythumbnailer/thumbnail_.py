@@ -1,52 +1,95 @@
 
 from __future__ import absolute_import
 
+from distutils.spawn import find_executable
 from io import BytesIO
 import mimetypes
+from multiprocessing.pool import ThreadPool
 import os
 import re
 import shutil
+import subprocess
 import tempfile
 
-from .sh_utils import run
+from .sh_utils import run, run_stream
 
-__all__ = ['create_thumbnail']
+__all__ = [
+    'create_thumbnail', 'create_thumbnail_file', 'create_thumbnail_files',
+    'configure', 'available_thumbnailers',
+]
 
 
-def create_thumbnail(source_filename, dimensions=None, **kwargs):
-    assert dimensions is None
+def _thumbnailer_for_file(source_filename):
     mime_type, _encoding = mimetypes.guess_type(source_filename, strict=False)
     if (mime_type is None) and ('.' in source_filename):
         extension = source_filename.rsplit('.', 1)[-1].lower()
         mime_type = mimetypes_by_extension.get(extension)
     if mime_type is None:
         return None
-    thumbnailer = thumbnailer_for(mime_type)
+    return thumbnailer_for(mime_type)
+
+
+def create_thumbnail(source_filename, dimensions=None, **kwargs):
+    assert dimensions is None
+    thumbnailer = _thumbnailer_for_file(source_filename)
     if thumbnailer is None:
         return None
     return thumbnailer.thumbnail(source_filename, dimensions, **kwargs)
 
 
+def create_thumbnail_file(source_filename, output_filename, dimensions=None, **kwargs):
+    thumbnailer = _thumbnailer_for_file(source_filename)
+    if thumbnailer is None:
+        return False
+    return thumbnailer.thumbnail_to(source_filename, output_filename, dimensions=dimensions, **kwargs)
+
+
+def create_thumbnail_files(sources_and_outputs, jobs=4, dimensions=None, **kwargs):
+    """
+    Thumbnail a list of ``(source_filename, output_filename)`` with ``jobs``
+    thumbnailer processes at a time. Yields
+    ``(source_filename, output_filename, success)`` in the original order.
+    """
+    def thumbnail(source_and_output):
+        source_filename, output_filename = source_and_output
+        success = create_thumbnail_file(source_filename, output_filename, dimensions=dimensions, **kwargs)
+        return source_filename, output_filename, success
+
+    pool = ThreadPool(jobs)
+    try:
+        for result in pool.imap(thumbnail, sources_and_outputs):
+            yield result
+        pool.close()
+    except (Exception, KeyboardInterrupt):
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
 class Thumbnailer(object):
-    def is_available(self):
-        if hasattr(self, 'executables'):
-            executables = self.executables
-        else:
-            executables = (self.executable,)
-        for command_path in executables:
-            command = command_path.split(' ', 1)[0]
-            if not os.path.exists(command):
-                return False
-        return True
+    # names of the attributes holding the paths of executables, the registry
+    # replaces them with the paths it resolved
+    executable_attributes = ('executable',)
 
     def thumbnail(self, source_filename_or_fp, dimensions=None, **kwargs):
         raise NotImplementedError()
 
+    def thumbnail_to(self, source_filename, output_filename, dimensions=None, **kwargs):
+        if 'output_format' not in kwargs:
+            kwargs['output_format'] = output_filename.rsplit('.', 1)[-1].lower()
+        output_fp = self.thumbnail(source_filename, dimensions=dimensions, **kwargs)
+        if output_fp is None:
+            return False
+        with open(output_filename, 'wb') as output_file:
+            shutil.copyfileobj(output_fp, output_file)
+        return True
+
 
 class PNMToImage(Thumbnailer):
     pnm_to_png = '/usr/bin/pnmtopng'
     pnm_to_jpg = '/usr/bin/pnmtojpeg'
-    executables = (pnm_to_png, pnm_to_jpg)
+    executable_attributes = ('pnm_to_png', 'pnm_to_jpg')
 
     def pipe_args(self, dimensions=None, output_format='jpg'):
         assert dimensions is None
@@ -61,9 +104,10 @@ class PNMToImage(Thumbnailer):
 
 # pdftoppm 0.12.4 (CentOS 6.5) bails out if the PDF contents are transferred
 # via stdin. pdftoppm 0.24.3 (Fedora 20) works fine though...
-class Poppler(Thumbnailer):
+# Poppler renders to PNM and converts that with the PNMToImage commands.
+class Poppler(PNMToImage):
     pdf_to_ppm = '/usr/bin/pdftoppm'
-    executables = (pdf_to_ppm,) + PNMToImage.executables
+    executable_attributes = ('pdf_to_ppm',) + PNMToImage.executable_attributes
 
     def _args(self, source_filename=None, dimensions=None, page=1):
         assert dimensions is None
@@ -77,7 +121,7 @@ class Poppler(Thumbnailer):
             command += (source_filename,)
         return command
 
-    def thumbnail(self, source_filename_or_fp, dimensions=None, page=1, output_format='jpg'):
+    def _stream(self, source_filename_or_fp, dimensions=None, page=1, output_format='jpg', output=None):
         assert dimensions is None
         temp_fp = None
         try:
@@ -85,24 +129,34 @@ class Poppler(Thumbnailer):
                 filename = source_filename_or_fp
             else:
                 temp_fp = tempfile.NamedTemporaryFile(delete=True)
-                temp_fp.write(source_filename_or_fp.read())
+                shutil.copyfileobj(source_filename_or_fp, temp_fp)
                 temp_fp.flush()
                 filename = temp_fp.name
+            # the full size bitmap goes straight from pdftoppm into the
+            # converter without being buffered here
             pdftoppm_args = self._args(source_filename=filename, dimensions=dimensions, page=page)
-            pnm_fp = run(pdftoppm_args)
-            if pnm_fp is None:
-                return None
-            pnm_converter_args = PNMToImage().pipe_args(dimensions=dimensions, output_format=output_format)
-            return run(pnm_converter_args, input_=pnm_fp)
+            pnm_converter_args = self.pipe_args(dimensions=dimensions, output_format=output_format)
+            return run_stream((pdftoppm_args, pnm_converter_args), output=output)
         finally:
             if temp_fp is not None:
                 temp_fp.close()
 
+    def thumbnail(self, source_filename_or_fp, dimensions=None, page=1, output_format='jpg'):
+        return self._stream(source_filename_or_fp, dimensions=dimensions, page=page, output_format=output_format)
+
+    def thumbnail_to(self, source_filename, output_filename, dimensions=None, page=1, output_format=None):
+        if output_format is None:
+            output_format = output_filename.rsplit('.', 1)[-1].lower()
+        return bool(self._stream(
+            source_filename, dimensions=dimensions, page=page,
+            output_format=output_format, output=output_filename
+        ))
+
 
 class FileOutputThumbnailer(Thumbnailer):
     output_pattern = None
 
-    def _args(self, source_filename, output_filename):
+    def _args(self, source_filename, output_filename, **kwargs):
         raise NotImplementedError()
 
     def _find_output_filename(self, temp_dir, output_format):
@@ -117,18 +171,19 @@ class FileOutputThumbnailer(Thumbnailer):
         files_with_size = [(os.stat(path).st_size, path) for path in file_paths]
         return sorted(files_with_size)[-1][1]
 
-    def thumbnail(self, source_filename, dimensions=None, output_format='jpg'):
+    def thumbnail(self, source_filename, dimensions=None, output_format='jpg', **kwargs):
         assert dimensions is None
         try:
             temp_dir = tempfile.mkdtemp()
             temp_file = os.path.join(temp_dir, self.output_pattern + output_format)
-            output_fp = run(self._args(source_filename, temp_file))
+            output_fp = run(self._args(source_filename, temp_file, **kwargs))
             if output_fp is None:
                 return None
             output_filename = self._find_output_filename(temp_dir, output_format)
             if output_filename is None:
                 return None
-            return BytesIO(file(output_filename, 'rb').read())
+            with open(output_filename, 'rb') as f:
+                return BytesIO(f.read())
         finally:
             shutil.rmtree(temp_dir, ignore_errors=True)
 
@@ -186,12 +241,17 @@ class ImageMagick(FileOutputThumbnailer):
 class ffmpeg(FileOutputThumbnailer):
     executable = '/usr/bin/ffmpeg'
     output_pattern = 'output%02d.'
+    # width of thumbnails written by thumbnail_to
+    default_width = 480
+    # seconds into the video that frames are taken from, videos too short to
+    # have a frame there get one from their start
+    seeks = (3, 0)
 
-    def _args(self, source_filename, output_filename):
+    def _args(self, source_filename, output_filename, seek=3):
         return (
             self.executable,
             '-v', 'quiet',
-            '-ss', '3',
+            '-ss', str(seek),
             '-i', source_filename,
             '-frames:v', '5',
             '-r', '1/10',
@@ -199,6 +259,45 @@ class ffmpeg(FileOutputThumbnailer):
             output_filename,
         )
 
+    def _single_frame_args(self, source_filename, output_filename, dimensions=None, seek=3):
+        if dimensions is None:
+            scale = "scale='min({},iw)':-2".format(self.default_width)
+        else:
+            scale = 'scale={}:{}'.format(*dimensions)
+        return (
+            self.executable,
+            '-v', 'quiet',
+            # seeking before the input jumps to the nearest keyframe instead
+            # of decoding everything up to that point
+            '-ss', str(seek),
+            '-i', source_filename,
+            '-frames:v', '1',
+            '-vf', scale,
+            '-y',
+            output_filename,
+        )
+
+    def thumbnail(self, source_filename, dimensions=None, output_format='jpg'):
+        for seek in self.seeks:
+            output_fp = super(ffmpeg, self).thumbnail(
+                source_filename, dimensions=dimensions, output_format=output_format, seek=seek)
+            if output_fp is not None and output_fp.getvalue():
+                return output_fp
+        return None
+
+    def thumbnail_to(self, source_filename, output_filename, dimensions=None, output_format=None):
+        # ffmpeg picks the output format from the file extension. Seeking
+        # past the end of a video succeeds without writing a frame.
+        for seek in self.seeks:
+            args = self._single_frame_args(source_filename, output_filename, dimensions=dimensions, seek=seek)
+            if subprocess.call(args) != 0:
+                break
+            if os.path.isfile(output_filename) and os.path.getsize(output_filename):
+                return True
+        if os.path.isfile(output_filename):
+            os.unlink(output_filename)
+        return False
+
 
 class PS2PDF(Thumbnailer):
     executable = '/usr/bin/ps2pdf'
@@ -256,16 +355,103 @@ mimetypes_by_extension = {
     'f4v': 'video/x-flv',
 }
 
+
+class ThumbnailerRegistry(object):
+    """
+    Resolves the executables of each thumbnailer once, through the
+    configured overrides or else the PATH, and remembers which thumbnailer
+    handles which mime type, so dispatching a file is a dict lookup.
+
+    Overrides map an executable's name (e.g. ``ffmpeg``) to its path.
+    """
+
+    def __init__(self, thumbnailers, overrides=None):
+        self.thumbnailers = thumbnailers
+        self.configure(overrides)
+
+    def configure(self, overrides=None):
+        self.overrides = dict(overrides or {})
+        self._executables = {}
+        self._instances = {}
+        self._by_mime_type = {}
+        self._regexes = [key for key in self.thumbnailers if hasattr(key, 'match')]
+
+    def which(self, default_path):
+        """
+        Path of an executable, given the default path the thumbnailer was
+        written for. Returns None if it can't be found.
+        """
+        if default_path not in self._executables:
+            name = os.path.basename(default_path)
+            if name in self.overrides:
+                path = self.overrides[name]
+                if not os.path.exists(path):
+                    path = None
+            else:
+                path = find_executable(name)
+                if path is None and os.path.exists(default_path):
+                    path = default_path
+            self._executables[default_path] = path
+        return self._executables[default_path]
+
+    def instance(self, thumbnailer_class):
+        """
+        Instance of ``thumbnailer_class`` using the resolved executables, or
+        None if any of them are missing.
+        """
+        if thumbnailer_class not in self._instances:
+            thumbnailer = thumbnailer_class()
+            for attribute in thumbnailer_class.executable_attributes:
+                path = self.which(getattr(thumbnailer_class, attribute))
+                if path is None:
+                    thumbnailer = None
+                    break
+                setattr(thumbnailer, attribute, path)
+            self._instances[thumbnailer_class] = thumbnailer
+        return self._instances[thumbnailer_class]
+
+    def thumbnailer_for(self, mime_type):
+        if mime_type not in self._by_mime_type:
+            thumbnailer_class = self.thumbnailers.get(mime_type)
+            if thumbnailer_class is None:
+                for regex in self._regexes:
+                    if regex.match(mime_type):
+                        thumbnailer_class = self.thumbnailers[regex]
+                        break
+            thumbnailer = None
+            if thumbnailer_class is not None:
+                thumbnailer = self.instance(thumbnailer_class)
+            self._by_mime_type[mime_type] = thumbnailer
+        return self._by_mime_type[mime_type]
+
+    def available(self):
+        """
+        Dict of the name of each thumbnailer to a dict of its executables
+        and their resolved paths, None for the ones that weren't found.
+        A thumbnailer is usable if all of its paths were found.
+        """
+        backends = {}
+        for thumbnailer_class in set(self.thumbnailers.values()):
+            backends[thumbnailer_class.__name__] = dict(
+                (
+                    os.path.basename(getattr(thumbnailer_class, attribute)),
+                    self.which(getattr(thumbnailer_class, attribute))
+                )
+                for attribute in thumbnailer_class.executable_attributes
+            )
+        return backends
+
+
+registry = ThumbnailerRegistry(thumbnailers)
+
+
+def configure(overrides=None):
+    registry.configure(overrides)
+
+
+def available_thumbnailers():
+    return registry.available()
+
+
 def thumbnailer_for(mime_type):
-    thumbnailer = thumbnailers.get(mime_type)
-    if thumbnailer is None:
-        regex_thumbnailers = filter(lambda key: not isinstance(key, basestring), thumbnailers)
-        for regex in regex_thumbnailers:
-            if regex.match(mime_type):
-                thumbnailer = thumbnailers[regex]
-                break
-        else:
-            return None
-    if not thumbnailer().is_available():
-        return None
-    return thumbnailer()
+    return registry.thumbnailer_for(mime_type)
@@ -0,0 +1,204 @@
+"""
+The static assets that go into a zim file: only the files that the pages
+reference, directly or through their stylesheets, with scripts and
+stylesheets minified.
+
+Minified files and the stylesheet compiled from SCSS are kept in build
+directories, named by the hash of their sources, so they are only built once
+and can be hard linked like all other files.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+import hashlib
+import io
+import os
+import posixpath
+import re
+
+# Older versions of django-compressor come with both minifiers, but they can
+# only be imported once Django is configured
+try:
+    from rjsmin import jsmin
+except ImportError:
+    try:
+        from compressor.filters.jsmin.rjsmin import jsmin
+    except Exception:
+        jsmin = None
+
+try:
+    from rcssmin import cssmin
+except ImportError:
+    try:
+        from compressor.filters.cssmin.rcssmin import cssmin
+    except Exception:
+        cssmin = None
+
+
+# References to static files in rendered pages, which use relative paths
+HTML_REFERENCE = re.compile(r'''(?:src|href)=["']static/([^"'?#]+)''')
+
+# References from stylesheets, relative to the stylesheet
+CSS_REFERENCE = re.compile(r'''url\(\s*["']?([^"')?#]+)|@import\s+["']([^"'?#]+)''')
+
+
+def _is_external(url):
+    return url.startswith(('data:', 'http:', 'https:', '//', '/'))
+
+
+def css_references(css, css_path):
+    """
+    Paths of the files that a stylesheet at ``css_path`` refers to, relative
+    to the static directory like ``css_path`` itself
+    """
+    css_dir = posixpath.dirname(css_path)
+    references = set()
+    for url, imported in CSS_REFERENCE.findall(css):
+        url = (url or imported).strip()
+        if url and not _is_external(url):
+            references.add(posixpath.normpath(posixpath.join(css_dir, url)))
+    return references
+
+
+def find_asset(static_dirs, path):
+    """
+    The first file in ``static_dirs`` with the relative ``path``, or None
+    """
+    for static_dir in static_dirs:
+        src = os.path.join(static_dir, *path.split('/'))
+        if os.path.isfile(src):
+            return src
+    return None
+
+
+class AssetCollector(object):
+    """
+    Collects the static files referenced by pages, and those referenced by
+    the stylesheets among them. Files are looked up in ``static_dirs`` in
+    order.
+    """
+
+    def __init__(self, static_dirs):
+        self.static_dirs = static_dirs
+        self.referenced = set()
+        # References to files that don't exist
+        self.missing = set()
+
+    def add(self, path):
+        """
+        Add a path relative to the static directory
+        """
+        self.referenced.add(path)
+
+    def add_html(self, html):
+        self.referenced.update(HTML_REFERENCE.findall(html))
+
+    def resolve(self):
+        """
+        Sorted list of the paths of all the referenced files that exist
+        """
+        found = set()
+        pending = list(self.referenced)
+        while pending:
+            path = pending.pop()
+            if path in found or path in self.missing:
+                continue
+            src = None if path.startswith('..') else find_asset(self.static_dirs, path)
+            if src is None:
+                self.missing.add(path)
+                continue
+            found.add(path)
+            if path.endswith('.css'):
+                with io.open(src, encoding='utf-8') as f:
+                    pending.extend(css_references(f.read(), path))
+        return sorted(found)
+
+
+def minifier_for(path):
+    """
+    The function that minifies a file, or None if it's already minified or
+    no minifier is installed
+    """
+    if path.endswith(('.min.js', '.min.css')):
+        return None
+    if path.endswith('.js'):
+        return jsmin
+    if path.endswith('.css'):
+        return cssmin
+    return None
+
+
+def build_assets(static_dirs, paths, build_dir):
+    """
+    Yields ``(path, src_path, source size)`` for ``paths`` of files in
+    ``static_dirs``, where ``src_path`` is the file to add to the zim file:
+    either the original or its minified version in ``build_dir``.
+    """
+    for path in paths:
+        src = find_asset(static_dirs, path)
+        minify = minifier_for(path)
+        if minify is None:
+            yield path, src, os.path.getsize(src)
+            continue
+        with open(src, 'rb') as f:
+            source = f.read()
+        extension = path.rsplit('.', 1)[-1]
+        built = os.path.join(build_dir, '{}.min.{}'.format(hashlib.sha1(source).hexdigest(), extension))
+        if not os.path.exists(built):
+            if not os.path.isdir(build_dir):
+                os.makedirs(build_dir)
+            minified = minify(source.decode('utf-8'))
+            tmp_path = built + '.{}.tmp'.format(os.getpid())
+            with io.open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(minified)
+            os.rename(tmp_path, built)
+        yield path, built, len(source)
+
+
+def stylesheet_signature(static_dir):
+    """
+    Hash of all SCSS files in ``static_dir``, any of them can be imported
+    """
+    sources = []
+    for root, __, filenames in os.walk(static_dir):
+        for filename in filenames:
+            if filename.endswith('.scss'):
+                sources.append(os.path.join(root, filename))
+    signature = hashlib.sha1()
+    for src in sorted(sources):
+        signature.update(os.path.relpath(src, static_dir).replace(os.sep, '/').encode('utf-8'))
+        signature.update(b'\0')
+        with open(src, 'rb') as f:
+            signature.update(f.read())
+        signature.update(b'\0')
+    return signature.hexdigest()
+
+
+def compile_stylesheet(source, static_dir, build_dir):
+    """
+    Compile the SCSS file ``source``, relative to ``static_dir``, into a
+    minified stylesheet in ``build_dir`` unless the SCSS files haven't changed
+    since it was last compiled. Returns the path of the stylesheet relative to
+    ``build_dir``.
+    """
+    path = 'css/{}.min.css'.format(stylesheet_signature(static_dir)[:16])
+    built = os.path.join(build_dir, *path.split('/'))
+    if os.path.exists(built):
+        return path
+
+    # Only needed when the stylesheet has to be compiled
+    import sass
+
+    css = sass.compile(
+        filename=os.path.join(static_dir, *source.split('/')),
+        include_paths=[static_dir],
+        output_style='compressed',
+    )
+    if not os.path.isdir(os.path.dirname(built)):
+        os.makedirs(os.path.dirname(built))
+    tmp_path = built + '.{}.tmp'.format(os.getpid())
+    with io.open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(css)
+    os.rename(tmp_path, built)
+    return path
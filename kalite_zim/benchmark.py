@@ -0,0 +1,277 @@
+"""
+Synthetic data sets for benchmarking exports, and comparison of benchmark
+results with a baseline.
+
+A data set is a directory with a topic tree, content and exercise data in
+the format of KA Lite's JSON files, tiny dummy videos and thumbnails in
+``content/``, and stand-ins for ffmpeg, ffprobe and zimwriterfs in ``bin/``
+that only write small output files, so a benchmark measures the export
+itself.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+import io
+import json
+import os
+import shutil
+import stat
+
+from collections import OrderedDict
+
+
+# name: (depth, fanout, videos per topic, exercises per topic), each about
+# that many nodes
+SCENARIOS = OrderedDict([
+    ('1k', (3, 10, 8, 1)),
+    ('10k', (4, 10, 8, 1)),
+    ('100k', (5, 10, 8, 1)),
+    # Wide and deep trees of pages with menus to render, for the per page
+    # render time
+    ('menus-wide', (3, 15, 15, 0)),
+    ('menus-deep', (6, 4, 4, 0)),
+])
+
+# A 1x1 transparent PNG
+PNG = (
+    b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06'
+    b'\x00\x00\x00\x1f\x15\xc4\x89\x00\x00\x00\rIDATx\x9cc\xf8\x0f\x00\x00\x01\x01'
+    b'\x00\x05\x18\xd8N\x00\x00\x00\x00IEND\xaeB`\x82'
+)
+
+# The stand-ins are shell scripts, so they start as fast as the real programs
+
+FFMPEG_STUB = '''#!/bin/sh
+# Writes a small file where ffmpeg would write its output
+for output; do :; done
+case "$output" in
+    -) ;;
+    *.png) cat "$(dirname "$0")/stub.png" > "$output" ;;
+    *) cat "$(dirname "$0")/stub.webm" > "$output" ;;
+esac
+'''
+
+# Every video needs transcoding, like before videos were probed
+FFPROBE_STUB = '''#!/bin/sh
+cat <<EOF
+{"streams": [{"codec_type": "video", "codec_name": "mpeg4", "width": 1280, "height": 720},
+ {"codec_type": "audio", "codec_name": "aac"}],
+ "format": {"format_name": "mov,mp4,m4a,3gp,3g2,mj2", "duration": "60.0", "bit_rate": "1000000"}}
+EOF
+'''
+
+ZIMWRITERFS_STUB = '''#!/bin/sh
+# Reads everything that would be packed and writes a list of it
+for arg; do src_dir=$dest_file; dest_file=$arg; done
+find "$src_dir" -type f -exec cat {} + > /dev/null
+find "$src_dir" -type f > "$dest_file"
+'''
+
+
+def generate_topic_tree(depth, fanout, videos, exercises=0):
+    """
+    Topic tree with ``depth`` levels of topics, counting the root, with
+    ``fanout`` subtopics each, the topics of the last level holding ``videos`` videos and
+    ``exercises`` exercises. Returns a tuple of the root and the list of
+    video ids.
+    """
+    video_ids = []
+    root = {
+        'id': 'root', 'kind': 'Topic', 'slug': 'khan', 'path': 'khan/',
+        'title': 'Khan Academy', 'description': '', 'children': [],
+    }
+    stack = [(root, 1)]
+    while stack:
+        topic, level = stack.pop()
+        if level < depth:
+            for n in range(fanout):
+                slug = '{}-{}'.format(topic['slug'], n) if level > 1 else 'topic-{}'.format(n)
+                child = {
+                    'id': 'x' + slug, 'kind': 'Topic', 'slug': slug,
+                    'path': '{}{}/'.format(topic['path'], slug),
+                    'title': 'Topic {}'.format(slug), 'description': 'About {}'.format(slug),
+                    'children': [],
+                }
+                topic['children'].append(child)
+                stack.append((child, level + 1))
+            continue
+        for n in range(videos):
+            video_id = 'v{:010d}'.format(len(video_ids))
+            video_ids.append(video_id)
+            topic['children'].append({
+                'id': video_id, 'kind': 'Video', 'slug': video_id,
+                'path': '{}{}/'.format(topic['path'], video_id),
+                'title': 'Video {}'.format(video_id), 'description': 'Learn about {}'.format(video_id),
+            })
+        for n in range(exercises):
+            slug = 'exercise-{}-{}'.format(topic['slug'], n)
+            topic['children'].append({
+                'id': slug, 'kind': 'Exercise', 'slug': slug,
+                'path': '{}{}/'.format(topic['path'], slug),
+                'title': 'Exercise {}'.format(slug), 'description': 'Practice {}'.format(slug),
+            })
+    return root, video_ids
+
+
+def count_nodes(root):
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.get('children', []))
+    return count
+
+
+def _write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def _write_script(path, source):
+    with io.open(path, 'w', encoding='utf-8') as f:
+        f.write(source)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def write_stubs(bin_dir):
+    _write_script(os.path.join(bin_dir, 'ffmpeg'), FFMPEG_STUB)
+    _write_script(os.path.join(bin_dir, 'ffprobe'), FFPROBE_STUB)
+    _write_script(os.path.join(bin_dir, 'zimwriterfs'), ZIMWRITERFS_STUB)
+
+
+def has_thumbnail(index):
+    """
+    Every other video comes with a thumbnail, the others have to be created
+    """
+    return index % 2 == 0
+
+
+def generate_dataset(dest_dir, depth, fanout, videos, exercises=0, media_size=1024):
+    """
+    Write a data set to ``dest_dir``, returns its parameters, which are also
+    stored in ``dataset.json``. Nothing is written if the directory already
+    has a data set with the same parameters.
+    """
+    params = OrderedDict([
+        ('depth', depth), ('fanout', fanout), ('videos', videos),
+        ('exercises', exercises), ('media_size', media_size),
+    ])
+    params_path = os.path.join(dest_dir, 'dataset.json')
+    try:
+        with open(params_path) as f:
+            existing = json.load(f)
+    except (IOError, ValueError):
+        existing = None
+    if existing is not None and all(existing.get(key) == value for key, value in params.items()):
+        reset_dataset(dest_dir)
+        # Data sets of older versions may lack some
+        write_stubs(os.path.join(dest_dir, 'bin'))
+        return existing
+
+    root, video_ids = generate_topic_tree(depth, fanout, videos, exercises)
+    content_dir = os.path.join(dest_dir, 'content')
+    bin_dir = os.path.join(dest_dir, 'bin')
+    if os.path.isdir(content_dir):
+        shutil.rmtree(content_dir)
+    for directory in (content_dir, bin_dir):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    _write_json(os.path.join(dest_dir, 'test_topics.json'), root)
+    _write_json(os.path.join(dest_dir, 'test_content.json'), dict(
+        (video_id, {
+            'id': video_id, 'youtube_id': video_id, 'kind': 'Video', 'format': 'mp4',
+            'title': 'Video {}'.format(video_id), 'available': True,
+        })
+        for video_id in video_ids
+    ))
+    exercises_data = {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        stack.extend(node.get('children', []))
+        if node['kind'] == 'Exercise':
+            exercises_data[node['id']] = {
+                'id': node['id'], 'kind': 'Exercise', 'title': node['title'],
+                'path': node['path'], 'basepoints': 10.0, 'all_assessment_items': [],
+            }
+    _write_json(os.path.join(dest_dir, 'test_exercise.json'), exercises_data)
+
+    media = b'\0' * media_size
+    for index, video_id in enumerate(video_ids):
+        with open(os.path.join(content_dir, video_id + '.mp4'), 'wb') as f:
+            f.write(media)
+        if has_thumbnail(index):
+            with open(os.path.join(content_dir, video_id + '.png'), 'wb') as f:
+                f.write(PNG)
+
+    with open(os.path.join(bin_dir, 'stub.png'), 'wb') as f:
+        f.write(PNG)
+    with open(os.path.join(bin_dir, 'stub.webm'), 'wb') as f:
+        f.write(b'\x1aE\xdf\xa3' + media[4:])
+    write_stubs(bin_dir)
+
+    params['nodes'] = count_nodes(root)
+    # Written last, so an interrupted run is generated again
+    _write_json(params_path, params)
+    return params
+
+
+def reset_dataset(dest_dir):
+    """
+    Remove the thumbnails created by a previous export, so every run has the
+    same work to do
+    """
+    content_dir = os.path.join(dest_dir, 'content')
+    for filename in os.listdir(content_dir):
+        if filename.endswith('.png') and not has_thumbnail(int(filename[1:-len('.png')])):
+            os.unlink(os.path.join(content_dir, filename))
+
+
+def summarize(report):
+    """
+    The items, times and memory usage of each phase in an export report
+    """
+    return OrderedDict(
+        (phase['name'], OrderedDict([
+            ('items', phase['items']),
+            ('wall_seconds', phase['wall_seconds']),
+            ('cpu_seconds', phase['cpu_seconds']),
+            ('peak_rss', phase.get('peak_rss')),
+        ]))
+        for phase in report['phases']
+    )
+
+
+def compare(results, baseline, tolerance=0.25, min_seconds=0.5):
+    """
+    Regressions of ``results`` compared to ``baseline``, both dicts of
+    scenario names to ``{'phases': summarize(report), ...}``.
+
+    A phase regressed when it took more than ``tolerance`` longer than in
+    the baseline and at least ``min_seconds`` more, or used more than
+    ``tolerance`` more memory. Since the memory usage of a phase is the peak
+    of the export up to its end, only the first phase that used more memory
+    is reported. Returns a list of
+    ``(scenario, phase, metric, baseline value, value)``.
+    """
+    regressions = []
+    for scenario, result in results.items():
+        if scenario not in baseline:
+            continue
+        baseline_phases = baseline[scenario]['phases']
+        memory_regressed = False
+        for phase, values in result['phases'].items():
+            before = baseline_phases.get(phase)
+            if not before:
+                continue
+            wall, wall_before = values['wall_seconds'], before['wall_seconds']
+            if wall > wall_before * (1 + tolerance) and wall - wall_before >= min_seconds:
+                regressions.append((scenario, phase, 'wall_seconds', wall_before, wall))
+            rss, rss_before = values.get('peak_rss'), before.get('peak_rss')
+            if rss and rss_before and rss > rss_before * (1 + tolerance) and not memory_regressed:
+                regressions.append((scenario, phase, 'peak_rss', rss_before, rss))
+                memory_regressed = True
+    return regressions
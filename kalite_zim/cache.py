@@ -0,0 +1,237 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+# Sits next to the default tmp dirs of export2zim, so that hard linking in and
+# out of the cache works without further configuration
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'ka-lite-zim_cache')
+
+
+def file_hash(path, block_size=1024 * 1024):
+    """
+    SHA1 of a file's contents, read in blocks so videos never have to fit in
+    memory.
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def link_or_copy(src, dest):
+    """
+    Hard link ``src`` to ``dest``, falling back to a copy when they are on
+    different devices.
+    """
+    try:
+        os.link(src, dest)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.copy2(src, dest)
+
+
+def save_index(path, entries, removed=()):
+    """
+    Write the dict ``entries`` to the JSON file at ``path``, merged with
+    what other processes saved there since it was read, so that exports of
+    several languages don't lose each other's entries. ``entries`` win over
+    the ones in the file, keys in ``removed`` are left out. Returns the
+    merged dict.
+    """
+    with open(path + '.lock', 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            try:
+                merged = json.load(open(path))
+            except (IOError, ValueError):
+                merged = {}
+            for key in removed:
+                merged.pop(key, None)
+            merged.update(entries)
+            tmp_path = path + '.{}.tmp'.format(os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump(merged, f)
+            os.rename(tmp_path, path)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    return merged
+
+
+class TranscodeCache(object):
+    """
+    A persistent store of transcoded files, keyed by the hash of the source
+    file and the encoder arguments used to produce them.
+
+    Entries are hard linked in and out, so a hit costs no disk space in the
+    destination. Least recently used entries are evicted when the cache grows
+    beyond ``max_size`` bytes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=None):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = max_size
+        self.objects_dir = os.path.join(self.cache_dir, 'objects')
+        self.index_path = os.path.join(self.cache_dir, 'sources.json')
+        if not os.path.isdir(self.objects_dir):
+            os.makedirs(self.objects_dir)
+        try:
+            self._sources = json.load(open(self.index_path))
+        except (IOError, ValueError):
+            self._sources = {}
+        # Forgotten by prune, and not to be merged back in by save
+        self._removed = set()
+        self.hits = 0
+        self.misses = 0
+
+    def source_hash(self, path):
+        """
+        Hash of a source file, remembered across runs as long as its size
+        and modification time don't change.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime]
+        cached = self._sources.get(path)
+        if cached and cached[:2] == signature:
+            return cached[2]
+        digest = file_hash(path)
+        self._sources[path] = signature + [digest]
+        return digest
+
+    def known_hash(self, path):
+        """
+        Hash of a source file if it's remembered and still valid, None
+        instead of reading the file
+        """
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        cached = self._sources.get(path)
+        if cached and cached[:2] == [stat.st_size, stat.st_mtime]:
+            return cached[2]
+        return None
+
+    def key(self, source_path, encoder_args, digest=None):
+        sha1 = hashlib.sha1()
+        sha1.update((digest or self.source_hash(source_path)).encode('ascii'))
+        sha1.update(b"\0")
+        sha1.update(" ".join(encoder_args).encode('utf-8'))
+        return sha1.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.objects_dir, key[:2], key)
+
+    def get(self, key, dest):
+        """
+        Link the entry for ``key`` to ``dest``, returns False on a miss.
+        """
+        path = self.path(key)
+        if not os.path.isfile(path):
+            self.misses += 1
+            return False
+        if os.path.exists(dest):
+            os.unlink(dest)
+        link_or_copy(path, dest)
+        # Mark as recently used
+        os.utime(path, None)
+        self.hits += 1
+        return True
+
+    def put(self, key, src):
+        """
+        Store ``src`` under ``key``
+        """
+        path = self.path(key)
+        entry_dir = os.path.dirname(path)
+        if not os.path.isdir(entry_dir):
+            os.makedirs(entry_dir)
+        # Link to a temporary name and rename, so concurrent exports never
+        # see a half-written entry
+        tmp_path = path + '.{}.tmp'.format(os.getpid())
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        link_or_copy(src, tmp_path)
+        os.rename(tmp_path, path)
+
+    def entries(self):
+        """
+        List of ``(last_used, size, path)`` for all entries
+        """
+        entries = []
+        for entry_dir, __, filenames in os.walk(self.objects_dir):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(entry_dir, filename)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            'cache_dir': self.cache_dir,
+            'entries': len(entries),
+            'size': sum(size for __, size, __ in entries),
+            'max_size': self.max_size,
+            'sources': len(self._sources),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def prune(self, max_size=None):
+        """
+        Evict least recently used entries until the cache is no bigger than
+        ``max_size`` (defaults to the size the cache was created with).
+        Returns a tuple of ``(entries removed, bytes freed)``.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        if max_size is None:
+            return 0, 0
+        entries = sorted(self.entries())
+        total_size = sum(size for __, size, __ in entries)
+        removed = freed = 0
+        for __, size, path in entries:
+            if total_size <= max_size:
+                break
+            os.unlink(path)
+            total_size -= size
+            removed += 1
+            freed += size
+        # Forget about sources that no longer exist
+        for path in list(self._sources.keys()):
+            if not os.path.exists(path):
+                del self._sources[path]
+                self._removed.add(path)
+        return removed, freed
+
+    def save(self):
+        """
+        Write the index of source hashes, along with those that other
+        exports saved in the meantime
+        """
+        self._sources = save_index(self.index_path, self._sources, self._removed)
+        self._removed = set()
@@ -0,0 +1,204 @@
+"""
+HTTP downloads with a bounded number of concurrent fetches, keep-alive
+connections, resuming of partial files and exponential back off.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import socket
+import threading
+import time
+
+from multiprocessing.pool import ThreadPool
+
+try:
+    import httplib
+    from urlparse import urljoin, urlsplit
+except ImportError:  # Python 3
+    import http.client as httplib
+    from urllib.parse import urljoin, urlsplit
+
+
+CHUNK_SIZE = 64 * 1024
+MAX_REDIRECTS = 5
+
+# Client errors that may go away when the request is made again
+RETRY_STATUSES = (408, 416, 429)
+
+
+class DownloadError(Exception):
+    pass
+
+
+class PermanentDownloadError(DownloadError):
+    """
+    A download that fails the same way however often it's retried, like a
+    redirect loop or a 403
+    """
+
+
+class Downloader(object):
+    """
+    Fetches URLs into files. Each thread keeps its own keep-alive connection
+    per host, so a batch of downloads from the same server doesn't pay for a
+    new connection on every file.
+
+    Unfinished downloads are kept as ``<dest>.part`` and resumed with an HTTP
+    Range request, both on retries and in later runs.
+    """
+
+    def __init__(self, jobs=4, retries=8, backoff=2, max_backoff=300, timeout=60):
+        self.jobs = jobs
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self._local = threading.local()
+        self.connections_opened = 0
+        self._lock = threading.Lock()
+
+    def _connection(self, scheme, netloc):
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        key = (scheme, netloc)
+        if key not in connections:
+            connection_class = httplib.HTTPSConnection if scheme == 'https' else httplib.HTTPConnection
+            connections[key] = connection_class(netloc, timeout=self.timeout)
+            with self._lock:
+                self.connections_opened += 1
+        return connections[key]
+
+    def _close_connection(self, scheme, netloc):
+        connections = getattr(self._local, 'connections', {})
+        connection = connections.pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+
+    def _request(self, url, headers):
+        """
+        GET a URL on a pooled connection, following redirects. Returns the
+        response with the body not yet read.
+        """
+        for __ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+            connection = self._connection(parts.scheme, parts.netloc)
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+            except (socket.error, httplib.HTTPException):
+                # The server may have closed an idle keep-alive connection,
+                # the retry will open a new one
+                self._close_connection(parts.scheme, parts.netloc)
+                raise
+            if response.status in (301, 302, 303, 307, 308):
+                response.read()
+                url = urljoin(url, response.getheader('Location'))
+                continue
+            return parts, response
+        raise PermanentDownloadError("Too many redirects: {}".format(url))
+
+    def _fetch_once(self, url, dest, content_type=None):
+        partial = dest + '.part'
+        offset = os.path.getsize(partial) if os.path.isfile(partial) else 0
+        headers = {'Connection': 'keep-alive'}
+        if offset:
+            headers['Range'] = 'bytes={}-'.format(offset)
+
+        parts, response = self._request(url, headers)
+        try:
+            if response.status == 404:
+                response.read()
+                return False
+            if response.status == 416:
+                # Our partial file is no good, start over
+                response.read()
+                os.unlink(partial)
+                raise DownloadError("Range not satisfiable: {}".format(url))
+            if response.status not in (200, 206):
+                response.read()
+                if 400 <= response.status < 500 and response.status not in RETRY_STATUSES:
+                    raise PermanentDownloadError("Status {} for: {}".format(response.status, url))
+                raise DownloadError("Status {} for: {}".format(response.status, url))
+            if content_type and not (response.getheader('Content-Type') or '').startswith(content_type):
+                response.read()
+                return False
+
+            if response.status == 206:
+                # Content-Range: bytes <start>-<end>/<total>
+                content_range = response.getheader('Content-Range') or ''
+                start, __, total = content_range.replace('bytes ', '').partition('/')
+                if int(start.split('-')[0]) != offset:
+                    raise DownloadError("Unexpected Content-Range for {}: {}".format(url, content_range))
+                expected_size = int(total) if total.isdigit() else None
+                mode = 'ab'
+            else:
+                content_length = response.getheader('Content-Length')
+                expected_size = int(content_length) if content_length else None
+                mode = 'wb'
+
+            with open(partial, mode) as f:
+                while True:
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+        except (Exception, KeyboardInterrupt):
+            # Whatever is left of the response makes the connection unusable
+            self._close_connection(parts.scheme, parts.netloc)
+            raise
+
+        if response.getheader('Connection', '').lower() == 'close':
+            self._close_connection(parts.scheme, parts.netloc)
+
+        if expected_size is not None and os.path.getsize(partial) != expected_size:
+            self._close_connection(parts.scheme, parts.netloc)
+            raise DownloadError(
+                "Incomplete download of {}: {} of {} bytes".format(
+                    url, os.path.getsize(partial), expected_size
+                )
+            )
+        os.rename(partial, dest)
+        return True
+
+    def fetch(self, url, dest, content_type=None):
+        """
+        Download ``url`` to ``dest``, retrying with exponential back off.
+
+        Returns False if the file doesn't exist on the server (or doesn't
+        have the expected ``content_type``), raises DownloadError if it
+        couldn't be fetched within the allowed number of retries, or right
+        away for redirect loops and client errors that retrying won't fix.
+        """
+        attempt = 0
+        while True:
+            try:
+                return self._fetch_once(url, dest, content_type=content_type)
+            except PermanentDownloadError:
+                raise
+            except (DownloadError, socket.error, httplib.HTTPException, IOError) as e:
+                attempt += 1
+                if attempt > self.retries:
+                    raise DownloadError("Giving up on {} after {} attempts: {}".format(url, attempt, e))
+                time.sleep(min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def map(self, func, items):
+        """
+        Call ``func`` on all ``items`` from ``jobs`` threads, yielding the
+        results as they complete. ``func`` can call ``fetch``.
+        """
+        pool = ThreadPool(self.jobs)
+        try:
+            for result in pool.imap_unordered(func, items):
+                yield result
+            pool.close()
+        except (Exception, KeyboardInterrupt):
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
@@ -0,0 +1,158 @@
+"""
+Directory listings read up front, so that checking whether the videos,
+thumbnails and subtitles of thousands of nodes exist is a lookup in memory
+instead of a system call each, which matters on network file systems.
+
+Every listing counts the system calls it made in ``syscalls``.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+import errno
+import os
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        # Backport for Python 2
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+def _entries(path):
+    """
+    ``(name, is_dir)`` of the entries of a directory and the number of
+    system calls it took. With scandir the type comes with the listing,
+    otherwise each entry has to be looked at.
+    """
+    if scandir is not None:
+        return [(entry.name, entry.is_dir()) for entry in scandir(path)], 1
+    names = os.listdir(path)
+    return [(name, os.path.isdir(os.path.join(path, name))) for name in names], 1 + len(names)
+
+
+class DirectoryListing(object):
+    """
+    The files in a directory, listed once. Sizes and modification times are
+    read when they are first asked for and then kept. Files created later
+    must be added with ``add``.
+
+    A listing made earlier, like the one in a plan, can be passed as
+    ``names`` instead of listing the directory again.
+    """
+
+    def __init__(self, path, names=None):
+        self.path = path
+        self.syscalls = 0 if names is not None else 1
+        # (size, mtime) by name
+        self._stats = {}
+        if names is not None:
+            self.names = set(names)
+            return
+        try:
+            if scandir is not None:
+                self.names = set(entry.name for entry in scandir(path) if not entry.is_dir())
+            else:
+                # Directories don't have the names of files the export
+                # looks for, so they don't have to be told apart
+                self.names = set(os.listdir(path))
+        except OSError:
+            self.names = set()
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __len__(self):
+        return len(self.names)
+
+    def join(self, name):
+        return os.path.join(self.path, name)
+
+    def add(self, name):
+        self.names.add(name)
+        self._stats.pop(name, None)
+
+    def stat(self, name):
+        """
+        ``(size, mtime)`` of a file, or None if it doesn't exist
+        """
+        if name not in self.names:
+            return None
+        stat = self._stats.get(name)
+        if stat is None:
+            self.syscalls += 1
+            try:
+                result = os.stat(self.join(name))
+            except OSError:
+                self.names.discard(name)
+                return None
+            stat = self._stats[name] = (result.st_size, result.st_mtime)
+        return stat
+
+    def size(self, name):
+        stat = self.stat(name)
+        return stat[0] if stat else None
+
+    def signature(self, name):
+        """
+        Same as ``manifest.file_signature`` of the file
+        """
+        stat = self.stat(name)
+        return list(stat) if stat else None
+
+
+class TreeListing(object):
+    """
+    The directories and files below ``root``, listed with one scan of each
+    directory. ``makedirs`` only creates directories that weren't there.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.syscalls = 0
+        self.dirs = set()
+        self.files = set()
+        pending = [self.root]
+        while pending:
+            path = pending.pop()
+            try:
+                entries, syscalls = _entries(path)
+            except OSError:
+                self.syscalls += 1
+                continue
+            self.syscalls += syscalls
+            self.dirs.add(path)
+            for name, is_dir in entries:
+                if is_dir:
+                    pending.append(os.path.join(path, name))
+                else:
+                    self.files.add(os.path.join(path, name))
+
+    def isdir(self, path):
+        return os.path.abspath(path) in self.dirs
+
+    def isfile(self, path):
+        return os.path.abspath(path) in self.files
+
+    def add(self, path):
+        self.files.add(os.path.abspath(path))
+
+    def discard(self, path):
+        self.files.discard(os.path.abspath(path))
+
+    def makedirs(self, path):
+        path = os.path.abspath(path)
+        if path in self.dirs:
+            return
+        self.syscalls += 1
+        try:
+            os.makedirs(path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        while path not in self.dirs and path != os.path.dirname(path):
+            self.dirs.add(path)
+            path = os.path.dirname(path)
@@ -0,0 +1,165 @@
+"""
+Loading of the topic tree and content data, keeping only the nodes and
+fields the export uses.
+
+With ijson installed the JSON files are parsed incrementally, so the full
+topic tree and content data never have to be in memory at once. Without it
+they are loaded with the json module and filtered afterwards.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+import json
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+# Fields of topic tree nodes that are kept
+NODE_FIELDS = ('id', 'kind', 'title', 'description', 'path')
+
+# Kinds of nodes that are kept below the root
+NODE_KINDS = ('Topic', 'Video')
+
+# Fields of content entries that are kept
+CONTENT_FIELDS = ('youtube_id', 'format')
+
+
+class LoadError(Exception):
+    pass
+
+
+_errors = (IOError, ValueError)
+if ijson is not None:
+    _errors += (ijson.JSONError,)
+
+
+def _filter_node(node, video_ids):
+    """
+    Copy of a node from a fully loaded tree with only the kept fields and
+    children
+    """
+    filtered = dict((key, node[key]) for key in NODE_FIELDS if key in node)
+    filtered['children'] = []
+    stack = [(node, filtered)]
+    while stack:
+        src, dest = stack.pop()
+        if src.get('kind') == 'Video':
+            video_ids.add(src['id'])
+        for child in src.get('children', []):
+            if child.get('kind') not in NODE_KINDS:
+                continue
+            dest_child = dict((key, child[key]) for key in NODE_FIELDS if key in child)
+            dest_child['children'] = []
+            dest['children'].append(dest_child)
+            stack.append((child, dest_child))
+    return filtered
+
+
+class _NodePrefixes(dict):
+    """
+    Whether an ijson prefix is that of a node in the tree: the root or an
+    item of a node's children, at any depth
+    """
+
+    def __missing__(self, prefix):
+        if prefix == '':
+            is_node = True
+        elif prefix == 'children.item':
+            is_node = True
+        elif prefix.endswith('.children.item'):
+            is_node = self[prefix[:-len('.children.item')]]
+        else:
+            is_node = False
+        self[prefix] = is_node
+        return is_node
+
+
+def _video_ids(root):
+    video_ids = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node.get('kind') == 'Video':
+            video_ids.add(node['id'])
+        stack.extend(node['children'])
+    return video_ids
+
+
+def _parse_tree(f):
+    node_prefixes = _NodePrefixes()
+    # (prefix, node) of the nodes being parsed
+    stack = []
+    root = None
+    for prefix, event, value in ijson.parse(f):
+        if event == 'start_map':
+            if node_prefixes[prefix]:
+                stack.append((prefix, {'children': []}))
+        elif event == 'end_map':
+            if stack and stack[-1][0] == prefix:
+                node = stack.pop()[1]
+                if not stack:
+                    root = node
+                elif node.get('kind') in NODE_KINDS:
+                    # Other kinds are dropped with all of their children
+                    stack[-1][1]['children'].append(node)
+        elif stack and event in ('string', 'number', 'boolean', 'null'):
+            parent_prefix, __, key = prefix.rpartition('.')
+            if key in NODE_FIELDS and parent_prefix == stack[-1][0]:
+                stack[-1][1][key] = value
+    return root
+
+
+def load_topic_tree(path):
+    """
+    Load a topic tree JSON file with only the Topic and Video nodes and the
+    fields in NODE_FIELDS. Returns a tuple of the root and the set of ids of
+    all videos.
+    """
+    video_ids = set()
+    try:
+        with open(path, 'rb') as f:
+            if ijson is not None:
+                root = _parse_tree(f)
+                if root is not None:
+                    video_ids = _video_ids(root)
+            else:
+                root = _filter_node(json.loads(f.read().decode('utf-8')), video_ids)
+    except _errors as e:
+        raise LoadError("Could not load topic tree {}: {}".format(path, e))
+    if root is None:
+        raise LoadError("No topic tree in {}".format(path))
+    return root, video_ids
+
+
+def filter_content(content, ids):
+    """
+    Entries of a content dict for ``ids``, with only the CONTENT_FIELDS
+    """
+    filtered = {}
+    for content_id in ids:
+        entry = content.get(content_id)
+        if entry is not None:
+            filtered[content_id] = dict((key, entry.get(key)) for key in CONTENT_FIELDS)
+    return filtered
+
+
+def load_content(path, ids):
+    """
+    Load the entries for ``ids`` from a content JSON file, a dict of content
+    ids to their data, with only the CONTENT_FIELDS.
+    """
+    try:
+        with open(path, 'rb') as f:
+            if ijson is None:
+                return filter_content(json.loads(f.read().decode('utf-8')), ids)
+            content = {}
+            for content_id, entry in ijson.kvitems(f, ''):
+                if content_id in ids:
+                    content[content_id] = dict((key, entry.get(key)) for key in CONTENT_FIELDS)
+            return content
+    except _errors as e:
+        raise LoadError("Could not load content {}: {}".format(path, e))
@@ -2,49 +2,88 @@ from __future__ import unicode_literals
 from __future__ import print_function
 from __future__ import absolute_import
 
-import json
 import os
 import shutil
-import subprocess
 import sys
 import tempfile
+import threading
+import time
 
+from collections import OrderedDict
 from datetime import datetime
 from optparse import make_option
 
-from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 from django.template.loader import render_to_string
 from django.utils.translation import ugettext as _
 
 from kalite.topic_tools import settings as topic_tools_settings, \
-    get_content_cache, get_exercise_cache
+    get_content_cache
 from kalite.settings.base import CONTENT_ROOT
 from kalite import i18n
 
+from kalite_zim.assets import AssetCollector, build_assets, compile_stylesheet, cssmin, jsmin
+from kalite_zim.download import Downloader, DownloadError
+from kalite_zim.pipeline import prefetch, run_processes
+from kalite_zim.report import ExportReport, peak_rss
 from kalite_zim.utils import download_video, logger
-
-from fle_utils.general import softload_json
-
-from submarine.parser import parser as submarine_parser
-from kalite_zim.anythumbnailer.thumbnail_ import create_thumbnail
+from kalite_zim.transcode import DEFAULT_PROFILE, LOW_SUFFIX, PROFILES, TranscodeError, TranscodePool, renditions, \
+    remux as remux_video, transcode_many
+from kalite_zim.cache import DEFAULT_CACHE_DIR, TranscodeCache
+from kalite_zim.manifest import BuildManifest, data_signature, tree_signature
+from kalite_zim.writers import WRITERS, WriterError
+from kalite_zim.tree import TopicTree, TreeWalk
+from kalite_zim.loader import LoadError, filter_content, load_content, load_topic_tree
+from kalite_zim.search import SearchIndex
+from kalite_zim.subtitles import SubtitleCache, convert_many, srt_key
+from kalite_zim.listing import DirectoryListing, TreeListing
+from kalite_zim.probe import DECISIONS, LINK, REMUX, TRANSCODE, ProbeCache, ProbeError, display_size, max_bitrate, \
+    probe_video, rendition_actions
+from kalite_zim.plan import PLAN_VERSION, PlanError, Throughput, format_duration, load_plan, phase_work, save_plan
+from kalite_zim.render import STYLESHEET_SOURCE, render_topic_pages as render_pages, stylesheet_init, topic_parents
+
+from kalite_zim.anythumbnailer.thumbnail_ import available_thumbnailers, configure as configure_thumbnailers, create_thumbnail_files
 from distutils.spawn import find_executable
 
-def compressor_init(input_dir):
-
-    settings.COMPRESS_PRECOMPILERS = (
-        ('text/x-scss', 'django_libsass.SassCompiler'),
-    )
-
-    settings.STATICFILES_FINDERS = (
-        'django.contrib.staticfiles.finders.FileSystemFinder',
-        'django.contrib.staticfiles.finders.AppDirectoriesFinder',
-        'compressor.finders.CompressorFinder',
-    )
-
-    settings.COMPRESS_ROOT = input_dir
-    settings.COMPRESS_OUTPUT_DIR = ''
-    settings.COMPRESS_CSS_FILTERS = []
+def page_signature(node, parents):
+    """
+    Signature of everything from the topic tree that ends up on a topic
+    page, keep this in sync with topic.html.
+    """
+    return data_signature({
+        'topic': [
+            getattr(node, key) for key in
+            ('id', 'kind', 'title', 'description', 'video_url', 'low_video_url', 'thumbnail_url', 'subtitle_url',
+             'format', 'width', 'height')
+        ],
+        'children': [
+            [child.id, child.kind, child.title, child.url, child.thumbnail_url]
+            for child in node.children
+        ],
+        'menus': [
+            [parent.id, parent.depth] + [
+                [child.id, child.kind, child.title, child.url]
+                for child in parent.children
+            ]
+            for parent in parents
+        ],
+    })
+
+
+def prune_tree(node, parent):
+    """
+    Remove unavailable videos and topics that end up empty, called once all
+    of the node's children have been pruned
+    """
+    if not node.children:
+        return
+    new_children = []
+    for child in node.children:
+        empty_topic = child.kind == "Topic" and not child.children
+        unavailable_video = child.kind == "Video" and not child.available
+        if not (empty_topic or unavailable_video):
+            new_children.append(child)
+    node.children = new_children
 
 
 class Command(BaseCommand):
@@ -56,14 +95,22 @@ class Command(BaseCommand):
             action='store',
             dest='language',
             default='en',
-            help='Select which language (videos and meta data) to export'
+            help='Select which language (videos and meta data) to export, or several separated by commas'
+        ),
+        make_option(
+            '--language-jobs',
+            action='store',
+            dest='language_jobs',
+            type='int',
+            default=1,
+            help='Number of languages to export at the same time when exporting several'
         ),
         make_option(
             '--tmp-dir', '-t',
             action='store',
             dest='tmp_dir',
             default='',
-            help='Directory for the temporary zim filesystem'
+            help='Directory for the temporary zim filesystem, containing {language} when exporting several languages'
         ),
         make_option(
             '--test',
@@ -71,6 +118,13 @@ class Command(BaseCommand):
             dest='test',
             help='Use test data'
         ),
+        make_option(
+            '--data-dir',
+            action='store',
+            dest='data_dir',
+            default=None,
+            help='Directory with the test_topics.json and test_content.json used by --test'
+        ),
         make_option(
             '--clear', '-c',
             action='store_true',
@@ -92,6 +146,30 @@ class Command(BaseCommand):
             default=False,
             help='Instead of skipping videos that are not available, download them to KA Lite.'
         ),
+        make_option(
+            '--download-jobs',
+            action='store',
+            dest='download_jobs',
+            type='int',
+            default=4,
+            help='Number of videos to download at the same time'
+        ),
+        make_option(
+            '--prefetch',
+            action='store',
+            dest='prefetch',
+            type='int',
+            default=8,
+            help='Number of videos to download or queue for transcoding ahead of the ones being processed'
+        ),
+        make_option(
+            '--render-jobs',
+            action='store',
+            dest='render_jobs',
+            type='int',
+            default=1,
+            help='Number of processes rendering topic pages'
+        ),
         make_option(
             '--zimwriterfs', '-z',
             action='store',
@@ -111,7 +189,100 @@ class Command(BaseCommand):
             action='store_true',
             dest='transcode2webm',
             default=False,
-            help="Name of publisher"
+            help="Transcode videos to webm"
+        ),
+        make_option(
+            '--transcode-profile',
+            action='store',
+            dest='transcode_profile',
+            type='choice',
+            choices=list(PROFILES.keys()),
+            default=DEFAULT_PROFILE,
+            help="Speed and quality of transcodes: fast, balanced or archive (slowest, the default)"
+        ),
+        make_option(
+            '--transcode-height',
+            action='store',
+            dest='transcode_height',
+            type='int',
+            default=None,
+            help="Scale transcoded videos down to this height"
+        ),
+        make_option(
+            '--transcode-low-height',
+            action='store',
+            dest='transcode_low_height',
+            type='int',
+            default=None,
+            help="Also transcode a rendition of this height, which is played on small screens"
+        ),
+        make_option(
+            '--no-probe',
+            action='store_false',
+            dest='probe',
+            default=True,
+            help="Don't probe videos with ffprobe, which decides which ones don't need transcoding and sizes the player"
+        ),
+        make_option(
+            '--jobs', '-j',
+            action='store',
+            dest='jobs',
+            type='int',
+            default=1,
+            help="Number of processes to run in parallel when transcoding, creating thumbnails and converting subtitles"
+        ),
+        make_option(
+            '--cache-dir',
+            action='store',
+            dest='cache_dir',
+            default=DEFAULT_CACHE_DIR,
+            help="Directory for transcoded videos shared between runs and languages"
+        ),
+        make_option(
+            '--cache-max-size',
+            action='store',
+            dest='cache_max_size',
+            type='int',
+            default=None,
+            help="Evict least recently used transcodes when they take more than this many MB, "
+                 "other files in the cache dir (subtitles, assets, stylesheets) aren't counted"
+        ),
+        make_option(
+            '--report',
+            action='store',
+            dest='report',
+            default=None,
+            help="Where to write the JSON report with the timings of all phases, by default next to the tmp-dir"
+        ),
+        make_option(
+            '--profile',
+            action='store_true',
+            dest='profile',
+            default=False,
+            help="Profile the Python phases with cProfile, the stats are written next to the report"
+        ),
+        make_option(
+            '--plan',
+            action='store',
+            dest='plan',
+            default=None,
+            help="Don't export, only write a JSON plan of the work to do and its estimated duration to this file"
+        ),
+        make_option(
+            '--from-plan',
+            action='store',
+            dest='from_plan',
+            default=None,
+            help="Export with the media files found when the plan in this file was made, instead of looking again"
+        ),
+        make_option(
+            '--writer', '-w',
+            action='store',
+            dest='writer',
+            type='choice',
+            choices=sorted(WRITERS.keys()),
+            default='zimwriterfs',
+            help="How to write the zim file: zimwriterfs (stage in tmp-dir first) or libzim (write directly)"
         ),
     )
 
@@ -125,21 +296,178 @@ class Command(BaseCommand):
         beginning = datetime.now()
         logger.info("Begin: {}".format(beginning))
 
-        language = options.get('language')
-        if not language:
+        languages = [
+            language.strip() for language in (options.get('language') or '').split(',')
+            if language.strip()
+        ]
+        if not languages:
             raise CommandError("Must specify a language!")
+        if len(set(languages)) != len(languages):
+            raise CommandError("Each language can only be exported once")
+        batch = len(languages) > 1
+        if options.get('plan') and options.get('from_plan'):
+            raise CommandError("--plan and --from-plan can't be used together")
+
+        if batch and '{language}' not in dest_file:
+            raise CommandError("The destination must contain {language} when exporting several languages")
+        for option in ('tmp_dir', 'report'):
+            if batch and options.get(option) and '{language}' not in options.get(option):
+                raise CommandError("--{} must contain {{language}} when exporting several languages".format(
+                    option.replace('_', '-')))
+
+        # (language, zim file, tmp dir) of every export
+        exports = []
+        for language in languages:
+            if not options.get('tmp_dir'):
+                tmp_dir = os.path.join(tempfile.gettempdir(), 'ka-lite-zim_{}'.format(language))
+            else:
+                tmp_dir = options.get('tmp_dir').replace('{language}', language)
+            tmp_dir = os.path.abspath(tmp_dir)
+            # Planning leaves the tmp dir alone
+            if not options.get('plan'):
+                self.check_tmp_dir(tmp_dir, options)
+            exports.append((language, dest_file.replace('{language}', language), tmp_dir))
+
+        zimwriterfs = options.get("zimwriterfs", None)
+        transcode2webm = options.get("transcode2webm")
+        jobs = options.get("jobs") or 1
+        render_jobs = options.get("render_jobs") or 1
+        language_jobs = options.get("language_jobs") or 1
+        ffmpeg = find_executable("ffmpeg")
+
+        prefetch_depth = options.get("prefetch")
+        if (jobs < 1 or render_jobs < 1 or language_jobs < 1 or
+                options.get("download_jobs") < 1 or prefetch_depth < 1):
+            raise CommandError("--jobs, --render-jobs, --language-jobs, --download-jobs and --prefetch must be at least 1")
+        for option in ('transcode_height', 'transcode_low_height'):
+            if options.get(option) is not None and options.get(option) < 2:
+                raise CommandError("--{} must be at least 2".format(option.replace('_', '-')))
+
+        transcode_cache = None
+        if transcode2webm:
+            cache_max_size = options.get("cache_max_size")
+            transcode_cache = TranscodeCache(
+                options.get("cache_dir"),
+                max_size=cache_max_size * 1024 * 1024 if cache_max_size else None,
+            )
 
-        if not options.get('tmp_dir'):
-            tmp_dir = os.path.join(tempfile.gettempdir(), 'ka-lite-zim_{}'.format(language))
+        if not ffmpeg:
+            if transcode2webm:
+                raise CommandError("Could not find ffmpeg in your path, it's needed for --transcode2webm")
+            logger.warning("FFMpeg not found in your path, you won't be able to create missing thumbnails or transcode to webm.")
+        else:
+            # Thumbnails are made with the same ffmpeg as the transcodes
+            configure_thumbnailers({'ffmpeg': ffmpeg})
+        if transcode2webm and options.get('probe') and not find_executable("ffprobe"):
+            logger.warning("FFprobe not found in your path, videos can't be probed and will all be transcoded with --transcode2webm.")
+        logger.info("Usable thumbnailers: {}".format(", ".join(sorted(
+            name for name, executables in available_thumbnailers().items()
+            if all(executables.values())
+        )) or "none"))
+
+        writer_options = {}
+        if options.get("writer") == 'zimwriterfs':
+            if not zimwriterfs:
+                zimwriterfs = find_executable("zimwriterfs")
+                if not zimwriterfs:
+                    raise CommandError("Could not find zimwriterfs in your path, try specifying --zimwriterfs=/path")
+
+            if not os.path.exists(zimwriterfs):
+                raise CommandError("Invalid --zimwriterfs")
+            writer_options['zimwriterfs'] = zimwriterfs
+
+        from kalite_zim import __name__ as base_path
+        base_path = os.path.abspath(base_path)
+        data_path = options.get('data_dir') or os.path.join(base_path, 'data')
+
+        if options.get('plan'):
+            self.plan_exports(exports, transcode_cache, options)
+            return
+
+        plans = self.load_plans(exports, options) if options.get('from_plan') else {}
+
+        if not batch:
+            self.export_language(
+                languages[0], exports[0][1], exports[0][2], None, None,
+                ffmpeg, transcode_cache, writer_options, options, plans.get(languages[0])
+            )
         else:
-            tmp_dir = options.get('tmp_dir')
+            # Loaded once for all languages, the translations are applied to
+            # each language's own compact tree
+            topic_tree_json, video_ids = self.load_topic_tree(data_path, test=options.get('test'))
+            self.export_languages(
+                exports, topic_tree_json, video_ids, ffmpeg, transcode_cache, writer_options, options, plans
+            )
 
-        tmp_dir = os.path.abspath(tmp_dir)
+        if transcode_cache:
+            removed, freed = transcode_cache.prune()
+            if removed:
+                logger.info("Evicted {} videos ({} MB) from transcode cache".format(removed, freed // (1024 * 1024)))
+            # So the index forgets the evicted videos' sources
+            transcode_cache.save()
+
+        ending = datetime.now()
+        duration = int((ending - beginning).total_seconds())
+        logger.info(
+            "Duration: {h:} hours, {m:} minutes, {s:} seconds".format(
+                h=duration // 3600,
+                m=(duration % 3600) // 60,
+                s=duration % 60,
+            )
+        )
+        rss = peak_rss()
+        if rss is not None:
+            logger.info("Peak memory usage: {:.1f} MB".format(rss / (1024.0 * 1024.0)))
+
+    def video_renditions(self, options):
+        """
+        Encoder arguments of the renditions that every video is transcoded
+        to, by the suffix of their file names
+        """
+        return renditions(
+            options.get('transcode_profile') or DEFAULT_PROFILE,
+            height=options.get('transcode_height'),
+            low_height=options.get('transcode_low_height'),
+        )
+
+    def video_actions(self, probe, renditions, options):
+        """
+        Whether to link, remux or transcode each rendition of a video with
+        ``probe``, see ``probe.rendition_actions``
+        """
+        return rendition_actions(
+            probe,
+            renditions,
+            max_bitrate(options.get('transcode_profile') or DEFAULT_PROFILE),
+            height=options.get('transcode_height'),
+            low_height=options.get('transcode_low_height'),
+        )
+
+    def find_ffprobe(self, options):
+        """
+        Path of ffprobe, None if it's missing, with --no-probe or without
+        --transcode2webm, since the probes only decide how to transcode
+        """
+        if not options.get('transcode2webm') or not options.get('probe'):
+            return None
+        return find_executable("ffprobe")
+
+    def report_path(self, language, tmp_dir, options):
+        return (options.get('report') or tmp_dir + '.report.json').replace('{language}', language)
+
+    def check_tmp_dir(self, tmp_dir, options):
+        """
+        Clear a dirty tmp dir or make sure that it may be resumed
+        """
+        # Kept outside of tmp_dir since zimwriterfs packs everything in there
+        manifest_path = tmp_dir + '.manifest.json'
 
         if os.path.exists(tmp_dir) and os.listdir(tmp_dir):
             if options['clear']:
                 logger.info("Clearing directory {}".format(tmp_dir))
                 shutil.rmtree(tmp_dir)
+                if os.path.exists(manifest_path):
+                    os.unlink(manifest_path)
             elif options['resume']:
                 logger.info("Resuming in dirty tmp directory {}".format(tmp_dir))
             else:
@@ -149,339 +477,1197 @@ class Command(BaseCommand):
                     )
                 )
 
-        zimwriterfs = options.get("zimwriterfs", None)
-        publisher = options.get("publisher")
-        transcode2webm = options.get("transcode2webm")
-        ffmpeg = find_executable("ffmpeg")
-
-        if not ffmpeg:
-            logger.warning("FFMpeg not found in your path, you won't be able to create missing thumbnails or transcode to webm.")
-
-        if not zimwriterfs:
-            zimwriterfs = find_executable("zimwriterfs")
-            if not zimwriterfs:
-                raise CommandError("Could not find zimwriterfs in your path, try specifying --zimwriterfs=/path")
-
-        if not os.path.exists(zimwriterfs):
-            raise CommandError("Invalid --zimwriterfs")
-
-        from kalite_zim import __name__ as base_path
-        base_path = os.path.abspath(base_path)
-        data_path = os.path.join(base_path, 'data')
-
-        # Where subtitles are found in KA Lite
-        subtitle_src_dir = i18n.get_srt_path(language)
-
-        logger.info("Will export videos for language: {}".format(language))
+    def load_topic_tree(self, data_path, test=False):
+        """
+        The Topic and Video nodes of the topic tree, and the ids of the
+        videos
+        """
         logger.info("Preparing KA Lite topic tree...")
 
         # Use live data
-        if not options.get('test'):
+        if not test:
             # This way of doing things will be deprecated in KA Lite 0.16
             topic_tree_json_path = topic_tools_settings.TOPICS_FILEPATHS.get('khan')
-            content_cache = get_content_cache(language=language, annotate=True)
-            exercise_cache = get_exercise_cache(language=language)
         # Use test data
         else:
             topic_tree_json_path = os.path.join(data_path, 'test_topics.json')
-            content_cache = json.load(
-                open(os.path.join(data_path, 'test_content.json'))
-            )
-            exercise_cache = json.load(
-                open(os.path.join(data_path, 'test_exercise.json'))
-            )
 
-        topic_tree = softload_json(topic_tree_json_path, logger=logger.debug, raises=False)
+        try:
+            return load_topic_tree(topic_tree_json_path)
+        except LoadError as e:
+            raise CommandError(e.args[0])
+
+    def load_content(self, language, video_ids, data_path, test=False):
+        """
+        Content data of the videos in the tree for ``language``
+        """
+        try:
+            if not test:
+                return filter_content(get_content_cache(language=language, annotate=True), video_ids)
+            return load_content(os.path.join(data_path, 'test_content.json'), video_ids)
+        except LoadError as e:
+            raise CommandError(e.args[0])
+
+    def annotate(self, language, topic_tree_json, content_cache, report):
+        """
+        The compact tree of ``language`` that the rest of the export works
+        with, and its videos in order
+        """
+        topic_tree = TopicTree()
+        tree_nodes = {}
+
+        def annotate_tree(topic, parent):
+            """
+            Build the node of a topic or video with its content data, must be
+            called inside the translate block of the language
+            """
+            fields = {}
+            if topic.get("kind") == "Video":
+                content = content_cache.get(topic.get("id"), {})
+                if not content:
+                    logger.error('No content!?, id is: {}'.format(topic.get('id')))
+                else:
+                    fields['youtube_id'] = content.get('youtube_id')
+                    fields['format'] = content.get('format')
+                    if fields['format'] == "webm":
+                        logger.warning("Found a duplicate ID for {}, re-downloading".format(topic['id']))
+                        fields['format'] = "mp4"
 
-        content_json_output = {}
-        exercise_json_output = {}
+            # Translate everything for good measure
+            tree_nodes[id(topic)] = topic_tree.add(
+                tree_nodes[id(parent)] if parent is not None else None,
+                topic["id"],
+                topic.get("kind"),
+                _(topic.get("title", "")),
+                _(topic.get("description", "")) if topic.get("description") else "",
+                topic.get("path", ""),
+                **fields
+            )
 
-        def annotate_tree(topic, depth=0, parent=None):
+        def collect_videos(node, parent):
             """
-            We need to recurse into the tree in order to annotate elements
-            with topic data and exercise data
+            List the videos of the tree in order, everything else can't be
+            displayed and stays unavailable
             """
-            children = topic.get('children', [])
-            new_children = []
-            for child_topic in children:
-                if child_topic.get("kind") in ("Video", "Topic"):
-                    annotate_tree(child_topic, depth=depth + 1, parent=topic)
-                    new_children.append(child_topic)
-            topic["children"] = new_children
-            if topic.get("kind") == "Exercise":
-                topic['exercise'] = exercise_cache.get(topic.get("id"), {})
-                exercise_json_output[topic.get("id")] = topic['exercise']
-            elif topic.get("kind") == "Topic":
+            node = tree_nodes[id(node)]
+            if node.kind == 'Topic':
+                # Don't do anything if it's a topic
                 pass
+            elif node.kind == 'Video':
+                # Available is False by default until we locate the file,
+                # videos without content can't be located
+                if node.format:
+                    videos.append(node)
             else:
-                topic['exercise'] = None
-                topic['content'] = content_cache.get(topic.get("id"), {})
-                content_json_output[topic.get("id")] = topic['content']
-                if not topic['content']:
-                    logger.error('No content!?, id is: {}'.format(topic.get('id')))
+                logger.error("Invalid node, kind: {}".format(node.kind))
+
+        videos = []
+
+        # Annotate the topic tree and collect the videos in one pass,
+        # switching to the language once for all the translations
+        logger.info("Annotating topic tree...")
+        with report.phase('annotate') as annotate_stage, i18n.translate_block(language):
+            walk = TreeWalk(
+                children=lambda topic: topic.get('children', [])
+            ).visit(
+                'annotate', enter=annotate_tree
+            ).visit(
+                'collect_videos', enter=collect_videos
+            ).run(topic_tree_json)
+            annotate_stage.add(items=walk.nodes)
+        for line in walk.report():
+            logger.info("Visitor {}".format(line))
+        logger.info("Topic tree has {} nodes".format(len(topic_tree.nodes)))
+        return topic_tree, videos
+
+    def export_languages(self, exports, topic_tree_json, video_ids, ffmpeg, transcode_cache, writer_options, options,
+                         plans):
+        """
+        Export several languages, doing the work that's the same for all of
+        them once up front: downloads, thumbnails, transcodes and the compiled
+        CSS.
+        Each language is then exported in a process of its own, forked after
+        that work so it's shared, with --language-jobs at the same time.
+        """
+        from kalite_zim import __name__ as base_path
+        base_path = os.path.abspath(base_path)
+        data_path = options.get('data_dir') or os.path.join(base_path, 'data')
+        jobs = options.get("jobs") or 1
+        language_jobs = options.get("language_jobs") or 1
+
+        content_files = DirectoryListing(CONTENT_ROOT, names=set(
+            name for plan in plans.values() for name in plan['files']['content']
+        ) if plans else None)
+        if options['download']:
+            # The language processes would fetch the same videos into the
+            # same files at once
+            downloaded = self.download_videos(exports, video_ids, content_files, data_path, options)
+            for plan in plans.values():
+                plan['files']['content'].extend(downloaded)
+            options = dict(options, download=False)
+
+        # Media files are named by the video ids of the tree, so they are the
+        # same for all languages
+        content_cache = self.load_content(exports[0][0], video_ids, data_path, test=options.get('test'))
+        # File names of the videos
+        video_files = []
+        missing_thumbnails = []
+        for video_id in sorted(video_ids):
+            content = content_cache.get(video_id)
+            if not content or not content.get('format'):
+                continue
+            video_format = "mp4" if content['format'] == "webm" else content['format']
+            video_file_name = video_id + '.' + video_format
+            if video_file_name not in content_files:
+                continue
+            video_file_src = content_files.join(video_file_name)
+            video_files.append(video_file_name)
+            if video_id + '.png' not in content_files:
+                missing_thumbnails.append((video_file_src, content_files.join(video_id + '.png')))
+        content_cache = None
+
+        if missing_thumbnails and ffmpeg:
+            logger.info("Creating {} missing thumbnails for all languages...".format(len(missing_thumbnails)))
+            for video_file_src, thumb_file_src, success in create_thumbnail_files(missing_thumbnails, jobs=jobs):
+                if not success:
+                    logger.error("Failed to create thumbnail for {}".format(video_file_src))
+
+        if transcode_cache:
+            # Probed once for all languages, they find the probes in the cache
+            ffprobe = self.find_ffprobe(options)
+            probe_cache = ProbeCache(options.get("cache_dir"))
+
+            def probe_file(video_file_name):
+                if not ffprobe:
+                    return None
+                video_file_src = content_files.join(video_file_name)
+                video_signature = content_files.signature(video_file_name)
+                probe = probe_cache.get(video_file_src, video_signature)
+                if probe is None and video_signature:
+                    try:
+                        probe = probe_video(ffprobe, video_file_src)
+                    except ProbeError as e:
+                        logger.warning(e.args[0])
+                    else:
+                        probe_cache.put(video_file_src, video_signature, probe)
+                return probe
+
+            # Encoded and remuxed into the cache, where every language finds
+            # them
+            renditions = self.video_renditions(options)
+            transcode_dir = tempfile.mkdtemp(prefix='ka-lite-zim_transcodes_', dir=transcode_cache.cache_dir)
+            cache_keys = {}
+            to_remux = []
+            to_transcode = []
+            for video_file_name, probe in prefetch(video_files, probe_file, jobs=jobs):
+                video_file_src = content_files.join(video_file_name)
+                for decision, extension, args in self.video_actions(probe, renditions, options).values():
+                    if decision == LINK:
+                        continue
+                    cache_key = transcode_cache.key(video_file_src, args)
+                    video_file_dest = os.path.join(transcode_dir, cache_key + '.' + extension)
+                    if os.path.isfile(transcode_cache.path(cache_key)) or video_file_dest in cache_keys:
+                        continue
+                    cache_keys[video_file_dest] = cache_key
+                    if decision == REMUX:
+                        to_remux.append((video_file_src, video_file_dest, args))
+                    else:
+                        to_transcode.append((video_file_src, video_file_dest, args))
+            probe_cache.save()
+            if to_remux:
+                logger.info("Remuxing {} videos for all languages...".format(len(to_remux)))
+            if to_transcode:
+                logger.info("Transcoding {} videos for all languages...".format(len(to_transcode)))
+            try:
+                for video_file_src, video_file_dest, args in to_remux:
+                    try:
+                        remux_video(ffmpeg, video_file_src, video_file_dest, args)
+                    except TranscodeError as e:
+                        logger.error(e.args[0])
+                    else:
+                        logger.info("Remuxed: {}".format(video_file_dest))
+                        transcode_cache.put(cache_keys[video_file_dest], video_file_dest)
+                for video_file_dest, error in transcode_many(ffmpeg, to_transcode, jobs=jobs):
+                    if error:
+                        logger.error(error)
+                    else:
+                        logger.info("Transcoded: {}".format(video_file_dest))
+                        transcode_cache.put(cache_keys[video_file_dest], video_file_dest)
+            finally:
+                shutil.rmtree(transcode_dir, ignore_errors=True)
+                transcode_cache.save()
+
+        # Compile the stylesheet before forking, so the exports find it in the
+        # cache
+        compile_stylesheet(
+            STYLESHEET_SOURCE, os.path.join(base_path, 'static'), os.path.join(options.get("cache_dir"), 'static'))
+
+        logger.info("Exporting {} languages, {} at a time...".format(len(exports), language_jobs))
+        tasks = [
+            (language, self.export_language, (
+                language, dest_file, tmp_dir, topic_tree_json, video_ids,
+                ffmpeg, transcode_cache, writer_options, options, plans.get(language),
+            ))
+            for language, dest_file, tmp_dir in exports
+        ]
+        failed = []
+        for language, error in run_processes(tasks, jobs=language_jobs):
+            if error:
+                logger.error("Export of language {} failed:\n{}".format(language, error))
+                failed.append(language)
+            else:
+                logger.info("Finished exporting language {}".format(language))
+        if failed:
+            raise CommandError("Could not export languages: {}".format(", ".join(failed)))
+
+    def download_videos(self, exports, video_ids, content_files, data_path, options):
+        """
+        Download the videos that KA Lite doesn't have for any of the
+        ``exports``, on --download-jobs threads. Returns the names of the
+        files that were added to ``content_files``.
+        """
+        # (youtube id, format) of the videos to download
+        missing = OrderedDict()
+        for language, __, __ in exports:
+            content_cache = self.load_content(language, video_ids, data_path, test=options.get('test'))
+            for video_id in sorted(video_ids):
+                content = content_cache.get(video_id)
+                if not content or not content.get('format') or not content.get('youtube_id'):
+                    continue
+                video_format = "mp4" if content['format'] == "webm" else content['format']
+                if video_id + '.' + video_format not in content_files:
+                    missing[(content['youtube_id'], video_format)] = True
+        if not missing:
+            return []
+
+        logger.info("Downloading {} videos for all languages...".format(len(missing)))
+        downloader = Downloader(jobs=options['download_jobs'])
+
+        def fetch(video):
+            youtube_id, video_format = video
+            logger.info("Video file being downloaded: {}.{}".format(youtube_id, video_format))
+            try:
+                download_video(youtube_id, video_format, CONTENT_ROOT, downloader=downloader)
+            except DownloadError as e:
+                logger.error(e.args[0])
+            return video
+
+        downloaded = []
+        for youtube_id, video_format in downloader.map(fetch, list(missing)):
+            # The thumbnail is downloaded along with the video
+            for name in (youtube_id + '.' + video_format, youtube_id + '.png'):
+                if name not in content_files and os.path.exists(content_files.join(name)):
+                    content_files.add(name)
+                    downloaded.append(name)
+        logger.info("Downloads used {} connections".format(downloader.connections_opened))
+        return downloaded
+
+    def export_language(self, language, dest_file, tmp_dir, topic_tree_json, video_ids,
+                        ffmpeg, transcode_cache, writer_options, options, plan=None):
+        """
+        Export one language from the loaded topic tree into ``dest_file``,
+        with the media files listed in its ``plan`` if there is one
+        """
+        beginning = datetime.now()
+        publisher = options.get("publisher")
+        transcode2webm = options.get("transcode2webm")
+        renditions = self.video_renditions(options)
+        jobs = options.get("jobs") or 1
+        render_jobs = options.get("render_jobs") or 1
+        prefetch_depth = options.get("prefetch")
 
-            # Translate everything for good measure
-            with i18n.translate_block(language):
-                topic["title"] = _(topic.get("title", ""))
-                topic["description"] = _(topic.get("description", "")) if topic.get("description") else ""
+        from kalite_zim import __name__ as base_path
+        base_path = os.path.abspath(base_path)
+        data_path = options.get('data_dir') or os.path.join(base_path, 'data')
+
+        # Subtitles found in KA Lite, named by video id
+        subtitle_files = DirectoryListing(
+            i18n.get_srt_path(language), names=plan['files']['subtitles'] if plan is not None else None)
+        subtitle_cache = SubtitleCache(os.path.join(options.get("cache_dir"), 'subtitles'))
+        # Probes of the videos by file name, made on the prefetch threads
+        ffprobe = self.find_ffprobe(options)
+        probe_cache = ProbeCache(options.get("cache_dir"))
+        probes = {}
+
+        # Remembers what was done in previous runs, so --resume only redoes
+        # the work for nodes whose inputs changed
+        manifest = BuildManifest(tmp_dir + '.manifest.json')
+
+        # Timings and counts of every phase, written next to the manifest
+        report = ExportReport(profile=options.get('profile'))
+        report_path = self.report_path(language, tmp_dir, options)
+
+        try:
+            writer = WRITERS[options.get("writer")](
+                dest_file,
+                tmp_dir,
+                {
+                    'welcome': "welcome.html",
+                    'favicon': "static/img/ka_leaf.png",
+                    'publisher': publisher,
+                    'creator': "KhanAcademy.org",
+                    'title': "Khan Academy ({})".format(language),
+                    'description': "Videos from Khan Academy",
+                    'language': language,
+                },
+                **writer_options
+            )
+        except WriterError as e:
+            raise CommandError(e.args[0])
 
-            topic["url"] = topic["id"] + ".html"
-            topic["parent"] = parent
-            topic["depth"] = depth
-            for key in ("child_data", "keywords", "hide", "contains"):
-                topic.pop(key, None)
+        logger.info("Will export videos for language: {}".format(language))
 
-        # 1. Annotate a topic tree
-        annotate_tree(topic_tree)
+        # Shared by all languages when exporting several
+        if topic_tree_json is None:
+            topic_tree_json, video_ids = self.load_topic_tree(data_path, test=options.get('test'))
+        # Only the content of the videos in the tree
+        content_cache = self.load_content(language, video_ids, data_path, test=options.get('test'))
 
-        # 2. Now go through the tree and copy each element into the destination
-        # zim file system
+        # 1. The compact tree that the rest of the export works with
+        topic_tree, videos = self.annotate(language, topic_tree_json, content_cache, report)
+        # Only the compact tree is kept
+        topic_tree_json = content_cache = None
+        if plan is not None and len(topic_tree.nodes) != plan['nodes']:
+            raise CommandError("The topic tree of {} changed since the plan was made, make it again with --plan".format(language))
 
-        def copy_media(node):
-            if node['kind'] == 'Topic':
-                # Don't do anything if it's a topic
-                pass
-            elif node['kind'] == 'Exercise':
-                # Exercises cannot be displayed
-                node["content"]["available"] = False
-            elif node['kind'] == 'Video':
-
-                if node['content']['format'] == "webm":
-                    logger.warning("Found a duplicate ID for {}, re-downloading".format(node['id']))
-                    node['content']['format'] = "mp4"
-
-                # Available is False by default until we locate the file
-                node["content"]["available"] = False
-                node_dir = os.path.join(tmp_dir, node["path"])
-                if not os.path.exists(node_dir):
-                    os.makedirs(node_dir)
-                video_file_name = node['id'] + '.' + node['content']['format']
-                thumb_file_name = node['id'] + '.png'
-                video_file_src = os.path.join(CONTENT_ROOT, video_file_name)
-                video_file_dest = os.path.join(node_dir, video_file_name)
-                thumb_file_src = os.path.join(CONTENT_ROOT, thumb_file_name)
-                thumb_file_dest = os.path.join(node_dir, thumb_file_name)
-
-                if options['download'] and not os.path.exists(video_file_src):
-                    logger.info("Video file being downloaded to: {}".format(video_file_src))
-                    download_video(
-                        node['content']['youtube_id'],
-                        node['content']['format'],
-                        CONTENT_ROOT,
-                    )
+        # 2. Now go through the videos and copy each into the destination
+        # zim file system
 
-                if os.path.exists(video_file_src):
-                    if transcode2webm:
-                        ffmpeg_pass_log = "/tmp/logfile_vp8.fpf"
-                        if os.path.isfile(ffmpeg_pass_log):
-                            os.unlink(ffmpeg_pass_log)
-                        video_file_name = node['id'] + '.webm'
-                        video_file_dest = os.path.join(node_dir, video_file_name)
-                        if os.path.isfile(video_file_dest):
-                            logger.info("Already encoded: {}".format(video_file_dest))
-                        else:
-                            ffmpeg_base_args = [
-                                ffmpeg,
-                                "-i", video_file_src,
-                                "-codec:v", "libvpx",
-                                "-quality", "best",
-                                "-cpu-used", "0",
-                                "-b:v", "300k",
-                                "-qmin", "10",  # 10=lowest value
-                                "-qmax", "35",  # 42=highest value
-                                "-maxrate", "300k",
-                                "-bufsize", "600k",
-                                "-threads", "8",
-                                # "-vf", "scale=-1",
-                                "-codec:a", "libvorbis",
-                                # "-b:a", "128k",
-                                "-aq", "5",
-                                "-f", "webm",
-                            ]
-                            ffmpeg_pass1 = ffmpeg_base_args + [
-                                "-an",  # Disables audio, no effect first pass
-                                "-pass", "1",
-                                "-passlogfile", ffmpeg_pass_log,
-                                video_file_dest,
-                            ]
-                            ffmpeg_pass2 = ffmpeg_base_args + [
-                                "-pass", "2",
-                                "-y", "-passlogfile", ffmpeg_pass_log,
-                                video_file_dest,
-                            ]
-                            for cmd in (ffmpeg_pass1, ffmpeg_pass2):
-                                process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-                                stdout_data, _stderr_data = process.communicate()
-                                if process.returncode != 0:
-                                    logger.error("Error invoking ffmpeg: {}".format((_stderr_data or "") + (stdout_data or "")))
-                                    logger.error("Command was: {}".format(" ".join(cmd)))
-                                    raise CommandError("Could not complete transcoding")
-                        node['content']['format'] = "webm"
-                    else:
-                        # If not transcoding, just link the original file
-                        os.link(video_file_src, video_file_dest)
-                    node["video_url"] = os.path.join(
-                        node["path"],
-                        video_file_name
-                    )
-                    copy_media.videos_found += 1
-                    logger.info("Videos processed: {}".format(copy_media.videos_found))
-                    node["content"]["available"] = True
-
-                    # Create thumbnail if it wasn't downloaded
-                    if not os.path.exists(thumb_file_src):
-                        fp = create_thumbnail(video_file_src, output_format="png")
-                        if fp is None:
-                            logger.error("Failed to create thumbnail for {}".format(video_file_src))
-                        else:
-                            logger.info("Successfully created thumbnail for {}".format(video_file_src))
-                            file(thumb_file_src, 'wb').write(fp.read())
-
-                    # Handle thumbnail
-                    if os.path.exists(thumb_file_src):
-                        node["thumbnail_url"] = os.path.join(
-                            node["path"],
-                            node['id'] + '.png'
-                        )
-                        if not os.path.exists(thumb_file_dest):
-                            os.link(thumb_file_src, thumb_file_dest)
-                    else:
-                        node["thumbnail_url"] = None
+        download_locks = {}
 
-                    subtitle_srt = os.path.join(
-                        subtitle_src_dir,
-                        node['id'] + '.srt'
-                    )
-                    if os.path.isfile(subtitle_srt):
-                        subtitle_vtt = os.path.join(
-                            node_dir,
-                            node['id'] + '.vtt'
-                        )
-                        # Convert to .vtt because this format is understood
-                        # by latest video.js and the old ones that read
-                        # .srt don't work with newer jquery etc.
-                        submarine_parser(subtitle_srt, subtitle_vtt)
-                        if not os.path.exists(subtitle_vtt):
-                            logger.warning("Subtitle not converted: {}".format(subtitle_srt))
-                        else:
-                            logger.info("Subtitle convert from SRT to VTT: {}".format(subtitle_vtt))
-                            node["subtitle_url"] = os.path.join(
-                                node["path"],
-                                node['id'] + '.vtt'
+        def fetch_video(node):
+            """
+            Runs ahead of copy_media on the prefetch threads, downloading the
+            video if KA Lite doesn't have it. Returns whether it's available.
+            """
+            video_file_name = node.id + '.' + node.format
+            video_file_src = content_files.join(video_file_name)
+            if options['download'] and video_file_name not in content_files:
+                # Several nodes can point to the same video
+                with download_locks.setdefault(node.youtube_id, threading.Lock()):
+                    if video_file_name not in content_files:
+                        logger.info("Video file being downloaded to: {}".format(video_file_src))
+                        start = time.time()
+                        try:
+                            download_video(
+                                node.youtube_id,
+                                node.format,
+                                CONTENT_ROOT,
+                                downloader=downloader,
+                            )
+                        except DownloadError as e:
+                            logger.error(e.args[0])
+                        # The thumbnail is downloaded along with the video
+                        if os.path.exists(content_files.join(node.id + '.png')):
+                            content_files.add(node.id + '.png')
+                        if os.path.exists(video_file_src):
+                            content_files.add(video_file_name)
+                            stages['download'].add(
+                                bytes=content_files.size(video_file_name),
+                                item=node.id,
+                                seconds=time.time() - start,
                             )
+            if ffprobe and video_file_name in content_files:
+                probe_source(video_file_name)
+            return video_file_name in content_files
+
+        def probe_source(video_file_name):
+            """
+            Probe a video for copy_media, unless it was probed before
+            """
+            video_file_src = content_files.join(video_file_name)
+            video_signature = content_files.signature(video_file_name)
+            probe = probe_cache.get(video_file_src, video_signature)
+            if probe is None:
+                start = time.time()
+                try:
+                    probe = probe_video(ffprobe, video_file_src)
+                except ProbeError as e:
+                    logger.warning(e.args[0])
+                    return
+                probe_cache.put(video_file_src, video_signature, probe)
+                stages['probe'].add(item=video_file_name, seconds=time.time() - start)
+            probes[video_file_name] = probe
 
+        def copy_media(node):
+            """
+            Link, transcode, thumbnail and convert subtitles for a video
+            that KA Lite has
+            """
+            node_dir = os.path.join(tmp_dir, node.path)
+            dest_tree.makedirs(node_dir)
+            video_file_name = node.id + '.' + node.format
+            thumb_file_name = node.id + '.png'
+            video_file_src = content_files.join(video_file_name)
+            video_signature = content_files.signature(video_file_name)
+            video_size = content_files.size(video_file_name)
+            probe = probes.get(video_file_name)
+
+            if transcode2webm:
+                # Videos that play in Kiwix as they are aren't transcoded
+                actions = self.video_actions(probe, renditions, options)
+            else:
+                # If not transcoding, just link the original file
+                actions = OrderedDict([('', (LINK, node.format, None))])
+            for suffix, (decision, extension, args) in actions.items():
+                if decision == LINK:
+                    link_video(node, video_file_src, video_signature, video_size, suffix, extension)
                 else:
-                    if options['download']:
-                        logger.error("File not found or downloaded: {}".format(video_file_src))
+                    transcode_video(
+                        node, node_dir, video_file_src, video_signature, video_size, suffix, extension, args,
+                        remux=decision == REMUX,
+                    )
+            decision, node.format, __ = actions['']
+            copy_media.decisions[decision] += 1
+            if LOW_SUFFIX in actions:
+                node.low_video_url = os.path.join(node.path, node.id + LOW_SUFFIX + '.webm')
+            # The player is as large as the video, once it's scaled down
+            node.width, node.height = display_size(
+                probe, options.get('transcode_height') if decision == TRANSCODE else None)
+            node.video_url = os.path.join(
+                node.path,
+                node.id + '.' + node.format
+            )
+            copy_media.videos_found += 1
+            logger.info("Videos processed: {}".format(copy_media.videos_found))
+            node.available = True
+
+            # Create thumbnail if it wasn't downloaded, and don't
+            # try again for the same video if it failed last time.
+            # Missing thumbnails are created in one batch afterwards.
+            thumbnail_inputs = {'src': video_signature}
+            if thumb_file_name not in content_files and not manifest.is_fresh('thumbnail', node.path, thumbnail_inputs):
+                # A video can be in several topics, its frame is only
+                # extracted once for all of their nodes
+                copy_media.missing_thumbnails.setdefault(
+                    thumb_file_name, (video_file_src, []))[1].append((node, thumbnail_inputs))
             else:
-                logger.error("Invalid node, kind: {}".format(node.get("kind", None)))
-                # Exercises cannot be displayed
-                node["content"] = {"available": False}
-
-            new_children = []
-            for child in node.get('children', []):
-                copy_media(child)
-                empty_topic = child["kind"] == "Topic" and not child.get("children", [])
-                unavailable_video = child["kind"] == "Video" and not child.get("content", {}).get("available", False)
-                if not (empty_topic or unavailable_video):
-                    new_children.append(child)
-            node['children'] = new_children
+                add_thumbnail(node, thumb_file_name)
+
+            # Subtitles are converted in one batch afterwards
+            if node.id + '.srt' in subtitle_files:
+                copy_media.subtitles.append((node, node.id + '.srt'))
+
         copy_media.videos_found = 0
+        copy_media.decisions = OrderedDict((decision, 0) for decision in DECISIONS)
+        copy_media.transcode_keys = {}
+        copy_media.failed_transcodes = 0
+        copy_media.missing_thumbnails = OrderedDict()
+        copy_media.subtitles = []
 
-        def render_topic_pages(node):
+        def remove_other_encodes(manifest_key, video_file_dest):
+            """
+            Remove what a previous run made of a rendition under another
+            name, because it's linked, remuxed or transcoded instead now
+            """
+            for path in manifest.outputs('transcode', manifest_key):
+                if path != video_file_dest and dest_tree.isfile(path):
+                    logger.info("Removing encode in another format {}".format(path))
+                    os.unlink(path)
+                    dest_tree.discard(path)
 
-            parents = [node] if node.get("children") else []
-            parent = node["parent"]
-            while parent:
-                parents.append(parent)
-                parent = parent["parent"]
+        def link_video(node, video_file_src, video_signature, video_size, suffix, extension):
+            """
+            Add a rendition of a video that's the original file
+            """
+            video_file_name = node.id + suffix + '.' + extension
+            video_file_dest = os.path.join(tmp_dir, node.path, video_file_name)
+            manifest_key = node.path + suffix
+            remove_other_encodes(manifest_key, video_file_dest)
+            # Recorded with the encodes, so that the staged link is removed
+            # once the video is encoded or gone
+            manifest.record('transcode', manifest_key, {'src': video_signature, 'args': None}, [video_file_dest])
+            start = time.time()
+            writer.add_file(os.path.join(node.path, video_file_name), video_file_src)
+            stages['link'].add(
+                bytes=video_size,
+                item=node.id,
+                seconds=time.time() - start,
+            )
 
-            # Finally, render templates into the destination
-            template_context = {
-                "topic_tree": topic_tree,
-                "topic": node,
-                "parents": parents
+        def transcode_video(node, node_dir, video_file_src, video_signature, video_size, suffix, extension, args,
+                            remux=False):
+            """
+            Add a rendition of a video that was encoded before, or queue its
+            encode. Remuxing is quick and done right away.
+            """
+            video_file_name = node.id + suffix + '.' + extension
+            video_file_dest = os.path.join(node_dir, video_file_name)
+            manifest_key = node.path + suffix
+            remove_other_encodes(manifest_key, video_file_dest)
+            transcode_inputs = {
+                'src': video_signature,
+                'args': data_signature(args),
             }
-            with i18n.translate_block(language):
-                topic_html = render_to_string("kalite_zim/topic.html", template_context)
-            # Replace absolute references to '/static' with relative
-            topic_html = topic_html.replace("/static", "static")
+            # Encodes from before the manifest existed are trusted, there
+            # were no remuxes then
+            if dest_tree.isfile(video_file_dest) and (
+                    manifest.is_fresh('transcode', manifest_key, transcode_inputs, [video_file_dest]) or
+                    not (remux or manifest.has('transcode', manifest_key))):
+                logger.info("Already encoded: {}".format(video_file_dest))
+                manifest.record('transcode', manifest_key, transcode_inputs, [video_file_dest])
+                writer.add_file(os.path.join(node.path, video_file_name), video_file_dest)
+                return
+            if dest_tree.isfile(video_file_dest):
+                logger.info("Source or encoder changed, re-encoding: {}".format(video_file_dest))
+                os.unlink(video_file_dest)
+                dest_tree.discard(video_file_dest)
+                manifest.discard('transcode', manifest_key)
+            cache_key = transcode_cache.key(video_file_src, args)
+            if transcode_cache.get(cache_key, video_file_dest):
+                logger.info("Found in transcode cache: {}".format(video_file_dest))
+                manifest.record('transcode', manifest_key, transcode_inputs, [video_file_dest])
+                writer.add_file(os.path.join(node.path, video_file_name), video_file_dest)
+            elif remux:
+                start = time.time()
+                try:
+                    remux_video(ffmpeg, video_file_src, video_file_dest, args)
+                except TranscodeError as e:
+                    copy_media.failed_transcodes += 1
+                    logger.error(e.args[0])
+                    return
+                logger.info("Remuxed: {}".format(video_file_dest))
+                stages['remux'].add(
+                    bytes=os.path.getsize(video_file_dest),
+                    bytes_read=video_size,
+                    item=manifest_key,
+                    seconds=time.time() - start,
+                )
+                transcode_cache.put(cache_key, video_file_dest)
+                manifest.record('transcode', manifest_key, transcode_inputs, [video_file_dest])
+                writer.add_file(os.path.join(node.path, video_file_name), video_file_dest)
+            else:
+                # Encoding happens in the background on --jobs processes
+                # while the next videos are handled
+                transcode_pool.submit(video_file_src, video_file_dest, args)
+                copy_media.transcode_keys[video_file_dest] = (
+                    manifest_key, cache_key, transcode_inputs,
+                    os.path.join(node.path, video_file_name),
+                    video_size,
+                )
 
-            dest_html = os.path.join(tmp_dir, node["id"] + ".html")
-            logger.info("Rendering {}".format(dest_html))
+        def add_subtitle(node, subtitle_vtt):
+            node.subtitle_url = os.path.join(
+                node.path,
+                node.id + '.vtt'
+            )
+            writer.add_file(node.subtitle_url, subtitle_vtt)
 
-            open(dest_html, "w").write(topic_html)
+        def convert_subtitles(subtitle_stage):
+            """
+            Convert the subtitles of all available videos to VTT, because
+            this format is understood by the latest video.js and the old ones
+            that read SRT don't work with newer jquery etc.
 
-            render_topic_pages.pages_rendered += 1
+            Conversions are cached by the hash of the SRT file, the missing
+            ones are run on --jobs processes.
+            """
+            # Cached VTT file to convert to, and the videos that use it
+            pending = OrderedDict()
+            for node, subtitle_name in copy_media.subtitles:
+                subtitle_srt = subtitle_files.join(subtitle_name)
+                subtitle_inputs = {'src': subtitle_files.signature(subtitle_name)}
+                # The SRT file isn't read again if it hasn't changed
+                outputs = manifest.outputs('subtitle', node.path)
+                if manifest.is_fresh('subtitle', node.path, subtitle_inputs, outputs):
+                    add_subtitle(node, outputs[0])
+                    continue
+                key = srt_key(subtitle_srt)
+                subtitle_vtt = subtitle_cache.get(key)
+                if subtitle_vtt:
+                    manifest.record('subtitle', node.path, subtitle_inputs, [subtitle_vtt])
+                    add_subtitle(node, subtitle_vtt)
+                else:
+                    pending.setdefault(subtitle_cache.path(key), []).append((node, subtitle_srt, subtitle_inputs))
+
+            logger.info("Converting {} subtitles from SRT to VTT with {} processes...".format(len(pending), jobs))
+            items = [(entries[0][1], subtitle_vtt) for subtitle_vtt, entries in pending.items()]
+            for subtitle_srt, subtitle_vtt, error, seconds in convert_many(items, jobs=jobs):
+                if error:
+                    logger.warning("Subtitle not converted: {}\n{}".format(subtitle_srt, error))
+                    continue
+                entries = pending[subtitle_vtt]
+                subtitle_stage.add(
+                    bytes=os.path.getsize(subtitle_vtt),
+                    bytes_read=os.path.getsize(subtitle_srt),
+                    item=entries[0][0].id,
+                    seconds=seconds,
+                )
+                for node, __, subtitle_inputs in entries:
+                    manifest.record('subtitle', node.path, subtitle_inputs, [subtitle_vtt])
+                    add_subtitle(node, subtitle_vtt)
+            logger.info("Subtitle cache hits: {}, misses: {}".format(subtitle_cache.hits, subtitle_cache.misses))
+
+        def add_thumbnail(node, thumb_file_name):
+            if thumb_file_name in content_files:
+                node.thumbnail_url = os.path.join(
+                    node.path,
+                    node.id + '.png'
+                )
+                writer.add_file(node.thumbnail_url, content_files.join(thumb_file_name))
+            else:
+                node.thumbnail_url = None
+
+        def create_missing_thumbnails():
+            """
+            Extract a frame from all the videos without a thumbnail, running
+            --jobs ffmpeg processes at a time.
+            """
+            missing = copy_media.missing_thumbnails
+            if missing:
+                logger.info("Creating {} missing thumbnails...".format(len(missing)))
+            sources_and_outputs = [
+                (video_file_src, content_files.join(thumb_file_name))
+                for thumb_file_name, (video_file_src, __) in missing.items()
+            ]
+            for video_file_src, thumb_file_src, success in create_thumbnail_files(sources_and_outputs, jobs=jobs):
+                thumb_file_name = os.path.basename(thumb_file_src)
+                __, nodes = missing[thumb_file_name]
+                if success:
+                    logger.info("Successfully created thumbnail for {}".format(video_file_src))
+                    content_files.add(thumb_file_name)
+                    stages['thumbnail'].add(bytes=content_files.size(thumb_file_name))
+                else:
+                    logger.error("Failed to create thumbnail for {}".format(video_file_src))
+                for node, thumbnail_inputs in nodes:
+                    if not success:
+                        manifest.record('thumbnail', node.path, thumbnail_inputs)
+                    add_thumbnail(node, thumb_file_name)
+
+        def finish_transcodes(max_pending=0):
+            """
+            Collect the transcodes that are done, in the order they were
+            submitted. Blocks while more than max_pending are left.
+            """
+            for video_file_dest, error in transcode_pool.results(max_pending=max_pending):
+                if error:
+                    copy_media.failed_transcodes += 1
+                    logger.error(error)
+                else:
+                    logger.info("Transcoded: {}".format(video_file_dest))
+                    manifest_key, cache_key, transcode_inputs, video_url, src_size = copy_media.transcode_keys[video_file_dest]
+                    stages['transcode'].add(
+                        bytes=os.path.getsize(video_file_dest),
+                        bytes_read=src_size,
+                        item=manifest_key,
+                        seconds=transcode_pool.durations.pop(video_file_dest, None),
+                    )
+                    transcode_cache.put(cache_key, video_file_dest)
+                    manifest.record('transcode', manifest_key, transcode_inputs, [video_file_dest])
+                    writer.add_file(video_url, video_file_dest)
+
+        def render_topic_pages(node, parent):
+            """
+            List the pages that have to be rendered, the rendering itself
+            happens afterwards on --render-jobs processes
+            """
+            dest_html = os.path.join(tmp_dir, node.id + ".html")
+            page_inputs = {
+                'page': page_signature(node, topic_parents(topic_tree, node)),
+                'templates': render_topic_pages.templates_signature,
+            }
 
-            for child in node.get('children', []):
-                render_topic_pages(child)
+            # Only a staged page from a previous run can be reused
+            if writer.incremental and manifest.is_fresh('render', node.id, page_inputs, [dest_html]):
+                render_topic_pages.pages_unchanged += 1
+            else:
+                render_topic_pages.pending.append(node)
+                render_topic_pages.inputs[node.id] = page_inputs
+
+            render_topic_pages.pages_rendered += 1
         render_topic_pages.pages_rendered = 0
+        render_topic_pages.pages_unchanged = 0
+        render_topic_pages.pages_failed = 0
+        render_topic_pages.pending = []
+        render_topic_pages.inputs = {}
+        # Changes to templates or stylesheets make every page dirty
+        render_topic_pages.templates_signature = data_signature([
+            language,
+            tree_signature(
+                os.path.join(base_path, 'templates'),
+                os.path.join(base_path, 'static', 'bootstrap'),
+            ),
+        ])
+
+        # Listed once, so checking which media files exist doesn't cost a
+        # system call for each node
+        content_files = DirectoryListing(CONTENT_ROOT, names=plan['files']['content'] if plan is not None else None)
+        dest_tree = TreeListing(tmp_dir)
 
         logger.info("Hard linking video files from KA Lite...")
-        copy_media(topic_tree)
+        # The media phase is timed as a whole, the stages in it overlap
+        media_stage = report.stage('media')
+        stages = OrderedDict(
+            (name, report.stage(name))
+            for name in ('probe', 'download', 'link', 'remux', 'transcode', 'thumbnail')
+        )
+        downloader = Downloader(jobs=options['download_jobs'])
+        # Start the ffmpeg processes before any threads are started
+        transcode_pool = TranscodePool(ffmpeg, jobs=jobs) if transcode2webm else None
+        try:
+            with report.phase('media'):
+                # Videos are downloaded ahead, while the ones that have
+                # arrived are processed and transcoded in the background
+                for node, available in prefetch(videos, fetch_video, depth=prefetch_depth, jobs=options['download_jobs']):
+                    if available:
+                        copy_media(node)
+                    elif options['download']:
+                        logger.error("File not found or downloaded: {}".format(node.id))
+                    media_stage.add()
+                    if transcode_pool:
+                        finish_transcodes(max_pending=prefetch_depth)
+                if transcode_pool:
+                    finish_transcodes()
+                    transcode_pool.close()
+            with report.phase('thumbnail', python=False):
+                create_missing_thumbnails()
+            with report.phase('subtitle', python=False) as subtitle_stage:
+                convert_subtitles(subtitle_stage)
+        except (Exception, KeyboardInterrupt):
+            if transcode_pool:
+                transcode_pool.terminate()
+            manifest.save()
+            probe_cache.save()
+            raise
+        probe_cache.save()
+
+        if copy_media.failed_transcodes:
+            manifest.save()
+            raise CommandError("Could not complete transcoding of {} videos".format(copy_media.failed_transcodes))
+
+        # Remove encodes and links of videos that are no longer in the tree,
+        # and of renditions that aren't made any more
+        for key in manifest.untouched('transcode'):
+            for path in manifest.outputs('transcode', key):
+                if dest_tree.isfile(path):
+                    logger.info("Removing stale encode {}".format(path))
+                    os.unlink(path)
+                    dest_tree.discard(path)
+            manifest.discard('transcode', key)
+
+        # Pages list their children and siblings, so the whole tree has to be
+        # pruned before rendering can start
+        with report.phase('prune') as prune_stage:
+            walk = TreeWalk().visit('prune', leave=prune_tree).run(topic_tree.root)
+            prune_stage.add(items=walk.nodes)
+        for line in walk.report():
+            logger.info("Visitor {}".format(line))
+        manifest.save()
+
+        for stage in list(stages.values()) + [subtitle_stage]:
+            logger.info("Stage {}".format(stage))
+        logger.info("Filesystem calls: content {}, subtitles {}, destination {}".format(
+            content_files.syscalls, subtitle_files.syscalls, dest_tree.syscalls,
+        ))
+        if options['download']:
+            logger.info("Downloads used {} connections".format(downloader.connections_opened))
+        if ffprobe:
+            logger.info("Probe cache hits: {}, misses: {}".format(probe_cache.hits, probe_cache.misses))
+        logger.info("Videos linked: {link}, remuxed: {remux}, transcoded: {transcode}".format(**copy_media.decisions))
+
+        if transcode_cache:
+            transcode_cache.save()
+            logger.info("Transcode cache hits: {}, misses: {}".format(transcode_cache.hits, transcode_cache.misses))
 
         sys.stderr.write("\n")
         logger.info("Done!")
 
-        # Configure django-compressor
-        compressor_init(os.path.join(base_path, 'static'))
+        static_dir = os.path.join(base_path, 'static')
+        # The stylesheet compiled from SCSS is kept in the cache and only
+        # compiled again when the SCSS files change
+        compiled_dir = os.path.join(options.get("cache_dir"), 'static')
+        with report.phase('stylesheet'):
+            stylesheet = compile_stylesheet(STYLESHEET_SOURCE, static_dir, compiled_dir)
+        logger.info("Using stylesheet {}".format(os.path.join(compiled_dir, stylesheet)))
 
-        # Finally, render templates into the destination
-        template_context = {
-            "topic_tree": topic_tree,
-            "welcome": True,
-        }
+        # Static files referenced by the pages, only those are added
+        assets = AssetCollector([compiled_dir, static_dir])
+        assets.add(writer.metadata['favicon'][len('static/'):])
 
-        with i18n.translate_block(language):
-            welcome_html = render_to_string("kalite_zim/welcome.html", template_context)
-            about_html = render_to_string("kalite_zim/about.html", template_context)
-        # Replace absolute references to '/static' with relative
-        welcome_html = welcome_html.replace("/static", "static")
-        about_html = about_html.replace("/static", "static")
+        with report.phase('render') as render_stage:
+            stylesheet_init(stylesheet)
 
-        # Write the welcome.html file
-        open(os.path.join(tmp_dir, 'welcome.html'), 'w').write(welcome_html)
-        open(os.path.join(tmp_dir, 'about.html'), 'w').write(about_html)
-
-        # Render all topic html files
-        render_topic_pages(topic_tree)
-
-        # Copy in static data after it's been handled by django compressor
-        # (this happens during template rendering)
+            # Finally, render templates into the destination
+            template_context = {
+                "topic_tree": topic_tree.root,
+                "welcome": True,
+            }
 
-        shutil.copytree(os.path.join(base_path, 'static'), os.path.join(tmp_dir, 'static'))
+            with i18n.translate_block(language):
+                welcome_html = render_to_string("kalite_zim/welcome.html", template_context)
+                about_html = render_to_string("kalite_zim/about.html", template_context)
+                search_html = render_to_string("kalite_zim/search.html", template_context)
+                welcome_title = _("Welcome")
+                about_title = _("About")
+                search_title = _("Search")
+            # Replace absolute references to '/static' with relative
+            welcome_html = welcome_html.replace("/static", "static")
+            about_html = about_html.replace("/static", "static")
+            search_html = search_html.replace("/static", "static")
+            for html in (welcome_html, about_html, search_html):
+                assets.add_html(html)
+
+            # Write the welcome.html file
+            writer.add_article('welcome.html', welcome_html, title=welcome_title)
+            writer.add_article('about.html', about_html, title=about_title)
+            writer.add_article('search.html', search_html, title=search_title)
+
+            # Render all topic html files
+            walk = TreeWalk().visit('render', enter=render_topic_pages).run(topic_tree.root)
+            for line in walk.report():
+                logger.info("Visitor {}".format(line))
+
+            pending = render_topic_pages.pending
+            logger.info("Rendering {} pages with {} processes...".format(len(pending), render_jobs))
+            for node, topic_html, error, seconds in render_pages(
+                    pending, topic_tree, language, stylesheet, jobs=render_jobs):
+                if error:
+                    render_topic_pages.pages_failed += 1
+                    logger.error("Failed to render {}:\n{}".format(node.id, error))
+                    continue
+                dest_html = os.path.join(tmp_dir, node.id + ".html")
+                logger.info("Rendered {} ({}/{})".format(dest_html, render_stage.items + 1, len(pending)))
+                writer.add_article(node.id + ".html", topic_html, title=node.title)
+                assets.add_html(topic_html)
+                if writer.incremental:
+                    manifest.record('render', node.id, render_topic_pages.inputs[node.id], [dest_html])
+                render_stage.add(bytes=len(topic_html.encode('utf-8')), item=node.id, seconds=seconds)
+        logger.info("Stage {}".format(render_stage))
+        if render_topic_pages.pages_failed:
+            manifest.save()
+            raise CommandError("Could not render {} pages".format(render_topic_pages.pages_failed))
+
+        # Remove pages of topics and videos that are no longer in the tree
+        for key in manifest.untouched('render'):
+            for path in manifest.outputs('render', key):
+                if os.path.exists(path):
+                    logger.info("Removing stale page {}".format(path))
+                    os.unlink(path)
+            manifest.discard('render', key)
+        manifest.save()
+
+        # Search index of all topics and videos, also those whose pages
+        # weren't rendered again
+        search_dir = os.path.join(tmp_dir, 'search')
+        with report.phase('search') as search_stage:
+            search_index = SearchIndex()
+
+            def index_node(node, parent):
+                if parent is not None:
+                    search_index.add(node.title, node.url, node.kind, node.description)
+
+            TreeWalk().visit('search', enter=index_node).run(topic_tree.root)
+            shutil.rmtree(search_dir, ignore_errors=True)
+            for name in search_index.write(search_dir):
+                path = os.path.join(search_dir, name)
+                writer.add_file('search/' + name, path)
+                search_stage.add(bytes=os.path.getsize(path))
+        logger.info("Search index of {} topics and videos with {} terms in {} files".format(
+            len(search_index.documents), len(search_index.postings), search_stage.items))
+        search_index = None
+
+        # Add the static files, minified and only those that are used
+        static_tmp_dir = os.path.join(tmp_dir, 'static')
+        with report.phase('static') as static_stage:
+            if render_topic_pages.pages_unchanged:
+                # Pages that weren't rendered again use the files of the
+                # previous run
+                for path in manifest.outputs('static', 'assets'):
+                    assets.add(os.path.relpath(path, static_tmp_dir).replace(os.sep, '/'))
+            asset_paths = assets.resolve()
+            for path in sorted(assets.missing):
+                logger.warning("Referenced static file not found: {}".format(path))
+            if writer.incremental:
+                # Drop files of previous runs that are no longer used
+                shutil.rmtree(static_tmp_dir, ignore_errors=True)
+            for path, src_path, size in build_assets(
+                    [compiled_dir, static_dir], asset_paths, os.path.join(options.get("cache_dir"), 'assets')):
+                writer.add_file('static/' + path, src_path)
+                static_stage.add(bytes_read=size, bytes=os.path.getsize(src_path))
+            if writer.incremental:
+                manifest.record('static', 'assets', {}, [
+                    os.path.join(static_tmp_dir, *path.split('/')) for path in asset_paths
+                ])
+                manifest.save()
+        if jsmin is None or cssmin is None:
+            logger.warning("rjsmin or rcssmin not found, static files are not minified")
 
         ending = datetime.now()
         duration = int((ending - beginning).total_seconds())
         logger.info("Total number of videos found: {}".format(copy_media.videos_found))
         logger.info("Total number of topic pages created: {}".format(render_topic_pages.pages_rendered))
-
-        logger.info("Invoking zimwriterfs, writing to: {}".format(dest_file))
-
-        zimwriterfs_args = (
-            zimwriterfs,
-            "--welcome", "welcome.html",
-            "--favicon", "static/img/ka_leaf.png",
-            "--publisher", publisher,
-            "--creator", "KhanAcademy.org",
-            "--description", "Khan Academy ({})".format(language),
-            "--description", "Videos from Khan Academy",
-            "--language", language,
-            tmp_dir,
-            dest_file,
+        logger.info("Topic pages unchanged since last run: {}".format(render_topic_pages.pages_unchanged))
+        for step, count in sorted(manifest.fresh.items()):
+            logger.info("Skipped unchanged '{}' steps: {}".format(step, count))
+
+        logger.info("Writing zim file with {}, writing to: {}".format(options.get("writer"), dest_file))
+
+        try:
+            with report.phase(options.get("writer"), python=False) as write_stage:
+                writer.finalize()
+        except WriterError as e:
+            logger.error(e.args[0])
+            raise CommandError("Could not write zim file")
+        if os.path.exists(dest_file):
+            write_stage.add(bytes=os.path.getsize(dest_file))
+        for stage in (static_stage, write_stage):
+            logger.info("Stage {}".format(stage))
+
+        report.save(
+            report_path,
+            language=language,
+            writer=options.get("writer"),
+            transcode2webm=bool(transcode2webm),
+            videos=copy_media.videos_found,
+            decisions=copy_media.decisions,
+            pages=render_topic_pages.pages_rendered,
         )
-
-        process = subprocess.Popen(zimwriterfs_args, stdout=subprocess.PIPE)
-        stdout_data, _stderr_data = process.communicate()
-
-        if process.returncode != 0:
-            logger.error("Error invoking zimwriterfs: {}").format(_stderr_data + stdout_data)
+        logger.info("Wrote report of all phases to {}".format(report_path))
+        if report.profiler:
+            profile_path = os.path.splitext(report_path)[0] + '.prof'
+            logger.info("Wrote profile of the Python phases to {}, top functions:\n{}".format(
+                profile_path, report.dump_profile(profile_path)))
 
         logger.info(
-            "Duration: {h:} hours, {m:} minutes, {s:} seconds".format(
+            "Duration of {l:}: {h:} hours, {m:} minutes, {s:} seconds".format(
+                l=language,
                 h=duration // 3600,
                 m=(duration % 3600) // 60,
                 s=duration % 60,
             )
         )
+        if plan is not None:
+            logger.info("Duration of {} in the plan: {}".format(language, format_duration(plan['estimated_seconds'])))
+
+    def plan_options(self, options):
+        """
+        The options that change the work of an export, a plan can only be
+        executed with the ones it was made with
+        """
+        return OrderedDict([
+            ('download', bool(options.get('download'))),
+            ('transcode2webm', bool(options.get('transcode2webm'))),
+            ('transcode_profile', options.get('transcode_profile') or DEFAULT_PROFILE),
+            ('transcode_height', options.get('transcode_height')),
+            ('transcode_low_height', options.get('transcode_low_height')),
+            ('no_probe', not options.get('probe')),
+            ('writer', options.get('writer')),
+        ])
+
+    def load_plans(self, exports, options):
+        """
+        The plans of the exports in --from-plan, by language
+        """
+        try:
+            plan = load_plan(options['from_plan'])
+        except PlanError as e:
+            raise CommandError(e.args[0])
+        plans = dict((entry['language'], entry) for entry in plan['languages'])
+        if sorted(plans) != sorted(language for language, __, __ in exports):
+            raise CommandError("The plan is for the languages {}".format(", ".join(sorted(plans))))
+        for option, value in self.plan_options(options).items():
+            if plan['options'][option] != value:
+                raise CommandError("The plan was made with another --{}, make it again with --plan".format(
+                    option.replace('_', '-')))
+        logger.info("Executing the plan made {}, estimated to take {}".format(
+            plan['created'], format_duration(plan['estimated_seconds'])))
+        return plans
+
+    def plan_exports(self, exports, transcode_cache, options):
+        """
+        Work out what the exports would do without doing any of it, and
+        write the plan to --plan
+        """
+        from kalite_zim import __name__ as base_path
+        base_path = os.path.abspath(base_path)
+        data_path = options.get('data_dir') or os.path.join(base_path, 'data')
+
+        topic_tree_json, video_ids = self.load_topic_tree(data_path, test=options.get('test'))
+        content_files = DirectoryListing(CONTENT_ROOT)
+        probe_cache = ProbeCache(options.get("cache_dir"))
+        # Estimates go by the reports that earlier runs left for these exports
+        throughput = Throughput(
+            self.report_path(language, tmp_dir, options) for language, __, tmp_dir in exports
+        )
+        logger.info("Estimating durations from {} reports of previous runs".format(throughput.reports))
+        # Media files whose downloads, transcodes and thumbnails are planned
+        # for another language already
+        planned = set()
+        entries = []
+        for language, dest_file, tmp_dir in exports:
+            if os.path.exists(tmp_dir) and os.listdir(tmp_dir) and not (options['clear'] or options['resume']):
+                logger.warning("{} not empty, the export needs -c or -r".format(tmp_dir))
+            entries.append(self.plan_language(
+                language, dest_file, tmp_dir, topic_tree_json, video_ids,
+                content_files, transcode_cache, probe_cache, throughput, planned, options
+            ))
+
+        plan = OrderedDict([
+            ('version', PLAN_VERSION),
+            ('created', datetime.now().isoformat()),
+            ('options', self.plan_options(options)),
+            ('reports', throughput.reports),
+            ('estimated_seconds', round(sum(entry['estimated_seconds'] for entry in entries), 1)),
+            ('estimated_zim_bytes', sum(entry['estimated_zim_bytes'] for entry in entries)),
+            ('languages', entries),
+        ])
+        save_plan(options['plan'], plan)
+
+        for entry in entries:
+            work = entry['work']
+            logger.info(
+                "Plan for {}: {} of {} videos, {} to download, {} to probe, {} to remux, {} to transcode, {} thumbnails "
+                "and {} subtitles to create, {} pages".format(
+                    entry['language'], entry['videos_available'], entry['videos'], work['download']['items'],
+                    work['probe']['items'], work['remux']['items'], work['transcode']['items'],
+                    work['thumbnail']['items'], work['subtitle']['items'], entry['pages'],
+                )
+            )
+            for phase, seconds in entry['phase_seconds'].items():
+                logger.info("Phase {}: {}".format(
+                    phase, format_duration(seconds) if seconds is not None else "no previous run to estimate from"))
+        logger.info("Estimated duration: {}, zim files of about {} MB".format(
+            format_duration(plan['estimated_seconds']), plan['estimated_zim_bytes'] // (1024 * 1024)))
+        logger.info("Wrote plan to {}".format(options['plan']))
+
+    def plan_language(self, language, dest_file, tmp_dir, topic_tree_json, video_ids,
+                      content_files, transcode_cache, probe_cache, throughput, planned, options):
+        """
+        The plan of one export: the work of each phase, counted like
+        copy_media and convert_subtitles would do it, and its duration at the
+        ``throughput`` of previous runs. Videos aren't probed for the plan,
+        those without a probe from an earlier run are planned as transcodes.
+        """
+        from kalite_zim import __name__ as base_path
+        base_path = os.path.abspath(base_path)
+        data_path = options.get('data_dir') or os.path.join(base_path, 'data')
+        transcode2webm = options.get("transcode2webm")
+        renditions = self.video_renditions(options)
+        ffprobe = self.find_ffprobe(options)
+
+        content_cache = self.load_content(language, video_ids, data_path, test=options.get('test'))
+        topic_tree, videos = self.annotate(language, topic_tree_json, content_cache, ExportReport())
+        content_cache = None
+        subtitle_files = DirectoryListing(i18n.get_srt_path(language))
+        subtitle_cache = SubtitleCache(os.path.join(options.get("cache_dir"), 'subtitles'))
+        manifest = BuildManifest(tmp_dir + '.manifest.json')
+        if not options['resume']:
+            # Nothing of a previous run is reused
+            manifest.steps = {}
+
+        work = OrderedDict(
+            (phase, phase_work())
+            for phase in ('annotate', 'probe', 'download', 'link', 'remux', 'transcode', 'thumbnail', 'subtitle',
+                          'render', options.get("writer"))
+        )
+        work['annotate']['items'] = len(topic_tree.nodes)
+        # The files of the listings that the export will look for
+        files = OrderedDict([('content', []), ('subtitles', [])])
+        # Downloads are guessed to be as large as the videos that are there
+        sizes = [content_files.size(node.id + '.' + node.format) for node in videos]
+        sizes = [size for size in sizes if size is not None]
+        download_size = sum(sizes) // len(sizes) if sizes else 0
+        transcode_ratio = throughput.ratio('transcode', 'bytes_written', 'bytes_read') or 1.0
+        videos_available = 0
+        media_bytes = 0
+
+        for node in videos:
+            video_file_name = node.id + '.' + node.format
+            thumb_file_name = node.id + '.png'
+            subtitle_name = node.id + '.srt'
+            video_signature = content_files.signature(video_file_name)
+            if video_signature is not None:
+                files['content'].append(video_file_name)
+                size = video_signature[0]
+            elif options['download']:
+                size = download_size
+                if video_file_name not in planned:
+                    work['download']['items'] += 1
+                    work['download']['bytes_written'] += size
+            else:
+                continue
+            node.available = True
+            videos_available += 1
+
+            probe = None
+            if ffprobe:
+                probe = video_signature and probe_cache.get(content_files.join(video_file_name), video_signature)
+                if not probe and video_file_name not in planned:
+                    work['probe']['items'] += 1
+
+            if transcode2webm:
+                # Only sources hashed by earlier runs can be found in the
+                # cache without reading them
+                digest = video_signature and transcode_cache.known_hash(content_files.join(video_file_name))
+                actions = self.video_actions(probe, renditions, options)
+            else:
+                actions = OrderedDict([('', (LINK, node.format, None))])
+            for suffix, (decision, extension, args) in actions.items():
+                if decision == LINK:
+                    work['link']['items'] += 1
+                    media_bytes += size
+                    continue
+                video_file_dest = os.path.join(tmp_dir, node.path, node.id + suffix + '.' + extension)
+                transcode_inputs = {
+                    'src': video_signature,
+                    'args': data_signature(args),
+                }
+                cache_path = digest and transcode_cache.path(transcode_cache.key(None, args, digest=digest))
+                if manifest.is_fresh('transcode', node.path + suffix, transcode_inputs, [video_file_dest]):
+                    media_bytes += os.path.getsize(video_file_dest)
+                elif cache_path and os.path.isfile(cache_path):
+                    media_bytes += os.path.getsize(cache_path)
+                else:
+                    # Remuxing keeps the streams as they are
+                    output_size = size if decision == REMUX else int(size * transcode_ratio)
+                    if video_file_name not in planned:
+                        work[decision]['items'] += 1
+                        work[decision]['bytes_read'] += size
+                        work[decision]['bytes_written'] += output_size
+                    media_bytes += output_size
+
+            # Downloaded videos come with their thumbnails
+            if thumb_file_name in content_files:
+                files['content'].append(thumb_file_name)
+                media_bytes += content_files.size(thumb_file_name)
+            elif (video_signature is not None and video_file_name not in planned and
+                    not manifest.is_fresh('thumbnail', node.path, {'src': video_signature})):
+                work['thumbnail']['items'] += 1
+
+            if subtitle_name in subtitle_files:
+                files['subtitles'].append(subtitle_name)
+                media_bytes += subtitle_files.size(subtitle_name)
+                subtitle_inputs = {'src': subtitle_files.signature(subtitle_name)}
+                outputs = manifest.outputs('subtitle', node.path)
+                if (not manifest.is_fresh('subtitle', node.path, subtitle_inputs, outputs) and
+                        not subtitle_cache.get(srt_key(subtitle_files.join(subtitle_name)))):
+                    work['subtitle']['items'] += 1
+            planned.add(video_file_name)
+
+        # Every page of the pruned tree is counted, also those that --resume
+        # might find unchanged
+        TreeWalk().visit('prune', leave=prune_tree).run(topic_tree.root)
+        pages = TreeWalk().run(topic_tree.root).nodes
+        work['render'].update(
+            items=pages,
+            bytes_written=int(pages * (throughput.ratio('render', 'bytes_written', 'items') or 0)),
+        )
+        # Videos are stored as they are, the pages get compressed but are
+        # counted in full
+        work[options.get("writer")]['bytes_written'] = media_bytes + work['render']['bytes_written']
+
+        phase_seconds = throughput.estimate(work)
+        return OrderedDict([
+            ('language', language),
+            ('dest_file', dest_file),
+            ('tmp_dir', tmp_dir),
+            ('nodes', len(topic_tree.nodes)),
+            ('videos', len(videos)),
+            ('videos_available', videos_available),
+            ('pages', pages),
+            ('work', work),
+            ('phase_seconds', phase_seconds),
+            ('estimated_seconds', round(sum(seconds for seconds in phase_seconds.values() if seconds), 1)),
+            ('estimated_zim_bytes', work[options.get("writer")]['bytes_written']),
+            ('files', files),
+        ])
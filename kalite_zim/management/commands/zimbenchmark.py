@@ -0,0 +1,209 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from collections import OrderedDict
+from optparse import make_option
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from kalite_zim.benchmark import SCENARIOS, compare, generate_dataset, summarize
+from kalite_zim.pipeline import run_processes
+
+
+DEFAULT_WORK_DIR = os.path.join(tempfile.gettempdir(), 'ka-lite-zim_benchmark')
+
+
+class Command(BaseCommand):
+    args = ('[scenario ...]')
+    help = (  # @ReservedAssignment
+        'Benchmark export2zim on synthetic topic trees, with stand-ins for ffmpeg and zimwriterfs. '
+        'Scenarios: {}, or "custom" with --depth, --fanout and --videos'.format(", ".join(SCENARIOS.keys()))
+    )
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--work-dir',
+            action='store',
+            dest='work_dir',
+            default=DEFAULT_WORK_DIR,
+            help="Directory for the data sets, exports and results, data sets are reused between runs"
+        ),
+        make_option(
+            '--depth',
+            action='store',
+            dest='depth',
+            type='int',
+            default=3,
+            help="Levels of topics of the custom scenario"
+        ),
+        make_option(
+            '--fanout',
+            action='store',
+            dest='fanout',
+            type='int',
+            default=10,
+            help="Subtopics of each topic of the custom scenario"
+        ),
+        make_option(
+            '--videos',
+            action='store',
+            dest='videos',
+            type='int',
+            default=8,
+            help="Videos in each topic of the last level of the custom scenario"
+        ),
+        make_option(
+            '--baseline',
+            action='store',
+            dest='baseline',
+            default=None,
+            help="JSON file with the results to compare with, by default baseline.json in the work dir"
+        ),
+        make_option(
+            '--save-baseline',
+            action='store_true',
+            dest='save_baseline',
+            default=False,
+            help="Store the results as the new baseline"
+        ),
+        make_option(
+            '--tolerance',
+            action='store',
+            dest='tolerance',
+            type='int',
+            default=25,
+            help="Percentage a phase may be slower or use more memory than in the baseline"
+        ),
+        make_option(
+            '--transcode2webm',
+            action='store_true',
+            dest='transcode2webm',
+            default=False,
+            help="Include transcoding in the export"
+        ),
+        make_option(
+            '--render-jobs',
+            action='store',
+            dest='render_jobs',
+            type='int',
+            default=1,
+            help='Number of processes rendering topic pages'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        scenarios = list(args) or ['1k']
+        for scenario in scenarios:
+            if scenario not in SCENARIOS and scenario != 'custom':
+                raise CommandError("Unknown scenario: {}".format(scenario))
+
+        work_dir = os.path.abspath(options['work_dir'])
+        baseline_path = options['baseline'] or os.path.join(work_dir, 'baseline.json')
+        try:
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+        except (IOError, ValueError):
+            baseline = {}
+
+        results = OrderedDict()
+        for scenario in scenarios:
+            if scenario == 'custom':
+                depth, fanout, videos, exercises = options['depth'], options['fanout'], options['videos'], 1
+            else:
+                depth, fanout, videos, exercises = SCENARIOS[scenario]
+            scenario_dir = os.path.join(work_dir, scenario)
+            dataset_dir = os.path.join(scenario_dir, 'dataset')
+            if not os.path.isdir(dataset_dir):
+                os.makedirs(dataset_dir)
+            self.stdout.write("Generating data set for {}...\n".format(scenario))
+            dataset = generate_dataset(dataset_dir, depth, fanout, videos, exercises)
+
+            self.stdout.write("Exporting {} ({} nodes)...\n".format(scenario, dataset['nodes']))
+            report_path = os.path.join(scenario_dir, 'report.json')
+            if os.path.exists(report_path):
+                os.unlink(report_path)
+            start = time.time()
+            # Each export gets a process of its own, so its peak memory usage
+            # isn't that of an earlier scenario
+            for __, error in run_processes([(scenario, self.export, (scenario_dir, options))]):
+                if error:
+                    raise CommandError("Export of {} failed:\n{}".format(scenario, error))
+            with open(report_path) as f:
+                report = json.load(f)
+            results[scenario] = OrderedDict([
+                ('nodes', dataset['nodes']),
+                ('total_seconds', round(time.time() - start, 3)),
+                ('phases', summarize(report)),
+            ])
+            self.write_result(scenario, results[scenario], baseline.get(scenario))
+
+        with open(os.path.join(work_dir, 'results.json'), 'w') as f:
+            json.dump(results, f, indent=2)
+
+        if options['save_baseline']:
+            baseline.update(results)
+            with open(baseline_path, 'w') as f:
+                json.dump(baseline, f, indent=2)
+            self.stdout.write("Saved baseline to {}\n".format(baseline_path))
+            return
+
+        regressions = compare(results, baseline, tolerance=options['tolerance'] / 100.0)
+        for scenario, phase, metric, before, after in regressions:
+            self.stdout.write("Regression in {} {}: {} went from {} to {}\n".format(
+                scenario, phase, metric, before, after))
+        if regressions:
+            raise CommandError("{} phases regressed compared to {}".format(len(regressions), baseline_path))
+
+    def export(self, scenario_dir, options):
+        """
+        Export the data set of a scenario, runs in a process of its own
+        """
+        from kalite_zim.management.commands import export2zim
+        from kalite_zim.utils import logger
+
+        dataset_dir = os.path.join(scenario_dir, 'dataset')
+        os.environ['PATH'] = os.path.join(dataset_dir, 'bin') + os.pathsep + os.environ.get('PATH', '')
+        # Videos and thumbnails come from the data set instead of KA Lite
+        export2zim.CONTENT_ROOT = os.path.join(dataset_dir, 'content')
+        # Logging every video and page would be measured too
+        logger.setLevel(logging.WARNING)
+
+        cache_dir = os.path.join(scenario_dir, 'cache')
+        if os.path.exists(cache_dir):
+            shutil.rmtree(cache_dir)
+        call_command(
+            'export2zim',
+            os.path.join(scenario_dir, 'out.zim'),
+            language='en',
+            test=True,
+            data_dir=dataset_dir,
+            tmp_dir=os.path.join(scenario_dir, 'tmp'),
+            clear=True,
+            report=os.path.join(scenario_dir, 'report.json'),
+            transcode2webm=options['transcode2webm'],
+            cache_dir=cache_dir,
+            render_jobs=options['render_jobs'],
+        )
+
+    def write_result(self, scenario, result, baseline=None):
+        self.stdout.write("{}: {} nodes in {:.1f}s\n".format(scenario, result['nodes'], result['total_seconds']))
+        for phase, values in result['phases'].items():
+            line = "  {:<12} {:>9.2f}s wall".format(phase, values['wall_seconds'])
+            if values['cpu_seconds'] is not None:
+                line += " {:>9.2f}s CPU".format(values['cpu_seconds'])
+            if values.get('items') and values['wall_seconds']:
+                line += " {:>8.2f} ms/item".format(1000 * values['wall_seconds'] / values['items'])
+            if values['peak_rss'] is not None:
+                line += " {:>8.1f} MB".format(values['peak_rss'] / (1024.0 * 1024.0))
+            before = baseline and baseline['phases'].get(phase)
+            if before and before['wall_seconds']:
+                line += " ({:+.0%} vs. baseline)".format(values['wall_seconds'] / before['wall_seconds'] - 1)
+            self.stdout.write(line + "\n")
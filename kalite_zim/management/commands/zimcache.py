@@ -0,0 +1,51 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kalite_zim.cache import DEFAULT_CACHE_DIR, TranscodeCache
+
+
+class Command(BaseCommand):
+    args = ('stats|prune')
+    help = 'Show statistics for or prune the transcode cache used by export2zim'  # @ReservedAssignment
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--cache-dir',
+            action='store',
+            dest='cache_dir',
+            default=DEFAULT_CACHE_DIR,
+            help="Directory of the transcode cache"
+        ),
+        make_option(
+            '--max-size',
+            action='store',
+            dest='max_size',
+            type='int',
+            default=None,
+            help="Evict least recently used transcodes until they take no more than this many MB"
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1 or args[0] not in ('stats', 'prune'):
+            raise CommandError("Takes exactly 1 argument: stats or prune")
+
+        cache = TranscodeCache(options.get('cache_dir'))
+
+        if args[0] == 'prune':
+            max_size = options.get('max_size')
+            if max_size is None:
+                raise CommandError("Specify the size to prune to with --max-size")
+            removed, freed = cache.prune(max_size * 1024 * 1024)
+            cache.save()
+            self.stdout.write("Removed {} entries, freed {} MB\n".format(removed, freed // (1024 * 1024)))
+
+        stats = cache.stats()
+        self.stdout.write("Cache directory: {}\n".format(stats['cache_dir']))
+        self.stdout.write("Entries: {}\n".format(stats['entries']))
+        self.stdout.write("Size: {} MB\n".format(stats['size'] // (1024 * 1024)))
+        self.stdout.write("Known source files: {}\n".format(stats['sources']))
@@ -0,0 +1,115 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+import hashlib
+import json
+import os
+
+
+MANIFEST_VERSION = 1
+
+
+def file_signature(path):
+    """
+    Cheap signature of a file, changes when the file is replaced or
+    modified. Returns None for files that don't exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime]
+
+
+def data_signature(data):
+    """
+    Signature of any JSON serializable data structure
+    """
+    return hashlib.sha1(
+        json.dumps(data, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+
+
+def tree_signature(*dirs):
+    """
+    Signature of all the files in a number of directories
+    """
+    signatures = []
+    for directory in dirs:
+        for root, dirnames, filenames in os.walk(directory):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(root, filename)
+                signatures.append([path, file_signature(path)])
+    return data_signature(signatures)
+
+
+class BuildManifest(object):
+    """
+    Remembers the inputs and outputs of every step that was applied to every
+    node in a previous build. A step is fresh and can be skipped if its inputs
+    still have the same signatures and all of its outputs still exist.
+
+    ``inputs`` are dicts of JSON serializable signatures (see
+    ``file_signature`` and ``data_signature``), ``outputs`` are lists of
+    paths.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.steps = {}
+        try:
+            data = json.load(open(path))
+            if data.get('version') == MANIFEST_VERSION:
+                self.steps = data['steps']
+        except (IOError, ValueError):
+            pass
+        self.fresh = {}
+        self.dirty = {}
+        self.touched = set()
+
+    def has(self, step, key):
+        return key in self.steps.get(step, {})
+
+    def is_fresh(self, step, key, inputs, outputs=()):
+        self.touched.add((step, key))
+        record = self.steps.get(step, {}).get(key)
+        fresh = (
+            record is not None and
+            record['inputs'] == inputs and
+            sorted(record['outputs']) == sorted(outputs) and
+            all(os.path.exists(path) for path in outputs)
+        )
+        counter = self.fresh if fresh else self.dirty
+        counter[step] = counter.get(step, 0) + 1
+        return fresh
+
+    def record(self, step, key, inputs, outputs=()):
+        self.touched.add((step, key))
+        self.steps.setdefault(step, {})[key] = {
+            'inputs': inputs,
+            'outputs': list(outputs),
+        }
+
+    def discard(self, step, key):
+        self.steps.get(step, {}).pop(key, None)
+
+    def untouched(self, step):
+        """
+        Keys of a step that were recorded in a previous run but haven't been
+        looked at in this one, i.e. nodes that disappeared from the tree.
+        """
+        return [
+            key for key in self.steps.get(step, {})
+            if (step, key) not in self.touched
+        ]
+
+    def outputs(self, step, key):
+        return self.steps.get(step, {}).get(key, {}).get('outputs', [])
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'steps': self.steps}, f)
+        os.rename(tmp_path, self.path)
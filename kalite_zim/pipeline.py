@@ -0,0 +1,206 @@
+"""
+Helpers for running the media steps of an export as overlapping stages, and
+whole exports side by side.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+import collections
+import heapq
+import multiprocessing
+import threading
+import time
+import traceback
+
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+
+class StageCounter(object):
+    """
+    Counts the items and bytes that went through a stage, the wall time
+    between its first and last item, and the time of the items added with
+    the ``seconds`` they took summed up as ``busy``, which unlike the wall
+    time doesn't include the work of the stages it overlaps with.
+
+    Stages that are timed as a whole (see ``kalite_zim.report``) have their
+    wall and CPU time in ``elapsed`` and ``cpu`` instead, and the peak memory
+    usage of the process once they ended in ``peak_rss``. Items added with
+    the ``seconds`` they took are ranked, keeping the ``slowest`` of them.
+    """
+
+    def __init__(self, name, slowest=10):
+        self.name = name
+        self.items = 0
+        self.bytes = 0
+        self.bytes_read = 0
+        self.first = None
+        self.last = None
+        self.busy = 0.0
+        self.elapsed = None
+        self.cpu = None
+        self.peak_rss = None
+        self.slowest_count = slowest
+        # Heap of (seconds, item) with the fastest of the slowest on top
+        self._slowest = []
+        self._lock = threading.Lock()
+
+    def add(self, items=1, bytes=0, bytes_read=0, item=None, seconds=None):  # @ReservedAssignment
+        now = time.time()
+        with self._lock:
+            self.items += items
+            self.bytes += bytes
+            self.bytes_read += bytes_read
+            if self.first is None:
+                self.first = now
+            self.last = now
+            if seconds is not None:
+                self.busy += seconds
+            if item is not None and seconds is not None and self.slowest_count:
+                if len(self._slowest) < self.slowest_count:
+                    heapq.heappush(self._slowest, (seconds, item))
+                else:
+                    heapq.heappushpop(self._slowest, (seconds, item))
+
+    @property
+    def seconds(self):
+        if self.elapsed is not None:
+            return self.elapsed
+        if self.first is None:
+            return 0.0
+        return self.last - self.first
+
+    @property
+    def slowest(self):
+        """
+        List of ``(seconds, item)``, slowest first
+        """
+        return sorted(self._slowest, reverse=True)
+
+    def as_dict(self):
+        return OrderedDict([
+            ('name', self.name),
+            ('items', self.items),
+            ('bytes_read', self.bytes_read),
+            ('bytes_written', self.bytes),
+            ('wall_seconds', round(self.seconds, 3)),
+            ('busy_seconds', round(self.busy, 3)),
+            ('cpu_seconds', round(self.cpu, 3) if self.cpu is not None else None),
+            ('peak_rss', self.peak_rss),
+            ('slowest', [
+                OrderedDict([('item', item), ('seconds', round(seconds, 3))])
+                for seconds, item in self.slowest
+            ]),
+        ])
+
+    def __str__(self):
+        seconds = self.seconds
+        megabytes = self.bytes / (1024.0 * 1024.0)
+        text = "{}: {} items, {:.1f} MB in {:.1f}s".format(self.name, self.items, megabytes, seconds)
+        if seconds > 0:
+            text += " ({:.2f} items/s, {:.2f} MB/s)".format(self.items / seconds, megabytes / seconds)
+        if self.cpu is not None:
+            text += ", {:.1f}s CPU".format(self.cpu)
+        return text
+
+
+def prefetch(items, fetch, depth=8, jobs=1):
+    """
+    Yields ``(item, fetch(item))`` for all ``items`` in their original order.
+
+    ``fetch`` runs on ``jobs`` background threads while the caller processes
+    the items already fetched, but never more than ``depth`` items ahead of
+    the caller, so what's been fetched and not yet processed stays bounded.
+    """
+    slots = threading.Semaphore(depth)
+    stopped = threading.Event()
+
+    def throttled():
+        for item in items:
+            slots.acquire()
+            if stopped.is_set():
+                return
+            yield item
+
+    def fetch_item(item):
+        return item, fetch(item)
+
+    def unblock():
+        # Lets the producer run into the stopped flag if it's waiting for a
+        # slot, the pool can't shut down before that
+        stopped.set()
+        for __ in range(depth + jobs):
+            slots.release()
+
+    pool = ThreadPool(jobs)
+    try:
+        for result in pool.imap(fetch_item, throttled()):
+            yield result
+            slots.release()
+        pool.close()
+    except (Exception, KeyboardInterrupt, GeneratorExit):
+        unblock()
+        pool.terminate()
+        raise
+    finally:
+        unblock()
+        pool.join()
+
+
+def _run_task(conn, func, args):
+    try:
+        func(*args)
+    except (Exception, KeyboardInterrupt):
+        conn.send(traceback.format_exc())
+    else:
+        conn.send(None)
+    conn.close()
+
+
+def run_processes(tasks, jobs=1, poll_interval=0.1):
+    """
+    Run ``tasks``, a list of ``(name, func, args)``, each in its own process
+    with at most ``jobs`` at the same time, and in the order they are listed.
+
+    Yields ``(name, error)`` as the tasks finish, ``error`` is the traceback
+    of a task that raised and None otherwise. Unlike the workers of a
+    ``multiprocessing.Pool``, the processes may start pools of their own.
+    """
+    pending = collections.deque(tasks)
+    # (name, process, connection the result is received on)
+    running = []
+    try:
+        while pending or running:
+            while pending and len(running) < jobs:
+                name, func, args = pending.popleft()
+                receiver, sender = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(target=_run_task, args=(sender, func, args))
+                process.start()
+                # Only the child has the sending end now, so the receiver
+                # sees the end of the pipe if it dies without a result
+                sender.close()
+                running.append((name, process, receiver))
+            finished = [task for task in running if task[2].poll()]
+            if not finished:
+                time.sleep(poll_interval)
+                continue
+            for task in finished:
+                name, process, receiver = task
+                try:
+                    error = receiver.recv()
+                except EOFError:
+                    error = None
+                receiver.close()
+                process.join()
+                if error is None and process.exitcode != 0:
+                    error = "Process exited with code {}".format(process.exitcode)
+                running.remove(task)
+                yield name, error
+    except (Exception, KeyboardInterrupt, GeneratorExit):
+        for __, process, __ in running:
+            process.terminate()
+        raise
+    finally:
+        for __, process, __ in running:
+            process.join()
@@ -0,0 +1,150 @@
+"""
+Plans of exports, written by ``export2zim --plan`` without touching any
+media: the work every phase has to do, and how long that takes at the
+throughput of previous runs, as recorded in their reports (see
+``kalite_zim.report``). ``export2zim --from-plan`` executes a plan with the
+availability of the media files it recorded, instead of scanning for them
+again.
+
+The work of a phase is counted like in a report, as ``items``,
+``bytes_read`` and ``bytes_written``. How long it takes is estimated from
+one of them, see ``PHASE_UNITS``.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+import json
+import os
+
+from collections import OrderedDict
+
+
+PLAN_VERSION = 2
+
+# What the duration of each phase depends on, the other phases of a report
+# take little time
+PHASE_UNITS = OrderedDict([
+    ('annotate', 'items'),
+    ('probe', 'items'),
+    ('download', 'bytes_written'),
+    ('link', 'items'),
+    ('remux', 'bytes_read'),
+    ('transcode', 'bytes_read'),
+    ('thumbnail', 'items'),
+    ('subtitle', 'items'),
+    ('render', 'items'),
+    ('zimwriterfs', 'bytes_written'),
+    ('libzim', 'bytes_written'),
+])
+
+
+class PlanError(Exception):
+    pass
+
+
+def phase_work(items=0, bytes_read=0, bytes_written=0):  # @ReservedAssignment
+    return OrderedDict([
+        ('items', items),
+        ('bytes_read', bytes_read),
+        ('bytes_written', bytes_written),
+    ])
+
+
+def report_seconds(phase):
+    """
+    The time a phase of a report took. Stages that overlap with others in
+    the media phase aren't timed as a whole and have no CPU time, their wall
+    time from the first to the last item includes the work of the other
+    stages, so the time their items took is used instead.
+    """
+    if phase.get('cpu_seconds') is None and phase.get('busy_seconds') is not None:
+        return phase['busy_seconds']
+    return phase.get('wall_seconds') or 0.0
+
+
+class Throughput(object):
+    """
+    The work done and the time of each phase, summed over the reports of
+    previous runs
+    """
+
+    def __init__(self, report_paths=()):
+        # phase name -> work and 'seconds'
+        self.phases = {}
+        self.reports = 0
+        for path in report_paths:
+            self.add_report(path)
+
+    def add_report(self, path):
+        """
+        Returns False if there is no readable report at ``path``
+        """
+        try:
+            report = json.load(open(path))
+        except (IOError, ValueError):
+            return False
+        for phase in report.get('phases', []):
+            totals = self.phases.setdefault(phase['name'], dict(phase_work(), seconds=0.0))
+            for key in phase_work():
+                totals[key] += phase.get(key) or 0
+            totals['seconds'] += report_seconds(phase)
+        self.reports += 1
+        return True
+
+    def rate(self, phase):
+        """
+        Work per second of a phase in its unit, or None if no previous run
+        did any
+        """
+        totals = self.phases.get(phase)
+        unit = PHASE_UNITS.get(phase)
+        if not totals or not unit or not totals[unit] or not totals['seconds']:
+            return None
+        return totals[unit] / totals['seconds']
+
+    def ratio(self, phase, numerator, denominator):
+        """
+        Ratio of two totals of a phase, e.g. the bytes written per item, or
+        None if unknown
+        """
+        totals = self.phases.get(phase)
+        if not totals or not totals[denominator]:
+            return None
+        return float(totals[numerator]) / totals[denominator]
+
+    def estimate(self, work):
+        """
+        Dict of phases to the seconds their ``work`` is estimated to take,
+        None for phases without a previous run to go by
+        """
+        estimates = OrderedDict()
+        for phase, amounts in work.items():
+            unit = PHASE_UNITS.get(phase)
+            if not unit or not amounts.get(unit):
+                continue
+            rate = self.rate(phase)
+            estimates[phase] = round(amounts[unit] / rate, 1) if rate else None
+        return estimates
+
+
+def save_plan(path, plan):
+    tmp_path = path + '.{}.tmp'.format(os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(plan, f, indent=2)
+    os.rename(tmp_path, path)
+
+
+def load_plan(path):
+    try:
+        plan = json.load(open(path))
+    except (IOError, ValueError) as e:
+        raise PlanError("Could not read plan {}: {}".format(path, e))
+    if plan.get('version') != PLAN_VERSION:
+        raise PlanError("Plan {} was made by another version, make it again with --plan".format(path))
+    return plan
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return "{} hours, {} minutes, {} seconds".format(seconds // 3600, (seconds % 3600) // 60, seconds % 60)
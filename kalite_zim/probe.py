@@ -0,0 +1,204 @@
+"""
+Probing of the source videos with ffprobe. Their codecs, bitrate and
+resolution decide whether a video can go into the zim file as it is, only
+needs another container, or has to be transcoded, and its resolution sizes
+the player on its topic page.
+
+Probes are cached by the size and modification time of the file, like the
+source hashes of the transcode cache, so unchanged videos are only probed
+once.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+import json
+import os
+import subprocess
+import threading
+
+from collections import OrderedDict
+
+from kalite_zim.cache import save_index
+from kalite_zim.transcode import LOW_SUFFIX, PROFILES, remux_args
+
+
+LINK = 'link'
+REMUX = 'remux'
+TRANSCODE = 'transcode'
+DECISIONS = (LINK, REMUX, TRANSCODE)
+
+# Video codecs that Kiwix and browsers play, by the container they are
+# played in, and the audio codecs that go with them
+WEB_CONTAINERS = {'h264': 'mp4', 'vp8': 'webm', 'vp9': 'webm'}
+WEB_AUDIO = {'mp4': ('aac', 'mp3'), 'webm': ('vorbis', 'opus')}
+
+# Allowed for the audio on top of the video bitrate of a transcode profile,
+# sources up to the sum are kept as they are
+AUDIO_BITRATE = 128
+
+# The size of the player when a video wasn't probed, also the widest it gets
+PLAYER_WIDTH = 640
+PLAYER_HEIGHT = 360
+
+
+class ProbeError(Exception):
+    pass
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_probe(output):
+    """
+    The properties of a video that matter here from the JSON output of
+    ffprobe: its container names, codecs, resolution, duration in seconds
+    and bitrate in kbit/s
+    """
+    data = json.loads(output)
+    streams = data.get('streams') or []
+    file_format = data.get('format') or {}
+    video = next((stream for stream in streams if stream.get('codec_type') == 'video'), {})
+    audio = next((stream for stream in streams if stream.get('codec_type') == 'audio'), {})
+    try:
+        duration = float(file_format['duration'])
+    except (KeyError, TypeError, ValueError):
+        duration = None
+    bitrate = _int(file_format.get('bit_rate'))
+    if bitrate is None and duration and _int(file_format.get('size')):
+        bitrate = int(_int(file_format['size']) * 8 / duration)
+    return {
+        'container': (file_format.get('format_name') or '').split(','),
+        'video_codec': video.get('codec_name'),
+        'audio_codec': audio.get('codec_name'),
+        'width': _int(video.get('width')),
+        'height': _int(video.get('height')),
+        'duration': duration,
+        'bitrate': bitrate // 1000 if bitrate else None,
+    }
+
+
+def probe_video(ffprobe, path):
+    cmd = [ffprobe, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout_data, stderr_data = process.communicate()
+    if process.returncode != 0:
+        raise ProbeError("Could not probe {}: {}".format(path, (stderr_data or b"").decode('utf-8', 'replace')))
+    try:
+        return parse_probe(stdout_data.decode('utf-8'))
+    except ValueError as e:
+        raise ProbeError("Could not read the probe of {}: {}".format(path, e))
+
+
+class ProbeCache(object):
+    """
+    Probes of video files by their path, valid as long as their size and
+    modification time don't change. Used from several threads at once.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.index_path = os.path.join(self.cache_dir, 'probes.json')
+        try:
+            self._probes = json.load(open(self.index_path))
+        except (IOError, ValueError):
+            self._probes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, signature):
+        """
+        The probe of the file with ``signature`` (see
+        ``manifest.file_signature``), or None
+        """
+        with self._lock:
+            cached = self._probes.get(os.path.abspath(path))
+            if cached and signature and cached[:2] == list(signature):
+                self.hits += 1
+                return cached[2]
+            self.misses += 1
+            return None
+
+    def put(self, path, signature, probe):
+        with self._lock:
+            self._probes[os.path.abspath(path)] = list(signature) + [probe]
+
+    def save(self):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        with self._lock:
+            # Merged with the probes other exports saved in the meantime
+            self._probes = save_index(self.index_path, self._probes)
+
+
+def max_bitrate(profile):
+    """
+    The highest bitrate in kbit/s of videos that aren't transcoded with
+    ``profile``
+    """
+    return PROFILES[profile]['bitrate'] + AUDIO_BITRATE
+
+
+def decide(probe, bitrate, height=None):
+    """
+    Whether a video with ``probe`` can be linked as it is, only needs to be
+    remuxed into the container its codecs are played in, or has to be
+    transcoded because of its codecs, a bitrate above ``bitrate`` or, with
+    ``height``, a higher resolution. Videos that weren't probed are
+    transcoded.
+    """
+    if not probe:
+        return TRANSCODE
+    container = WEB_CONTAINERS.get(probe['video_codec'])
+    if container is None:
+        return TRANSCODE
+    if probe['audio_codec'] and probe['audio_codec'] not in WEB_AUDIO[container]:
+        return TRANSCODE
+    if not probe['bitrate'] or probe['bitrate'] > bitrate:
+        return TRANSCODE
+    if height and (not probe['height'] or probe['height'] > height):
+        return TRANSCODE
+    if container in probe['container']:
+        return LINK
+    return REMUX
+
+
+def rendition_actions(probe, renditions, bitrate, height=None, low_height=None):
+    """
+    What to do for each of the ``renditions`` of a video, by their suffix:
+    ``(decision, file extension, ffmpeg arguments)``. The main rendition is
+    decided by ``decide``, the low resolution one is left out when the
+    video isn't any higher than it anyway.
+    """
+    decision = decide(probe, bitrate, height)
+    actions = OrderedDict()
+    if decision == TRANSCODE:
+        actions[''] = (TRANSCODE, 'webm', renditions[''])
+    else:
+        container = WEB_CONTAINERS[probe['video_codec']]
+        actions[''] = (decision, container, remux_args(container) if decision == REMUX else None)
+    if LOW_SUFFIX in renditions:
+        if not (probe and probe['height'] and low_height and probe['height'] <= low_height):
+            actions[LOW_SUFFIX] = (TRANSCODE, 'webm', renditions[LOW_SUFFIX])
+    return actions
+
+
+def display_size(probe, height=None, max_width=PLAYER_WIDTH):
+    """
+    ``(width, height)`` of the player for a video with ``probe``, once it's
+    scaled down to ``height`` and no wider than ``max_width``. The default
+    size of the player if the video wasn't probed.
+    """
+    if not probe or not probe.get('width') or not probe.get('height'):
+        return PLAYER_WIDTH, PLAYER_HEIGHT
+    width, video_height = float(probe['width']), float(probe['height'])
+    if height and video_height > height:
+        width, video_height = width * height / video_height, height
+    if width > max_width:
+        width, video_height = max_width, video_height * max_width / width
+    return int(round(width)), int(round(video_height))
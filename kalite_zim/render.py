@@ -0,0 +1,194 @@
+"""
+Rendering of topic pages, either in the current process or split across a
+pool of worker processes.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+import multiprocessing
+import time
+import traceback
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils import translation
+
+from kalite import i18n
+
+
+# What a worker renders, installed once by _init_worker instead of having
+# the tree pickled for every chunk
+_nodes = []
+_topic_tree = None
+
+# Menu fragments by topic id, see precompile_menus
+_menus = {}
+
+# Rendered in place of the active state of each menu item
+MENU_MARKER = '\x00'
+
+# SCSS file of the pages' stylesheet, relative to the static directory
+STYLESHEET_SOURCE = 'bootstrap/_kalite_zim.scss'
+
+
+def stylesheet_init(stylesheet):
+    """
+    Use the compiled stylesheet at ``stylesheet``, relative to the static
+    directory, in rendered pages
+    """
+    settings.KALITE_ZIM_STYLESHEET = stylesheet
+
+
+def topic_parents(topic_tree, node):
+    """
+    The node itself if it has children, and all of its ancestors
+    """
+    parents = [node] if node.children else []
+    return parents + topic_tree.ancestors(node)
+
+
+class MenuFragment(object):
+    """
+    The rendered menu of a topic's children, with the offsets where the
+    active state of each child goes.
+    """
+
+    def __init__(self, html, offsets):
+        self.html = html
+        self.offsets = offsets
+
+    @classmethod
+    def render(cls, node):
+        html = render_to_string("kalite_zim/menu.html", {"parent": node, "marker": MENU_MARKER}).rstrip()
+        parts = html.split(MENU_MARKER)
+        offsets = {}
+        offset = 0
+        for child, part in zip(node.children, parts):
+            offset += len(part)
+            offsets[child.id] = offset
+        return cls("".join(parts), offsets)
+
+    def active(self, child_id):
+        offset = self.offsets.get(child_id)
+        if offset is None:
+            return self.html
+        return self.html[:offset] + ' class="active"' + self.html[offset:]
+
+
+def precompile_menus(topic_tree):
+    """
+    Render the menu of every topic with children once, so pages only have to
+    mark the active item in the menus of their parents.
+    """
+    _menus.clear()
+    for node in topic_tree.nodes:
+        if node.children:
+            _menus[node.id] = MenuFragment.render(node)
+    return _menus
+
+
+def topic_menus(topic_tree, node, parents):
+    """
+    The menus shown on a page from the top level down, each with the item
+    on the way to ``node`` marked active
+    """
+    # The child of each parent that's on the way down to node
+    active = {}
+    for path_node in [node] + parents:
+        if path_node.parent_index is not None:
+            active[path_node.parent_index] = path_node.id
+    menus = []
+    for parent in reversed(parents):
+        fragment = _menus.get(parent.id)
+        if fragment is None:
+            fragment = _menus[parent.id] = MenuFragment.render(parent)
+        menus.append({
+            "depth": parent.depth,
+            "html": fragment.active(active.get(parent.index)),
+        })
+    return menus
+
+
+def render_topic_page(node, topic_tree):
+    """
+    HTML of a topic or video page, must be called in the translate block of
+    the language being exported
+    """
+    parents = topic_parents(topic_tree, node)
+    template_context = {
+        "topic_tree": topic_tree.root,
+        "topic": node,
+        "parents": parents,
+        "menus": topic_menus(topic_tree, node, parents),
+    }
+    topic_html = render_to_string("kalite_zim/topic.html", template_context)
+    # Replace absolute references to '/static' with relative
+    return topic_html.replace("/static", "static")
+
+
+def _init_worker(language, stylesheet, nodes, topic_tree, menus):
+    global _nodes, _topic_tree
+    # Stays in the language for the life of the worker, like translate_block
+    # without leaving it
+    translation.activate(i18n.lcode_to_django_lang(language))
+    stylesheet_init(stylesheet)
+    _nodes = nodes
+    _topic_tree = topic_tree
+    _menus.update(menus)
+
+
+def _render(node, topic_tree):
+    start = time.time()
+    try:
+        return render_topic_page(node, topic_tree), None, time.time() - start
+    except Exception:
+        return None, traceback.format_exc(), time.time() - start
+
+
+def _render_chunk(indexes):
+    return [(index,) + _render(_nodes[index], _topic_tree) for index in indexes]
+
+
+def render_topic_pages(nodes, topic_tree, language, stylesheet, jobs=1, chunk_size=None):
+    """
+    Render the pages of ``nodes``, yielding ``(node, html, error, seconds)``
+    as they are done, not necessarily in order. ``error`` is the traceback of
+    a page that failed, in which case ``html`` is None.
+
+    With more than one job, the nodes are split in chunks rendered by a pool
+    of worker processes that each get the language, stylesheet, tree and
+    menu fragments once. By default chunks are small enough to give each
+    worker several of them.
+    """
+    if not nodes:
+        return
+
+    # Before the pool is started, so the workers get the fragments
+    with i18n.translate_block(language):
+        menus = precompile_menus(topic_tree)
+
+    if jobs <= 1:
+        with i18n.translate_block(language):
+            for node in nodes:
+                yield (node,) + _render(node, topic_tree)
+        return
+
+    if chunk_size is None:
+        chunk_size = max(1, min(50, len(nodes) // (jobs * 4)))
+    chunks = [
+        list(range(start, min(start + chunk_size, len(nodes))))
+        for start in range(0, len(nodes), chunk_size)
+    ]
+    pool = multiprocessing.Pool(
+        jobs, initializer=_init_worker, initargs=(language, stylesheet, nodes, topic_tree, menus))
+    try:
+        for results in pool.imap_unordered(_render_chunk, chunks):
+            for index, html, error, seconds in results:
+                yield nodes[index], html, error, seconds
+        pool.close()
+    except (Exception, KeyboardInterrupt, GeneratorExit):
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
@@ -0,0 +1,118 @@
+"""
+Instrumentation of an export: wall and CPU time, item counts, bytes and the
+slowest items of every phase, written as a JSON report. Optionally, the
+Python phases are profiled with cProfile.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .pipeline import StageCounter
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    # Takes both the str and unicode that pstats writes on Python 2
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def peak_rss():
+    """
+    Peak resident memory of this process in bytes, or None if the platform
+    can't tell
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, OS X bytes
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def cpu_time():
+    """
+    CPU seconds used by this process and the child processes it has waited
+    for, so ffmpeg and zimwriterfs are included once they have finished
+    """
+    times = os.times()
+    return times[0] + times[1] + times[2] + times[3]
+
+
+class ExportReport(object):
+    """
+    The stages of an export in the order they were first used. Stages that
+    overlap, like downloads and transcodes, count their items as they go.
+    Phases, which run one after another, also get their wall and CPU time
+    measured with ``phase``, and the peak memory usage at their end.
+    """
+
+    def __init__(self, slowest=10, profile=False):
+        self.slowest = slowest
+        self.stages = OrderedDict()
+        self.profiler = cProfile.Profile() if profile else None
+
+    def stage(self, name):
+        if name not in self.stages:
+            self.stages[name] = StageCounter(name, slowest=self.slowest)
+        return self.stages[name]
+
+    @contextmanager
+    def phase(self, name, python=True):
+        """
+        Time a phase, yields its stage. With profiling on, phases that
+        spend their time in Python rather than in other programs are
+        profiled.
+        """
+        stage = self.stage(name)
+        profiling = self.profiler is not None and python
+        start, start_cpu = time.time(), cpu_time()
+        if profiling:
+            self.profiler.enable()
+        try:
+            yield stage
+        finally:
+            if profiling:
+                self.profiler.disable()
+            stage.elapsed = (stage.elapsed or 0.0) + time.time() - start
+            stage.cpu = (stage.cpu or 0.0) + cpu_time() - start_cpu
+            stage.peak_rss = peak_rss()
+
+    def as_dict(self, **info):
+        report = OrderedDict(sorted(info.items()))
+        report['phases'] = [stage.as_dict() for stage in self.stages.values()]
+        return report
+
+    def save(self, path, **info):
+        """
+        Write the report as JSON, ``info`` is added at the top level
+        """
+        tmp_path = path + '.{}.tmp'.format(os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(self.as_dict(**info), f, indent=2)
+        os.rename(tmp_path, path)
+
+    def dump_profile(self, path, top=20):
+        """
+        Write the cProfile stats to ``path``, for use with pstats or
+        snakeviz, and return the ``top`` functions by cumulative time as
+        text
+        """
+        self.profiler.dump_stats(path)
+        output = StringIO()
+        stats = pstats.Stats(path, stream=output)
+        stats.sort_stats('cumulative').print_stats(top)
+        return output.getvalue()
@@ -0,0 +1,140 @@
+"""
+A search index of the titles and descriptions of all topics and videos,
+built at export time and searched by ``static/js/search.js``.
+
+Terms are split into shards by their first characters, and shards that get
+too large are split again by longer prefixes, so a search only loads the
+shards of the words typed. The titles and URLs of the results are in
+separate chunks, loaded for the results that are shown.
+
+Files written to the index directory:
+
+* ``index.json``: ``{"version", "shards": [prefix, ...], "stop": [term,
+  ...], "chunk_size", "documents"}``
+* ``s<n>.json``: ``{term: [posting, ...]}`` of the terms that belong to
+  ``shards[n]``, i.e. start with it and with none of the longer prefixes.
+  A posting is ``document * 2 + 1`` if the term is in the title of the
+  document, ``document * 2`` if it's only in the description.
+* ``d<n>.json``: ``[[title, url, kind], ...]`` of documents
+  ``n * chunk_size`` up to ``(n + 1) * chunk_size``
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+import json
+import os
+import re
+import unicodedata
+
+
+INDEX_VERSION = 1
+
+# The same rule as tokenize() in search.js, which browsers without Unicode
+# regular expressions can apply too: only the accents of Latin letters are
+# dropped, other scripts keep their combining marks, and words are split on
+# white space and punctuation
+ACCENTS = re.compile('[\u0300-\u036f]')
+SEPARATORS = re.compile('[\\s!-/:-@\\[-\\^`{-~\u00a0-\u00bf\u2000-\u206f\u3000-\u303f]+', re.UNICODE)
+
+
+def tokenize(text):
+    """
+    Lower case words of ``text`` without accents, keep in sync with
+    tokenize() in search.js
+    """
+    if not text:
+        return []
+    text = ACCENTS.sub('', unicodedata.normalize('NFKD', text.lower()))
+    # Single characters would match too much as prefixes
+    return [word for word in SEPARATORS.split(text) if len(word) > 1]
+
+
+class SearchIndex(object):
+    """
+    Inverted index of documents added in the order they are ranked by when
+    they match equally well.
+
+    ``prefix_length`` is the length of the prefixes that terms are first
+    sharded by, a shard with more than ``max_postings`` postings is split by
+    prefixes one character longer. Terms with more than ``max_postings``
+    postings that are in more than ``stop_fraction`` of all documents, like
+    "the", don't help finding anything and are left out.
+    """
+
+    def __init__(self, prefix_length=2, max_postings=4000, stop_fraction=0.25, chunk_size=200):
+        self.prefix_length = prefix_length
+        self.max_postings = max_postings
+        self.stop_fraction = stop_fraction
+        self.chunk_size = chunk_size
+        self.documents = []
+        self.postings = {}
+
+    def add(self, title, url, kind, description=None):
+        document = len(self.documents)
+        self.documents.append([title, url, kind[:1]])
+        title_terms = set(tokenize(title))
+        for term in title_terms:
+            self.postings.setdefault(term, []).append(document * 2 + 1)
+        for term in set(tokenize(description)) - title_terms:
+            self.postings.setdefault(term, []).append(document * 2)
+
+    def stop_terms(self):
+        limit = max(self.max_postings, self.stop_fraction * len(self.documents))
+        return sorted(term for term, postings in self.postings.items() if len(postings) > limit)
+
+    def shards(self):
+        """
+        Dict of shard prefixes to the sorted terms in each shard
+        """
+        shards = {}
+        stop_terms = set(self.stop_terms())
+        # (prefix length, terms to shard)
+        pending = [(self.prefix_length, sorted(term for term in self.postings if term not in stop_terms))]
+        while pending:
+            length, terms = pending.pop()
+            groups = {}
+            for term in terms:
+                groups.setdefault(term[:length], []).append(term)
+            for prefix, group in groups.items():
+                longer = [term for term in group if len(term) > length]
+                size = sum(len(self.postings[term]) for term in group)
+                if size > self.max_postings and longer:
+                    # Terms as long as the prefix stay in the shard
+                    shorter = [term for term in group if len(term) <= length]
+                    if shorter:
+                        shards[prefix] = shorter
+                    pending.append((length + 1, longer))
+                else:
+                    shards[prefix] = group
+        return shards
+
+    def write(self, dest_dir):
+        """
+        Write the index to ``dest_dir``, returns the names of the files
+        """
+        if not os.path.isdir(dest_dir):
+            os.makedirs(dest_dir)
+        written = []
+
+        def dump(name, data):
+            with open(os.path.join(dest_dir, name), 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            written.append(name)
+
+        shards = self.shards()
+        prefixes = sorted(shards)
+        for number, prefix in enumerate(prefixes):
+            dump('s{}.json'.format(number), dict(
+                (term, self.postings[term]) for term in shards[prefix]
+            ))
+        for number, start in enumerate(range(0, len(self.documents), self.chunk_size)):
+            dump('d{}.json'.format(number), self.documents[start:start + self.chunk_size])
+        dump('index.json', {
+            'version': INDEX_VERSION,
+            'shards': prefixes,
+            'stop': self.stop_terms(),
+            'chunk_size': self.chunk_size,
+            'documents': len(self.documents),
+        })
+        return written
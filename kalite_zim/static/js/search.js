@@ -0,0 +1,226 @@
+/**
+ * Search of the topics and videos, with the index built by
+ * kalite_zim/search.py. Only the index shards of the words typed and the
+ * document chunks of the results that are shown are loaded.
+ */
+var search = (function() {
+  var MAX_RESULTS = 50;
+  var INDEX_DIR = 'search/';
+  var index;
+  // Loaded files by name, or the callbacks waiting for them
+  var loaded = {};
+  var waiting = {};
+  var db = {};
+
+  function load(name, callback) {
+    if (loaded.hasOwnProperty(name)) {
+      callback(loaded[name]);
+      return;
+    }
+    if (waiting.hasOwnProperty(name)) {
+      waiting[name].push(callback);
+      return;
+    }
+    waiting[name] = [callback];
+    var request = new XMLHttpRequest();
+    request.onreadystatechange = function() {
+      if (request.readyState !== 4) {
+        return;
+      }
+      var data = null;
+      try {
+        data = JSON.parse(request.responseText);
+      } catch (e) {}
+      loaded[name] = data;
+      var callbacks = waiting[name];
+      delete waiting[name];
+      for (var i = 0; i < callbacks.length; i++) {
+        callbacks[i](data);
+      }
+    };
+    request.open('GET', INDEX_DIR + name, true);
+    request.send();
+  }
+
+  /**
+   * Call callback once all files in names are loaded, with their data in
+   * the same order.
+   */
+  function loadAll(names, callback) {
+    var results = [];
+    var remaining = names.length;
+    if (!remaining) {
+      callback(results);
+      return;
+    }
+    names.forEach(function(name, i) {
+      load(name, function(data) {
+        results[i] = data;
+        remaining -= 1;
+        if (!remaining) {
+          callback(results);
+        }
+      });
+    });
+  }
+
+  /**
+   * Lower case words without accents, keep in sync with tokenize() in
+   * search.py
+   */
+  db.tokenize = function(text) {
+    text = text.toLowerCase();
+    if (text.normalize) {
+      text = text.normalize('NFKD').replace(/[\u0300-\u036f]/g, '');
+    }
+    return text.split(/[\s!-\/:-@\[-\^`{-~\u00a0-\u00bf\u2000-\u206f\u3000-\u303f]+/).filter(function(word) {
+      return word.length > 1;
+    });
+  };
+
+  /**
+   * Shard files that may have terms starting with term
+   */
+  function shardsOf(term) {
+    var names = [];
+    index.shards.forEach(function(prefix, i) {
+      if (prefix.indexOf(term) === 0 || term.indexOf(prefix) === 0) {
+        names.push('s' + i + '.json');
+      }
+    });
+    return names;
+  }
+
+  /**
+   * Documents matching every term as a prefix, each with the number of
+   * terms found in its title
+   */
+  function match(terms, callback) {
+    var names = [];
+    terms.forEach(function(term) {
+      names.push.apply(names, shardsOf(term));
+    });
+    loadAll(names, function(shards) {
+      var scores = null;
+      terms.forEach(function(term) {
+        var found = {};
+        shards.forEach(function(shard) {
+          if (!shard) {
+            return;
+          }
+          for (var key in shard) {
+            if (shard.hasOwnProperty(key) && key.indexOf(term) === 0) {
+              shard[key].forEach(function(posting) {
+                var doc = posting >> 1;
+                found[doc] = Math.max(found[doc] || 0, posting & 1);
+              });
+            }
+          }
+        });
+        if (scores === null) {
+          scores = found;
+          return;
+        }
+        var both = {};
+        for (var doc in scores) {
+          if (found.hasOwnProperty(doc)) {
+            both[doc] = scores[doc] + found[doc];
+          }
+        }
+        scores = both;
+      });
+      var matches = [];
+      for (var doc in scores) {
+        matches.push([parseInt(doc, 10), scores[doc]]);
+      }
+      // Title matches first, then in the order of the topic tree
+      matches.sort(function(a, b) {
+        return (b[1] - a[1]) || (a[0] - b[0]);
+      });
+      callback(matches.map(function(m) { return m[0]; }));
+    });
+  }
+
+  /**
+   * Call callback with the total number of matches and the
+   * [title, url, kind] of the first MAX_RESULTS
+   */
+  db.search = function(query, callback) {
+    var terms = db.tokenize(query);
+    if (!terms.length) {
+      callback(0, []);
+      return;
+    }
+    load('index.json', function(data) {
+      index = data;
+      // Words that are in too many documents aren't in the index
+      terms = index ? terms.filter(function(term) {
+        return index.stop.indexOf(term) < 0;
+      }) : [];
+      if (!terms.length) {
+        callback(0, []);
+        return;
+      }
+      match(terms, function(docs) {
+        var shown = docs.slice(0, MAX_RESULTS);
+        var chunks = [];
+        shown.forEach(function(doc) {
+          var name = 'd' + Math.floor(doc / index.chunk_size) + '.json';
+          if (chunks.indexOf(name) < 0) {
+            chunks.push(name);
+          }
+        });
+        loadAll(chunks, function(data) {
+          var byName = {};
+          chunks.forEach(function(name, i) { byName[name] = data[i]; });
+          callback(docs.length, shown.map(function(doc) {
+            var chunk = byName['d' + Math.floor(doc / index.chunk_size) + '.json'];
+            return chunk[doc % index.chunk_size];
+          }));
+        });
+      });
+    });
+  };
+
+  return db;
+})();
+
+
+$(function() {
+  var input = $('#search-query');
+  var results = $('#search-results');
+  var status = $('#search-status');
+  var current = 0;
+
+  function show(query) {
+    var number = ++current;
+    search.search(query, function(total, docs) {
+      // A later search finished first
+      if (number !== current) {
+        return;
+      }
+      results.empty();
+      if (!query) {
+        status.text('');
+        return;
+      }
+      status.text(total ? status.data('found').replace('%s', total) : status.data('none'));
+      docs.forEach(function(doc) {
+        var icon = doc[2] === 'V' ? 'play-circle' : 'folder-open';
+        var link = $('<a class="list-group-item">').attr('href', doc[1]);
+        link.append($('<span class="glyphicon">').addClass('glyphicon-' + icon), ' ', $('<span>').text(doc[0]));
+        results.append(link);
+      });
+    });
+  }
+
+  input.on('input', function() {
+    show(input.val());
+  });
+  var query = /[?&]q=([^&]*)/.exec(window.location.search);
+  if (query) {
+    input.val(decodeURIComponent(query[1].replace(/\+/g, ' ')));
+  }
+  show(input.val());
+  input.focus();
+});
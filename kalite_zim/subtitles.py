@@ -0,0 +1,106 @@
+"""
+Conversion of KA Lite's SRT subtitles to VTT, which video.js understands.
+
+Conversions run in batches on a pool of worker processes, and the VTT files
+are cached by the hash of their SRT file, so rebuilding a language only
+converts changed subtitles.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+import hashlib
+import multiprocessing
+import os
+import time
+import traceback
+
+
+def srt_key(srt_path):
+    with open(srt_path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class SubtitleCache(object):
+    """
+    VTT files in ``cache_dir`` named by the hash of the SRT file they were
+    converted from
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.vtt')
+
+    def get(self, key):
+        """
+        Path of the cached VTT file, or None
+        """
+        path = self.path(key)
+        if os.path.exists(path):
+            self.hits += 1
+            return path
+        self.misses += 1
+        return None
+
+
+def _convert(srt_path, vtt_path):
+    from submarine.parser import parser as submarine_parser
+
+    start = time.time()
+    directory = os.path.dirname(vtt_path)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Created by another worker
+            pass
+    tmp_path = '{}.{}.tmp'.format(vtt_path, os.getpid())
+    try:
+        submarine_parser(srt_path, tmp_path)
+        if not os.path.exists(tmp_path):
+            return srt_path, vtt_path, "Could not convert", time.time() - start
+        os.rename(tmp_path, vtt_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        return srt_path, vtt_path, traceback.format_exc(), time.time() - start
+    return srt_path, vtt_path, None, time.time() - start
+
+
+def _convert_chunk(items):
+    return [_convert(srt_path, vtt_path) for srt_path, vtt_path in items]
+
+
+def convert_many(items, jobs=1, chunk_size=None):
+    """
+    Convert ``(srt_path, vtt_path)`` items, yielding ``(srt_path, vtt_path,
+    error, seconds)`` as they are done, not necessarily in order. ``error``
+    is None for successful conversions. With more than one job, the items
+    are converted in chunks on a pool of worker processes.
+    """
+    if not items:
+        return
+
+    if jobs <= 1:
+        for srt_path, vtt_path in items:
+            yield _convert(srt_path, vtt_path)
+        return
+
+    if chunk_size is None:
+        chunk_size = max(1, min(50, len(items) // (jobs * 4)))
+    chunks = [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for results in pool.imap_unordered(_convert_chunk, chunks):
+            for result in results:
+                yield result
+        pool.close()
+    except (Exception, KeyboardInterrupt, GeneratorExit):
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
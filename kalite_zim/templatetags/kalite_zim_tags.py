@@ -0,0 +1,16 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+from django import template
+from django.conf import settings
+
+register = template.Library()
+
+
+@register.simple_tag
+def stylesheet():
+    """
+    Path of the compiled stylesheet, see render.stylesheet_init
+    """
+    return settings.KALITE_ZIM_STYLESHEET
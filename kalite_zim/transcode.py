@@ -0,0 +1,253 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+import collections
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from collections import OrderedDict
+
+
+# libvpx doesn't scale much beyond this number of threads for a single
+# encode, so there's no point in giving one ffmpeg process more.
+MAX_THREADS = 8
+
+
+# Speed and quality settings of libvpx and the video bitrate in kbit/s.
+# "archive" is the slowest setting there is and what videos were encoded with
+# before there were profiles, it stays the default so cached encodes remain
+# valid.
+PROFILES = OrderedDict([
+    ('fast', {'quality': 'good', 'cpu_used': 4, 'bitrate': 300}),
+    ('balanced', {'quality': 'good', 'cpu_used': 1, 'bitrate': 300}),
+    ('archive', {'quality': 'best', 'cpu_used': 0, 'bitrate': 300}),
+])
+
+DEFAULT_PROFILE = 'archive'
+
+# The low resolution rendition for small screens, next to the main one
+LOW_SUFFIX = '.low'
+LOW_BITRATE = 120
+
+
+class TranscodeError(Exception):
+    pass
+
+
+def threads_per_job(jobs, cpu_count=None):
+    """
+    Split the available CPUs between ``jobs`` concurrent ffmpeg processes
+    so that the machine isn't oversubscribed.
+    """
+    if cpu_count is None:
+        cpu_count = multiprocessing.cpu_count()
+    return max(1, min(MAX_THREADS, cpu_count // max(1, jobs)))
+
+
+def encoder_args(profile=DEFAULT_PROFILE, height=None, bitrate=None):
+    """
+    The arguments that decide what the encoded video looks like. Anything
+    that changes the output must go here, since it's part of the transcode
+    cache key.
+
+    Videos higher than ``height`` are scaled down to it, ``bitrate``
+    overrides the one of the profile.
+    """
+    settings = PROFILES[profile]
+    bitrate = bitrate or settings['bitrate']
+    args = [
+        "-codec:v", "libvpx",
+        "-quality", settings['quality'],
+        "-cpu-used", str(settings['cpu_used']),
+        "-b:v", "{}k".format(bitrate),
+        "-qmin", "10",  # 10=lowest value
+        "-qmax", "35",  # 42=highest value
+        "-maxrate", "{}k".format(bitrate),
+        "-bufsize", "{}k".format(bitrate * 2),
+    ]
+    if height:
+        # Never scaled up, and the width is kept even for libvpx
+        args += ["-vf", "scale=-2:'min({},ih)'".format(height)]
+    return args + [
+        "-codec:a", "libvorbis",
+        # "-b:a", "128k",
+        "-aq", "5",
+        "-f", "webm",
+    ]
+
+
+def renditions(profile=DEFAULT_PROFILE, height=None, low_height=None):
+    """
+    The encoder arguments of the renditions of each video by the suffix of
+    their file names: the main one, and with ``low_height`` one for small
+    screens
+    """
+    result = OrderedDict([('', encoder_args(profile, height))])
+    if low_height:
+        result[LOW_SUFFIX] = encoder_args(profile, low_height, LOW_BITRATE)
+    return result
+
+
+def webm_args(ffmpeg, video_file_src, threads=MAX_THREADS, args=None):
+    """
+    Common arguments for both passes of the libvpx encode, with the
+    default ``encoder_args`` unless other ``args`` are given
+    """
+    return [
+        ffmpeg,
+        "-i", video_file_src,
+        "-threads", str(threads),
+    ] + (args if args is not None else encoder_args())
+
+
+def transcode_webm(ffmpeg, video_file_src, video_file_dest, threads=MAX_THREADS, args=None):
+    """
+    Two-pass encode of ``video_file_src`` into ``video_file_dest``.
+
+    Every call gets its own pass log, so several encodes can run at the same
+    time. The result is written to a temporary name and only moved into
+    place when both passes succeeded, so an interrupted run never leaves a
+    half-encoded file that looks finished to ``--resume``.
+    """
+    log_dir = tempfile.mkdtemp(prefix='ka-lite-zim_ffmpeg_')
+    ffmpeg_pass_log = os.path.join(log_dir, 'logfile_vp8')
+    partial_dest = video_file_dest + '.partial'
+    ffmpeg_base_args = webm_args(ffmpeg, video_file_src, threads=threads, args=args)
+    ffmpeg_pass1 = ffmpeg_base_args + [
+        "-an",  # Disables audio, no effect first pass
+        "-pass", "1",
+        "-passlogfile", ffmpeg_pass_log,
+        "-y", partial_dest,
+    ]
+    ffmpeg_pass2 = ffmpeg_base_args + [
+        "-pass", "2",
+        "-y", "-passlogfile", ffmpeg_pass_log,
+        partial_dest,
+    ]
+    try:
+        for cmd in (ffmpeg_pass1, ffmpeg_pass2):
+            _run_ffmpeg(cmd)
+        os.rename(partial_dest, video_file_dest)
+    finally:
+        shutil.rmtree(log_dir, ignore_errors=True)
+        if os.path.isfile(partial_dest):
+            os.unlink(partial_dest)
+
+
+def remux_args(container):
+    """
+    The arguments that copy the streams of a video into another
+    ``container`` as they are. mp4 files get their index at the start, so
+    they play before they are loaded completely.
+    """
+    args = ["-codec", "copy"]
+    if container == 'mp4':
+        args += ["-movflags", "+faststart"]
+    return args + ["-f", container]
+
+
+def remux(ffmpeg, video_file_src, video_file_dest, args):
+    """
+    Copy ``video_file_src`` into ``video_file_dest`` with the
+    ``remux_args``, through a temporary name like ``transcode_webm``
+    """
+    partial_dest = video_file_dest + '.partial'
+    try:
+        _run_ffmpeg([ffmpeg, "-i", video_file_src] + args + ["-y", partial_dest])
+        os.rename(partial_dest, video_file_dest)
+    finally:
+        if os.path.isfile(partial_dest):
+            os.unlink(partial_dest)
+
+
+def _run_ffmpeg(cmd):
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout_data, stderr_data = process.communicate()
+    if process.returncode != 0:
+        raise TranscodeError(
+            "Error invoking ffmpeg: {}\nCommand was: {}".format(
+                (stderr_data or b"").decode('utf-8', 'replace') + (stdout_data or b"").decode('utf-8', 'replace'),
+                " ".join(cmd),
+            )
+        )
+
+
+def _transcode_worker(task):
+    """
+    Runs in a pool process, returns the error message instead of raising it
+    so that a single broken video doesn't tear down the whole pool.
+    """
+    ffmpeg, video_file_src, video_file_dest, threads, args = task
+    start = time.time()
+    try:
+        transcode_webm(ffmpeg, video_file_src, video_file_dest, threads=threads, args=args)
+    except TranscodeError as e:
+        return video_file_dest, e.args[0], time.time() - start
+    return video_file_dest, None, time.time() - start
+
+
+class TranscodePool(object):
+    """
+    Runs transcodes in the background on ``jobs`` ffmpeg processes while the
+    caller goes on with other work. Results are handed back in the order the
+    videos were submitted, regardless of which worker finishes first.
+
+    How long each transcode took in its worker is kept in ``durations``.
+    """
+
+    def __init__(self, ffmpeg, jobs=1):
+        self.ffmpeg = ffmpeg
+        self.threads = threads_per_job(jobs)
+        self.pool = multiprocessing.Pool(jobs)
+        self.pending = collections.deque()
+        self.durations = {}
+
+    def submit(self, video_file_src, video_file_dest, args=None):
+        task = (self.ffmpeg, video_file_src, video_file_dest, self.threads, args)
+        self.pending.append(self.pool.apply_async(_transcode_worker, (task,)))
+
+    def results(self, max_pending=0):
+        """
+        Yield ``(video_file_dest, error)`` of finished transcodes, ``error``
+        is None on success. Blocks until no more than ``max_pending``
+        transcodes are left, and then returns the ones that are done
+        already without waiting.
+        """
+        while self.pending and (len(self.pending) > max_pending or self.pending[0].ready()):
+            video_file_dest, error, seconds = self.pending.popleft().get()
+            self.durations[video_file_dest] = seconds
+            yield video_file_dest, error
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+def transcode_many(ffmpeg, videos, jobs=1):
+    """
+    Transcode a list of ``(video_file_src, video_file_dest)`` tuples with
+    ``jobs`` concurrent ffmpeg processes. A third item in a tuple are the
+    encoder arguments for that video.
+
+    Yields ``(video_file_dest, error)`` in the same order as ``videos``,
+    regardless of which worker finishes first. ``error`` is None on success.
+    """
+    pool = TranscodePool(ffmpeg, jobs=jobs)
+    try:
+        for video in videos:
+            pool.submit(*video)
+        for result in pool.results():
+            yield result
+        pool.close()
+    except (Exception, KeyboardInterrupt):
+        pool.terminate()
+        raise
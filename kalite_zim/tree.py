@@ -0,0 +1,166 @@
+"""
+A compact model of the topic tree, and a walk that applies several visitors
+to each node in one pass without recursing, so deep trees don't run into
+Python's recursion limit.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+import time
+
+from collections import OrderedDict
+
+
+# Strings repeated on lots of nodes are stored once
+_interned = {}
+
+
+def intern_string(value):
+    if value is None:
+        return None
+    return _interned.setdefault(value, value)
+
+
+class Node(object):
+    """
+    A topic or video of the tree, with only the fields the export uses.
+    The parent is referenced by its index in ``TopicTree.nodes``.
+    """
+
+    __slots__ = (
+        'index', 'parent_index', 'depth', 'id', 'kind', 'title', 'description',
+        'path', 'children', 'youtube_id', 'format', 'available',
+        'video_url', 'low_video_url', 'thumbnail_url', 'subtitle_url', 'width', 'height',
+    )
+
+    def __init__(self, index, parent_index, depth, id, kind, title, description, path,  # @ReservedAssignment
+                 youtube_id=None, format=None):  # @ReservedAssignment
+        self.index = index
+        self.parent_index = parent_index
+        self.depth = depth
+        self.id = id
+        self.kind = intern_string(kind)
+        self.title = title
+        self.description = description
+        self.path = path
+        self.children = [] if kind == 'Topic' else ()
+        self.youtube_id = youtube_id
+        self.format = intern_string(format)
+        self.available = False
+        self.video_url = None
+        self.low_video_url = None
+        self.thumbnail_url = None
+        self.subtitle_url = None
+        self.width = None
+        self.height = None
+
+    @property
+    def url(self):
+        return self.id + ".html"
+
+    def __repr__(self):
+        return "<Node {} {}>".format(self.kind, self.id)
+
+
+class TopicTree(object):
+    """
+    All the nodes of the tree in a list, in the order they were added,
+    the first one being the root.
+    """
+
+    def __init__(self):
+        self.nodes = []
+
+    @property
+    def root(self):
+        return self.nodes[0]
+
+    def add(self, parent, id, kind, title, description="", path="", **fields):  # @ReservedAssignment
+        node = Node(
+            len(self.nodes),
+            parent.index if parent is not None else None,
+            parent.depth + 1 if parent is not None else 0,
+            id, kind, title, description, path,
+            **fields
+        )
+        self.nodes.append(node)
+        if parent is not None:
+            parent.children.append(node)
+        return node
+
+    def parent(self, node):
+        if node.parent_index is None:
+            return None
+        return self.nodes[node.parent_index]
+
+    def ancestors(self, node):
+        """
+        Parent, grandparent etc. of a node up to the root
+        """
+        ancestors = []
+        parent = self.parent(node)
+        while parent is not None:
+            ancestors.append(parent)
+            parent = self.parent(parent)
+        return ancestors
+
+
+class TreeWalk(object):
+    """
+    A depth first traversal that applies ordered visitors to every node.
+
+    ``enter`` visitors are called with ``(node, parent)`` before any of the
+    node's children are visited, in the order they were added. A node's
+    children are read with the ``children`` function after all of its
+    ``enter`` visitors have run, so they can filter them. ``leave`` visitors
+    are called with ``(node, parent)`` after all of the node's descendants
+    have been visited.
+
+    The time spent in each visitor is kept in ``timings``.
+    """
+
+    def __init__(self, children=None):
+        self.children = children or (lambda node: node.children)
+        self.visitors = []
+        self.timings = OrderedDict()
+        self.nodes = 0
+
+    def visit(self, name, enter=None, leave=None):
+        self.visitors.append((name, enter, leave))
+        self.timings[name] = 0.0
+        return self
+
+    def _call(self, name, visitor, node, parent):
+        start = time.time()
+        visitor(node, parent)
+        self.timings[name] += time.time() - start
+
+    def run(self, root):
+        enters = [(name, enter) for name, enter, __ in self.visitors if enter]
+        leaves = [(name, leave) for name, __, leave in self.visitors if leave]
+        # (node, parent, whether its children have been visited)
+        stack = [(root, None, False)]
+        while stack:
+            node, parent, left = stack.pop()
+            if left:
+                for name, leave in leaves:
+                    self._call(name, leave, node, parent)
+                continue
+            self.nodes += 1
+            for name, enter in enters:
+                self._call(name, enter, node, parent)
+            if leaves:
+                stack.append((node, parent, True))
+            children = self.children(node)
+            stack.extend((child, node, False) for child in reversed(children))
+        return self
+
+    def report(self):
+        """
+        One line of text per visitor with its timing
+        """
+        return [
+            "{}: {:.2f}s for {} nodes".format(name, seconds, self.nodes)
+            for name, seconds in self.timings.items()
+        ]
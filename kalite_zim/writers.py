@@ -0,0 +1,242 @@
+"""
+Backends that write the exported articles and media into a ZIM file.
+
+All backends get the same calls while the export runs: ``add_article`` for
+rendered HTML pages, ``add_file`` for media and static files that already
+exist on disk, and finally ``finalize`` when everything has been added.
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+import io
+import mimetypes
+import os
+import shutil
+import subprocess
+
+from .cache import link_or_copy
+
+
+# Types that aren't known to all versions of the mimetypes module
+MIMETYPES_BY_EXTENSION = {
+    'vtt': 'text/vtt',
+    'webm': 'video/webm',
+}
+
+
+# ISO 639-3 codes of the languages KA Lite has content in, by their ISO
+# 639-1 code, for the ZIM metadata
+ISO_639_3 = {
+    'ar': 'ara', 'bg': 'bul', 'bn': 'ben', 'cs': 'ces', 'da': 'dan', 'de': 'deu',
+    'el': 'ell', 'en': 'eng', 'es': 'spa', 'fa': 'fas', 'fr': 'fra', 'gu': 'guj',
+    'ha': 'hau', 'he': 'heb', 'hi': 'hin', 'hu': 'hun', 'hy': 'hye', 'id': 'ind',
+    'it': 'ita', 'ja': 'jpn', 'ka': 'kat', 'km': 'khm', 'kn': 'kan', 'ko': 'kor',
+    'ku': 'kur', 'lt': 'lit', 'mn': 'mon', 'mr': 'mar', 'ms': 'msa', 'my': 'mya',
+    'nb': 'nob', 'ne': 'nep', 'nl': 'nld', 'pa': 'pan', 'pl': 'pol', 'ps': 'pus',
+    'pt': 'por', 'ro': 'ron', 'ru': 'rus', 'rw': 'kin', 'si': 'sin', 'sk': 'slk',
+    'sr': 'srp', 'sv': 'swe', 'sw': 'swa', 'ta': 'tam', 'te': 'tel', 'th': 'tha',
+    'tr': 'tur', 'uk': 'ukr', 'ur': 'urd', 'vi': 'vie', 'xh': 'xho', 'yo': 'yor',
+    'zh': 'zho', 'zu': 'zul',
+}
+
+
+class WriterError(Exception):
+    pass
+
+
+def iso_639_3(language):
+    """
+    The ISO 639-3 code of a KA Lite language code like ``en`` or ``pt-BR``,
+    or the language code itself if it isn't known
+    """
+    return ISO_639_3.get(language.replace('_', '-').split('-')[0].lower(), language)
+
+
+class ZimWriter(object):
+    """
+    Base class for writer backends.
+
+    ``metadata`` is a dict with the keys ``welcome``, ``favicon``,
+    ``publisher``, ``creator``, ``title``, ``description`` and ``language``.
+    """
+
+    # Whether files written by a previous run are kept and can be reused by
+    # --resume, otherwise everything has to be added again on every run
+    incremental = False
+
+    def __init__(self, dest_file, tmp_dir, metadata):
+        self.dest_file = dest_file
+        self.tmp_dir = tmp_dir
+        self.metadata = metadata
+
+    def add_article(self, path, html, title=None):
+        raise NotImplementedError()
+
+    def add_file(self, path, src_path):
+        raise NotImplementedError()
+
+    def add_directory(self, path, src_dir):
+        """
+        Add all the files in ``src_dir`` below ``path``
+        """
+        for root, __, filenames in os.walk(src_dir):
+            for filename in sorted(filenames):
+                file_path = os.path.join(root, filename)
+                self.add_file(
+                    os.path.join(path, os.path.relpath(file_path, src_dir)),
+                    file_path
+                )
+
+    def finalize(self):
+        raise NotImplementedError()
+
+
+class ZimwriterfsWriter(ZimWriter):
+    """
+    Stages everything as a directory tree in ``tmp_dir`` and packs it with
+    zimwriterfs at the end.
+    """
+
+    incremental = True
+
+    def __init__(self, dest_file, tmp_dir, metadata, zimwriterfs=None):
+        super(ZimwriterfsWriter, self).__init__(dest_file, tmp_dir, metadata)
+        self.zimwriterfs = zimwriterfs
+
+    def _dest(self, path):
+        dest = os.path.join(self.tmp_dir, path)
+        dest_dir = os.path.dirname(dest)
+        if not os.path.isdir(dest_dir):
+            os.makedirs(dest_dir)
+        return dest
+
+    def add_article(self, path, html, title=None):
+        with io.open(self._dest(path), 'w', encoding='utf-8') as f:
+            f.write(html)
+
+    def add_file(self, path, src_path):
+        dest = self._dest(path)
+        if os.path.exists(dest):
+            # Already staged, for instance files produced directly in the
+            # tmp dir or links made by a previous run
+            if os.path.samefile(src_path, dest):
+                return
+            os.unlink(dest)
+        link_or_copy(src_path, dest)
+
+    def add_directory(self, path, src_dir):
+        dest = self._dest(path)
+        if os.path.exists(dest):
+            shutil.rmtree(dest)
+        # Linked like all other files, so exports of several languages
+        # don't each get a copy
+        super(ZimwriterfsWriter, self).add_directory(path, src_dir)
+
+    def finalize(self):
+        zimwriterfs_args = (
+            self.zimwriterfs,
+            "--welcome", self.metadata['welcome'],
+            "--favicon", self.metadata['favicon'],
+            "--publisher", self.metadata['publisher'],
+            "--creator", self.metadata['creator'],
+            "--description", self.metadata['title'],
+            "--description", self.metadata['description'],
+            "--language", self.metadata['language'],
+            self.tmp_dir,
+            self.dest_file,
+        )
+
+        process = subprocess.Popen(zimwriterfs_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout_data, stderr_data = process.communicate()
+
+        if process.returncode != 0:
+            raise WriterError(
+                "Error invoking zimwriterfs: {}".format(
+                    (stderr_data + stdout_data).decode('utf-8', 'replace')
+                )
+            )
+
+
+class LibzimWriter(ZimWriter):
+    """
+    Streams articles and media straight into the ZIM file through the libzim
+    Python bindings. Pages and the files KA Lite has aren't staged, only
+    what the export makes, like transcodes, remuxes and the search index, is
+    still written to ``tmp_dir`` first.
+
+    Paths are only added once, a video in several topics has its page
+    rendered for each of them but libzim refuses duplicates.
+    """
+
+    def __init__(self, dest_file, tmp_dir, metadata):
+        super(LibzimWriter, self).__init__(dest_file, tmp_dir, metadata)
+        try:
+            from libzim import writer
+        except ImportError:
+            raise WriterError("The libzim writer needs the libzim Python package")
+        self._libzim = writer
+        self.language = iso_639_3(metadata['language'])
+        self.creator = writer.Creator(dest_file).config_indexing(True, self.language)
+        self.creator.set_mainpath(metadata['welcome'])
+        self.creator.__enter__()
+        self.favicon_path = None
+        self.paths = set()
+
+    def _add(self, path, title, mimetype, provider, front_article):
+        if path in self.paths:
+            return
+        self.paths.add(path)
+        libzim = self._libzim
+
+        class _Item(libzim.Item):
+            def get_path(self):
+                return path
+
+            def get_title(self):
+                return title or ""
+
+            def get_mimetype(self):
+                return mimetype
+
+            def get_contentprovider(self):
+                return provider
+
+            def get_hints(self):
+                return {libzim.Hint.FRONT_ARTICLE: front_article}
+
+        self.creator.add_item(_Item())
+
+    def add_article(self, path, html, title=None):
+        self._add(
+            path, title, "text/html",
+            self._libzim.StringProvider(html),
+            front_article=True,
+        )
+
+    def add_file(self, path, src_path):
+        mimetype, __ = mimetypes.guess_type(src_path, strict=False)
+        if mimetype is None:
+            mimetype = MIMETYPES_BY_EXTENSION.get(src_path.rsplit('.', 1)[-1].lower())
+        if path == self.metadata['favicon']:
+            self.favicon_path = src_path
+        self._add(
+            path, None, mimetype or "application/octet-stream",
+            self._libzim.FileProvider(src_path),
+            front_article=False,
+        )
+
+    def finalize(self):
+        if self.favicon_path:
+            with open(self.favicon_path, 'rb') as f:
+                self.creator.add_illustration(48, f.read())
+        for name in ('publisher', 'creator', 'title', 'description'):
+            self.creator.add_metadata(name.capitalize(), self.metadata[name])
+        self.creator.add_metadata('Language', self.language)
+        self.creator.__exit__(None, None, None)
+
+
+WRITERS = {
+    'zimwriterfs': ZimwriterfsWriter,
+    'libzim': LibzimWriter,
+}
@@ -0,0 +1,17 @@
+"""
+Helpers shared by the tests
+"""
+import os
+import stat
+
+
+def fake_executable(tmpdir, name, script):
+    """
+    Write ``script`` to an executable file ``name`` in ``tmpdir``, a stand-in
+    for a program, and return its path
+    """
+    path = os.path.join(str(tmpdir), name)
+    with open(path, 'w') as f:
+        f.write(script)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
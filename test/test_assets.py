@@ -0,0 +1,125 @@
+"""
+Tests for `kalite_zim.assets`
+"""
+import io
+import os
+
+import pytest
+
+from kalite_zim import assets
+from kalite_zim.assets import AssetCollector, build_assets, compile_stylesheet, css_references, stylesheet_signature
+
+
+def _write(static_dir, path, content):
+    path = static_dir.join(*path.split('/'))
+    path.dirpath().ensure(dir=True)
+    with open(str(path), 'wb') as f:
+        f.write(content.encode('utf-8'))
+
+
+class TestAssetCollector(object):
+
+    def test_css_references(self):
+        css = (
+            '@import "base.css";\n'
+            '.a { background: url("../img/a.png?v=1"); }\n'
+            '.b { src: url(../fonts/b.eot?#iefix), url(\'../fonts/b.svg#font\'); }\n'
+            '.c { background: url(data:image/png;base64,AAAA); }\n'
+            '.d { background: url(http://example.com/d.png); }\n'
+        )
+        assert css_references(css, 'css/main.css') == set([
+            'css/base.css', 'img/a.png', 'fonts/b.eot', 'fonts/b.svg',
+        ])
+
+    def test_resolve(self, tmpdir):
+        static_dir = tmpdir.join('static')
+        _write(static_dir, 'css/main.css', '.a { background: url(../img/a.png); } @import "extra.css";')
+        _write(static_dir, 'css/extra.css', '.b { background: url(../img/b.png); }')
+        _write(static_dir, 'img/a.png', 'a')
+        _write(static_dir, 'img/b.png', 'b')
+        _write(static_dir, 'img/unused.png', 'c')
+        _write(static_dir, 'js/app.js', 'var a = 1;')
+        _write(static_dir, 'js/unused.js', 'var b = 1;')
+
+        build_dir = tmpdir.join('build')
+        _write(build_dir, 'css/built.css', '.c { background: url(../img/a.png); }')
+
+        collector = AssetCollector([str(build_dir), str(static_dir)])
+        collector.add('img/leaf.png')
+        collector.add_html(
+            '<link href="static/css/main.css" rel="stylesheet">'
+            '<link href="static/css/built.css" rel="stylesheet">'
+            '<script src="static/js/app.js?v=2"></script>'
+            '<a href="other.html">'
+        )
+        assert collector.resolve() == [
+            'css/built.css', 'css/extra.css', 'css/main.css', 'img/a.png', 'img/b.png', 'js/app.js',
+        ]
+        assert collector.missing == set(['img/leaf.png'])
+
+
+class TestBuildAssets(object):
+
+    def test_unminified(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(assets, 'jsmin', None)
+        static_dir = tmpdir.join('static')
+        _write(static_dir, 'js/app.js', 'var a = 1;')
+        built = list(build_assets([str(static_dir)], ['js/app.js'], str(tmpdir.join('build'))))
+        assert built == [('js/app.js', str(static_dir.join('js', 'app.js')), 10)]
+
+    def test_minified(self, tmpdir):
+        pytest.importorskip('rjsmin')
+        pytest.importorskip('rcssmin')
+        static_dir = tmpdir.join('static')
+        build_dir = str(tmpdir.join('build'))
+        _write(static_dir, 'js/app.js', 'var a = 1;   // comment\n')
+        _write(static_dir, 'js/lib.min.js', 'var b=1;')
+        _write(static_dir, 'css/main.css', '.a  {  color: red;  }  /* comment */\n')
+        paths = ['css/main.css', 'js/app.js', 'js/lib.min.js']
+
+        built = list(build_assets([str(static_dir)], paths, build_dir))
+        (css, css_src, css_size), (js, js_src, __), (lib, lib_src, __) = built
+        assert io.open(css_src, encoding='utf-8').read() == '.a{color:red}'
+        assert io.open(js_src, encoding='utf-8').read() == 'var a=1;'
+        assert css_size == os.path.getsize(str(static_dir.join('css', 'main.css')))
+        assert os.path.dirname(js_src) == build_dir
+        # Already minified files are used as they are
+        assert lib_src == str(static_dir.join('js', 'lib.min.js'))
+
+        # Built files are reused
+        mtime = os.path.getmtime(js_src)
+        assert list(build_assets([str(static_dir)], ['js/app.js'], build_dir))[0][1] == js_src
+        assert os.path.getmtime(js_src) == mtime
+
+
+class TestCompileStylesheet(object):
+
+    def test_signature(self, tmpdir):
+        static_dir = tmpdir.join('static')
+        _write(static_dir, 'bootstrap/main.scss', '@import "variables"; .a { color: $color; }')
+        _write(static_dir, 'bootstrap/_variables.scss', '$color: red;')
+        signature = stylesheet_signature(str(static_dir))
+        # Other files don't matter
+        _write(static_dir, 'js/app.js', 'var a = 1;')
+        assert stylesheet_signature(str(static_dir)) == signature
+        _write(static_dir, 'bootstrap/_variables.scss', '$color: blue;')
+        assert stylesheet_signature(str(static_dir)) != signature
+
+    def test_compile(self, tmpdir):
+        pytest.importorskip('sass')
+        static_dir = tmpdir.join('static')
+        build_dir = str(tmpdir.join('build'))
+        _write(static_dir, 'bootstrap/main.scss', '@import "variables"; .a { color: $color; }')
+        _write(static_dir, 'bootstrap/_variables.scss', '$color: red;')
+
+        path = compile_stylesheet('bootstrap/main.scss', str(static_dir), build_dir)
+        built = os.path.join(build_dir, *path.split('/'))
+        assert path.startswith('css/') and path.endswith('.min.css')
+        assert io.open(built, encoding='utf-8').read().strip() == '.a{color:red}'
+
+        # Compiled again only when the SCSS changes
+        mtime = os.path.getmtime(built)
+        assert compile_stylesheet('bootstrap/main.scss', str(static_dir), build_dir) == path
+        assert os.path.getmtime(built) == mtime
+        _write(static_dir, 'bootstrap/_variables.scss', '$color: blue;')
+        assert compile_stylesheet('bootstrap/main.scss', str(static_dir), build_dir) != path
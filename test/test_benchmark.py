@@ -0,0 +1,83 @@
+"""
+Tests for `kalite_zim.benchmark`
+"""
+import os
+import subprocess
+
+from collections import OrderedDict
+
+from kalite_zim import benchmark
+from kalite_zim.loader import load_content, load_topic_tree
+from kalite_zim.probe import parse_probe
+
+
+class TestDataset(object):
+
+    def test_topic_tree(self):
+        root, video_ids = benchmark.generate_topic_tree(depth=3, fanout=2, videos=3, exercises=1)
+        # 7 topics, 4 of them on the last level
+        assert len(video_ids) == 12
+        assert len(set(video_ids)) == 12
+        assert benchmark.count_nodes(root) == 7 + 12 + 4
+        leaf = root['children'][0]['children'][0]
+        assert [child['kind'] for child in leaf['children']] == ['Video'] * 3 + ['Exercise']
+        assert leaf['children'][0]['path'].startswith(leaf['path'])
+
+    def test_generate(self, tmpdir):
+        dataset_dir = str(tmpdir)
+        params = benchmark.generate_dataset(dataset_dir, depth=2, fanout=3, videos=2, exercises=1)
+        assert params['nodes'] == 1 + 3 + 6 + 3
+
+        root, video_ids = load_topic_tree(os.path.join(dataset_dir, 'test_topics.json'))
+        assert len(video_ids) == 6
+        content = load_content(os.path.join(dataset_dir, 'test_content.json'), video_ids)
+        assert sorted(content) == sorted(video_ids)
+        content_dir = tmpdir.join('content')
+        assert content_dir.join('v0000000000.mp4').size() == 1024
+        assert content_dir.join('v0000000000.png').exists()
+        assert not content_dir.join('v0000000001.png').exists()
+
+        # Thumbnails created by an export are removed when it's reused
+        content_dir.join('v0000000001.png').write('png')
+        assert benchmark.generate_dataset(dataset_dir, depth=2, fanout=3, videos=2, exercises=1) == params
+        assert not content_dir.join('v0000000001.png').exists()
+        assert content_dir.join('v0000000000.png').exists()
+
+    def test_stubs(self, tmpdir):
+        benchmark.generate_dataset(str(tmpdir), depth=2, fanout=1, videos=1)
+        bin_dir = tmpdir.join('bin')
+        thumbnail = tmpdir.join('thumb.png')
+        subprocess.check_call([str(bin_dir.join('ffmpeg')), '-i', 'video.mp4', '-y', str(thumbnail)])
+        assert thumbnail.read_binary() == benchmark.PNG
+        probe = parse_probe(subprocess.check_output([str(bin_dir.join('ffprobe')), 'video.mp4']).decode('utf-8'))
+        assert probe['video_codec'] == 'mpeg4'
+
+        src_dir = tmpdir.mkdir('zim')
+        src_dir.join('index.html').write('html')
+        subprocess.check_call([str(bin_dir.join('zimwriterfs')), '--welcome', 'index.html', str(src_dir), str(tmpdir.join('out.zim'))])
+        assert tmpdir.join('out.zim').read().strip() == str(src_dir.join('index.html'))
+
+
+class TestCompare(object):
+
+    def test_regressions(self):
+        baseline = {'1k': {'phases': {
+            'render': {'wall_seconds': 10.0, 'cpu_seconds': 9.0, 'peak_rss': 100},
+            'static': {'wall_seconds': 0.1, 'cpu_seconds': 0.1, 'peak_rss': 100},
+        }}}
+        results = {
+            '1k': {'phases': OrderedDict([
+                ('render', {'wall_seconds': 13.0, 'cpu_seconds': 12.0, 'peak_rss': 200}),
+                # Slower, but not by enough seconds to count
+                ('static', {'wall_seconds': 0.3, 'cpu_seconds': 0.3, 'peak_rss': 200}),
+                ('zimwriterfs', {'wall_seconds': 5.0, 'cpu_seconds': 5.0, 'peak_rss': 200}),
+            ])},
+            '10k': {'phases': {}},
+        }
+        assert sorted(benchmark.compare(results, baseline, tolerance=0.25)) == [
+            ('1k', 'render', 'peak_rss', 100, 200),
+            ('1k', 'render', 'wall_seconds', 10.0, 13.0),
+        ]
+        assert benchmark.compare(results, baseline, tolerance=0.5) == [
+            ('1k', 'render', 'peak_rss', 100, 200),
+        ]
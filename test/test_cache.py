@@ -0,0 +1,81 @@
+"""
+Tests for `kalite_zim.cache`
+"""
+import os
+
+from kalite_zim.cache import TranscodeCache
+
+
+def write(path, data):
+    with open(str(path), 'w') as f:
+        f.write(data)
+    return str(path)
+
+
+class TestTranscodeCache(object):
+
+    def test_key(self, tmpdir):
+        cache = TranscodeCache(str(tmpdir.join('cache')))
+        src1 = write(tmpdir.join('a.mp4'), 'a')
+        src2 = write(tmpdir.join('b.mp4'), 'a')
+        src3 = write(tmpdir.join('c.mp4'), 'c')
+        # Keyed by contents, not by path
+        assert cache.key(src1, ['-b:v', '300k']) == cache.key(src2, ['-b:v', '300k'])
+        assert cache.key(src1, ['-b:v', '300k']) != cache.key(src3, ['-b:v', '300k'])
+        assert cache.key(src1, ['-b:v', '300k']) != cache.key(src1, ['-b:v', '200k'])
+
+    def test_known_hash(self, tmpdir):
+        cache = TranscodeCache(str(tmpdir.join('cache')))
+        src = write(tmpdir.join('a.mp4'), 'a')
+        assert cache.known_hash(src) is None
+        key = cache.key(src, [])
+        assert cache.key(None, [], digest=cache.known_hash(src)) == key
+        assert cache.known_hash(str(tmpdir.join('missing.mp4'))) is None
+
+    def test_get_put(self, tmpdir):
+        cache = TranscodeCache(str(tmpdir.join('cache')))
+        src = write(tmpdir.join('a.mp4'), 'a')
+        encoded = write(tmpdir.join('a.webm'), 'encoded')
+        key = cache.key(src, [])
+        dest = str(tmpdir.join('dest.webm'))
+        assert not cache.get(key, dest)
+        cache.put(key, encoded)
+        assert cache.get(key, dest)
+        assert open(dest).read() == 'encoded'
+        assert os.stat(dest).st_ino == os.stat(encoded).st_ino
+        assert cache.stats()['entries'] == 1
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_source_hash_index(self, tmpdir):
+        cache = TranscodeCache(str(tmpdir.join('cache')))
+        src = write(tmpdir.join('a.mp4'), 'a')
+        key = cache.key(src, [])
+        cache.save()
+        assert TranscodeCache(str(tmpdir.join('cache')))._sources == cache._sources
+        write(src, 'changed')
+        assert cache.key(src, []) != key
+
+    def test_save_merges(self, tmpdir):
+        # Exports of several languages save the same index
+        first = TranscodeCache(str(tmpdir.join('cache')))
+        second = TranscodeCache(str(tmpdir.join('cache')))
+        first.key(write(tmpdir.join('a.mp4'), 'a'), [])
+        second.key(write(tmpdir.join('b.mp4'), 'b'), [])
+        first.save()
+        second.save()
+        assert len(TranscodeCache(str(tmpdir.join('cache')))._sources) == 2
+
+    def test_prune_lru(self, tmpdir):
+        cache = TranscodeCache(str(tmpdir.join('cache')), max_size=25)
+        keys = []
+        for i in range(3):
+            encoded = write(tmpdir.join('%d.webm' % i), 'x' * 10)
+            keys.append('%040d' % i)
+            cache.put(keys[-1], encoded)
+            os.utime(cache.path(keys[-1]), (1000 + i, 1000 + i))
+        # Using the oldest entry makes the second one least recently used
+        assert cache.get(keys[0], str(tmpdir.join('dest.webm')))
+        assert cache.prune() == (1, 10)
+        assert os.path.exists(cache.path(keys[0]))
+        assert not os.path.exists(cache.path(keys[1]))
+        assert os.path.exists(cache.path(keys[2]))
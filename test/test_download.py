@@ -0,0 +1,159 @@
+"""
+Tests for `kalite_zim.download` against a local HTTP server
+"""
+import os
+import threading
+
+import pytest
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:  # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+from kalite_zim.download import MAX_REDIRECTS, Downloader, DownloadError
+
+
+FILES = {
+    '/video.mp4': b'0123456789' * 1000,
+    '/thumb.png': b'png',
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get('Range')))
+        if self.path == '/loop':
+            self.send_response(302)
+            self.send_header('Location', '/loop')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path in ('/forbidden', '/busy'):
+            self.send_response(403 if self.path == '/forbidden' else 429)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/video.mp4')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        data = FILES.get(self.path)
+        if data is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header:
+            start = int(range_header.split('=')[1].split('-')[0])
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, len(data) - 1, len(data)))
+        else:
+            self.send_response(200)
+        body = data[start:]
+        self.send_header('Content-Type', 'image/png' if self.path.endswith('.png') else 'video/mp4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.server.truncate:
+            self.server.truncate -= 1
+            body = body[:len(body) // 2]
+            self.wfile.write(body)
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def server():
+    httpd = Server(('127.0.0.1', 0), Handler)
+    httpd.requests = []
+    httpd.truncate = 0
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    httpd.url = 'http://127.0.0.1:{}'.format(httpd.server_address[1])
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestDownloader(object):
+
+    def test_fetch(self, server, tmpdir):
+        dest = str(tmpdir.join('video.mp4'))
+        assert Downloader().fetch(server.url + '/redirect', dest)
+        assert open(dest, 'rb').read() == FILES['/video.mp4']
+        assert not os.path.exists(dest + '.part')
+
+    def test_not_found(self, server, tmpdir):
+        dest = str(tmpdir.join('missing.mp4'))
+        assert not Downloader().fetch(server.url + '/missing.mp4', dest)
+        assert not os.path.exists(dest)
+
+    def test_content_type(self, server, tmpdir):
+        dest = str(tmpdir.join('thumb.png'))
+        assert not Downloader().fetch(server.url + '/video.mp4', dest, content_type='image')
+        assert Downloader().fetch(server.url + '/thumb.png', dest, content_type='image')
+
+    def test_resume_partial_file(self, server, tmpdir):
+        dest = str(tmpdir.join('video.mp4'))
+        with open(dest + '.part', 'wb') as f:
+            f.write(FILES['/video.mp4'][:1234])
+        assert Downloader().fetch(server.url + '/video.mp4', dest)
+        assert open(dest, 'rb').read() == FILES['/video.mp4']
+        assert server.requests == [('/video.mp4', 'bytes=1234-')]
+
+    def test_retry_resumes_truncated_download(self, server, tmpdir):
+        server.truncate = 1
+        dest = str(tmpdir.join('video.mp4'))
+        assert Downloader(backoff=0).fetch(server.url + '/video.mp4', dest)
+        assert open(dest, 'rb').read() == FILES['/video.mp4']
+        assert server.requests == [('/video.mp4', None), ('/video.mp4', 'bytes=5000-')]
+
+    def test_retry_cap(self, server, tmpdir):
+        server.truncate = 10
+        downloader = Downloader(retries=2, backoff=0)
+        with pytest.raises(DownloadError):
+            downloader.fetch(server.url + '/video.mp4', str(tmpdir.join('video.mp4')))
+        assert len(server.requests) == 3
+
+    def test_permanent_errors_not_retried(self, server, tmpdir):
+        # The back off would take far longer than the test if it was retried
+        downloader = Downloader(retries=2, backoff=300)
+        dest = str(tmpdir.join('video.mp4'))
+        with pytest.raises(DownloadError):
+            downloader.fetch(server.url + '/loop', dest)
+        assert len(server.requests) == MAX_REDIRECTS + 1
+        del server.requests[:]
+        with pytest.raises(DownloadError):
+            downloader.fetch(server.url + '/forbidden', dest)
+        assert len(server.requests) == 1
+        del server.requests[:]
+        with pytest.raises(DownloadError):
+            Downloader(retries=2, backoff=0).fetch(server.url + '/busy', dest)
+        assert len(server.requests) == 3
+
+    def test_concurrent_downloads_reuse_connections(self, server, tmpdir):
+        downloader = Downloader(jobs=2)
+        items = [str(tmpdir.join('video%d.mp4' % i)) for i in range(10)]
+
+        def fetch(dest):
+            return downloader.fetch(server.url + '/video.mp4', dest)
+
+        assert list(downloader.map(fetch, items)) == [True] * 10
+        assert downloader.connections_opened <= 2
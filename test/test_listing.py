@@ -0,0 +1,66 @@
+"""
+Tests for `kalite_zim.listing`
+"""
+import os
+
+from kalite_zim import listing
+from kalite_zim.listing import DirectoryListing, TreeListing
+
+
+class TestDirectoryListing(object):
+
+    def test_lookups(self, tmpdir):
+        tmpdir.join('abc.mp4').write('12345')
+        tmpdir.join('abc.png').write('')
+        tmpdir.mkdir('sub')
+        files = DirectoryListing(str(tmpdir))
+        assert 'abc.mp4' in files
+        assert 'sub' not in files
+        assert 'def.mp4' not in files
+        assert files.size('abc.mp4') == 5
+        assert files.size('abc.mp4') == 5
+        assert files.signature('def.mp4') is None
+        # The listing and one stat
+        assert files.syscalls == 2
+
+        tmpdir.join('def.mp4').write('1')
+        assert 'def.mp4' not in files
+        files.add('def.mp4')
+        assert files.size('def.mp4') == 1
+
+    def test_missing(self, tmpdir):
+        files = DirectoryListing(str(tmpdir.join('missing')))
+        assert len(files) == 0
+
+    def test_names(self, tmpdir):
+        tmpdir.join('abc.mp4').write('12345')
+        files = DirectoryListing(str(tmpdir), names=['abc.mp4', 'abc.png'])
+        assert 'abc.png' in files
+        assert files.size('abc.mp4') == 5
+        assert files.syscalls == 1
+
+    def test_listdir(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(listing, 'scandir', None)
+        tmpdir.join('abc.srt').write('')
+        assert DirectoryListing(str(tmpdir)).names == set(['abc.srt'])
+
+
+class TestTreeListing(object):
+
+    def test_tree(self, tmpdir):
+        tmpdir.join('a', 'b', 'video.mp4').write('', ensure=True)
+        tree = TreeListing(str(tmpdir))
+        assert tree.isdir(str(tmpdir.join('a', 'b')))
+        assert tree.isfile(str(tmpdir.join('a', 'b', 'video.mp4')))
+        assert not tree.isfile(str(tmpdir.join('a', 'b')))
+        tree.discard(str(tmpdir.join('a', 'b', 'video.mp4')))
+        assert not tree.isfile(str(tmpdir.join('a', 'b', 'video.mp4')))
+
+    def test_makedirs(self, tmpdir):
+        tree = TreeListing(str(tmpdir))
+        syscalls = tree.syscalls
+        tree.makedirs(str(tmpdir.join('a', 'b')))
+        tree.makedirs(str(tmpdir.join('a', 'b')))
+        tree.makedirs(str(tmpdir.join('a')))
+        assert os.path.isdir(str(tmpdir.join('a', 'b')))
+        assert tree.syscalls == syscalls + 1
@@ -0,0 +1,83 @@
+"""
+Tests for `kalite_zim.loader`
+"""
+import json
+
+import pytest
+
+from kalite_zim import loader
+
+
+TREE = {
+    "id": "root", "kind": "Topic", "title": "Root", "path": "khan/",
+    "hide": True, "child_data": [{"kind": "Topic", "id": "math"}],
+    "children": [
+        {
+            "id": "math", "kind": "Topic", "title": "Math", "description": "Numbers",
+            "path": "khan/math/", "keywords": "a lot of keywords",
+            "children": [
+                {"id": "v1", "kind": "Video", "title": "One", "path": "khan/math/v1/", "duration": 56},
+                {
+                    "id": "e1", "kind": "Exercise", "title": "Exercise",
+                    "children": [{"id": "v3", "kind": "Video", "title": "Hidden"}],
+                },
+                {"id": "v2", "kind": "Video", "title": "Two", "path": "khan/math/v2/"},
+            ],
+        },
+    ],
+}
+
+CONTENT = {
+    "v1": {"youtube_id": "yt1", "format": "mp4", "duration": 56, "title": "One"},
+    "v2": {"youtube_id": "yt2", "format": "mp4", "keywords": ""},
+    "other": {"youtube_id": "yt3", "format": "mp4"},
+}
+
+
+@pytest.fixture(params=['json', 'ijson'])
+def backend(request, monkeypatch):
+    if request.param == 'json':
+        monkeypatch.setattr(loader, 'ijson', None)
+    else:
+        monkeypatch.setattr(loader, 'ijson', pytest.importorskip('ijson'))
+        monkeypatch.setattr(loader, '_errors', (IOError, ValueError, loader.ijson.JSONError))
+    return request.param
+
+
+class TestLoader(object):
+
+    def test_topic_tree(self, tmpdir, backend):
+        path = tmpdir.join('topics.json')
+        path.write(json.dumps(TREE))
+        root, video_ids = loader.load_topic_tree(str(path))
+        assert video_ids == set(['v1', 'v2'])
+        assert sorted(root.keys()) == ['children', 'id', 'kind', 'path', 'title']
+        math = root['children'][0]
+        assert math['description'] == 'Numbers'
+        assert 'keywords' not in math
+        assert [child['id'] for child in math['children']] == ['v1', 'v2']
+        assert math['children'][0] == {
+            'id': 'v1', 'kind': 'Video', 'title': 'One', 'path': 'khan/math/v1/', 'children': [],
+        }
+
+    def test_content(self, tmpdir, backend):
+        path = tmpdir.join('content.json')
+        path.write(json.dumps(CONTENT))
+        content = loader.load_content(str(path), set(['v1', 'v2', 'missing']))
+        assert content == {
+            'v1': {'youtube_id': 'yt1', 'format': 'mp4'},
+            'v2': {'youtube_id': 'yt2', 'format': 'mp4'},
+        }
+
+    def test_invalid(self, tmpdir, backend):
+        path = tmpdir.join('topics.json')
+        path.write('{"id": "root", "children": [')
+        with pytest.raises(loader.LoadError):
+            loader.load_topic_tree(str(path))
+        with pytest.raises(loader.LoadError):
+            loader.load_topic_tree(str(tmpdir.join('missing.json')))
+
+    def test_filter_content(self):
+        assert loader.filter_content(CONTENT, ['v2', 'missing']) == {
+            'v2': {'youtube_id': 'yt2', 'format': 'mp4'},
+        }
@@ -0,0 +1,44 @@
+"""
+Tests for `kalite_zim.manifest`
+"""
+import os
+
+from kalite_zim.manifest import BuildManifest, data_signature, file_signature
+
+
+class TestBuildManifest(object):
+
+    def test_fresh_after_record(self, tmpdir):
+        src = tmpdir.join('src.srt')
+        src.write('1')
+        dest = tmpdir.join('dest.vtt')
+        dest.write('1')
+        manifest_path = str(tmpdir.join('manifest.json'))
+        manifest = BuildManifest(manifest_path)
+        inputs = {'src': file_signature(str(src))}
+        assert not manifest.is_fresh('subtitle', 'a', inputs, [str(dest)])
+        manifest.record('subtitle', 'a', inputs, [str(dest)])
+        manifest.save()
+
+        manifest = BuildManifest(manifest_path)
+        assert manifest.is_fresh('subtitle', 'a', inputs, [str(dest)])
+        assert manifest.fresh == {'subtitle': 1}
+
+    def test_dirty_inputs_and_outputs(self, tmpdir):
+        dest = tmpdir.join('a.html')
+        dest.write('page')
+        manifest = BuildManifest(str(tmpdir.join('manifest.json')))
+        manifest.record('render', 'a', {'page': data_signature(['title'])}, [str(dest)])
+        assert not manifest.is_fresh('render', 'a', {'page': data_signature(['new title'])}, [str(dest)])
+        os.unlink(str(dest))
+        assert not manifest.is_fresh('render', 'a', {'page': data_signature(['title'])}, [str(dest)])
+
+    def test_untouched(self, tmpdir):
+        manifest_path = str(tmpdir.join('manifest.json'))
+        manifest = BuildManifest(manifest_path)
+        manifest.record('render', 'a', {})
+        manifest.record('render', 'b', {})
+        manifest.save()
+        manifest = BuildManifest(manifest_path)
+        manifest.is_fresh('render', 'a', {})
+        assert manifest.untouched('render') == ['b']
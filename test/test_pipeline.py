@@ -0,0 +1,96 @@
+"""
+Tests for `kalite_zim.pipeline`
+"""
+import threading
+import time
+
+from kalite_zim.pipeline import StageCounter, prefetch, run_processes
+
+
+class TestPrefetch(object):
+
+    def test_order_and_depth(self):
+        fetched = []
+        lock = threading.Lock()
+
+        def fetch(item):
+            time.sleep(0.001 * (item % 3))
+            with lock:
+                fetched.append(item)
+            return item * 2
+
+        results = []
+        for item, result in prefetch(range(30), fetch, depth=4, jobs=3):
+            # Never more than depth items fetched ahead, plus the ones
+            # currently being fetched
+            assert len(fetched) <= item + 1 + 4 + 3
+            results.append((item, result))
+        assert results == [(item, item * 2) for item in range(30)]
+
+    def test_stop_early(self):
+        results = prefetch(range(1000), lambda item: item, depth=2, jobs=2)
+        assert next(results) == (0, 0)
+        results.close()
+
+
+class TestStageCounter(object):
+
+    def test_counts(self):
+        stage = StageCounter('download')
+        stage.add(bytes=1024 * 1024)
+        stage.add(bytes=1024 * 1024)
+        assert (stage.items, stage.bytes) == (2, 2 * 1024 * 1024)
+        assert str(stage).startswith("download: 2 items, 2.0 MB")
+
+    def test_slowest(self):
+        stage = StageCounter('render', slowest=2)
+        for item, seconds in [('a', 0.3), ('b', 0.1), ('c', 0.5), ('d', 0.2)]:
+            stage.add(item=item, seconds=seconds)
+        # Added without a duration, only counted
+        stage.add(bytes_read=10)
+        assert stage.slowest == [(0.5, 'c'), (0.3, 'a')]
+        report = stage.as_dict()
+        assert report['items'] == 5
+        assert report['bytes_read'] == 10
+        assert report['cpu_seconds'] is None
+        assert report['busy_seconds'] == 1.1
+        assert [entry['item'] for entry in report['slowest']] == ['c', 'a']
+
+
+def _write_marker(path, seconds):
+    time.sleep(seconds)
+    with open(path, 'w') as f:
+        f.write('done')
+
+
+def _fail(message):
+    raise ValueError(message)
+
+
+class TestRunProcesses(object):
+
+    def test_results(self, tmpdir):
+        tasks = [
+            ('slow', _write_marker, (str(tmpdir.join('slow')), 0.3)),
+            ('broken', _fail, ('no such language',)),
+            ('fast', _write_marker, (str(tmpdir.join('fast')), 0)),
+        ]
+        results = dict(run_processes(tasks, jobs=3, poll_interval=0.01))
+        assert results['slow'] is None
+        assert results['fast'] is None
+        assert 'ValueError: no such language' in results['broken']
+        assert tmpdir.join('slow').read() == 'done'
+        assert tmpdir.join('fast').read() == 'done'
+
+    def test_jobs_limit(self, tmpdir):
+        tasks = [
+            (name, _write_marker, (str(tmpdir.join(name)), 0.1))
+            for name in ('a', 'b', 'c')
+        ]
+        finished = []
+        for name, error in run_processes(tasks, jobs=1, poll_interval=0.01):
+            assert error is None
+            finished.append(name)
+            # One at a time, so nothing after it has started yet
+            assert sorted(path.basename for path in tmpdir.listdir()) == finished
+        assert finished == ['a', 'b', 'c']
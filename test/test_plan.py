@@ -0,0 +1,85 @@
+"""
+Tests for `kalite_zim.plan`
+"""
+import json
+
+import pytest
+
+from kalite_zim.plan import PLAN_VERSION, PlanError, Throughput, format_duration, load_plan, phase_work, save_plan
+
+
+def write_report(path, *phases):
+    with open(str(path), 'w') as f:
+        json.dump({'phases': [dict(phase_work(), **phase) for phase in phases]}, f)
+    return str(path)
+
+
+class TestThroughput(object):
+
+    def test_estimate(self, tmpdir):
+        reports = [
+            write_report(
+                tmpdir.join('en.report.json'),
+                {'name': 'transcode', 'items': 2, 'bytes_read': 100, 'bytes_written': 50, 'wall_seconds': 10},
+                {'name': 'render', 'items': 10, 'bytes_written': 1000, 'wall_seconds': 1},
+            ),
+            write_report(
+                tmpdir.join('fr.report.json'),
+                {'name': 'transcode', 'items': 2, 'bytes_read': 300, 'bytes_written': 150, 'wall_seconds': 30},
+            ),
+            str(tmpdir.join('missing.report.json')),
+        ]
+        throughput = Throughput(reports)
+        assert throughput.reports == 2
+        assert throughput.rate('transcode') == 10
+        assert throughput.ratio('transcode', 'bytes_written', 'bytes_read') == 0.5
+        assert throughput.ratio('render', 'bytes_written', 'items') == 100
+        assert throughput.ratio('download', 'bytes_written', 'items') is None
+
+        work = {
+            'transcode': phase_work(items=1, bytes_read=50),
+            'render': phase_work(items=20),
+            'download': phase_work(items=1, bytes_written=10),
+            'thumbnail': phase_work(),
+        }
+        # Nothing to go by for downloads, and no thumbnails to create
+        assert throughput.estimate(work) == {'transcode': 5.0, 'render': 2.0, 'download': None}
+
+    def test_overlapping_stages(self, tmpdir):
+        # Downloads, links and transcodes took turns during the 10s of the
+        # media phase, each of them ran from nearly its start to its end
+        report = write_report(
+            tmpdir.join('en.report.json'),
+            {'name': 'media', 'items': 101, 'wall_seconds': 10, 'cpu_seconds': 4, 'busy_seconds': 0},
+            {'name': 'download', 'items': 1, 'bytes_written': 1000, 'wall_seconds': 0, 'busy_seconds': 2},
+            {'name': 'link', 'items': 100, 'wall_seconds': 9.5, 'busy_seconds': 1},
+            {'name': 'transcode', 'items': 4, 'bytes_read': 800, 'wall_seconds': 9.8, 'busy_seconds': 7},
+            {'name': 'thumbnail', 'items': 10, 'wall_seconds': 2, 'cpu_seconds': 1, 'busy_seconds': 0},
+        )
+        throughput = Throughput([report])
+        work = {
+            'download': phase_work(items=2, bytes_written=2000),
+            'link': phase_work(items=50),
+            'transcode': phase_work(items=2, bytes_read=400),
+            'thumbnail': phase_work(items=5),
+        }
+        assert throughput.estimate(work) == {'download': 4.0, 'link': 0.5, 'transcode': 3.5, 'thumbnail': 1.0}
+
+    def test_format_duration(self):
+        assert format_duration(3725.6) == "1 hours, 2 minutes, 5 seconds"
+
+
+class TestPlanFile(object):
+
+    def test_save_load(self, tmpdir):
+        path = str(tmpdir.join('plan.json'))
+        save_plan(path, {'version': PLAN_VERSION, 'languages': []})
+        assert load_plan(path) == {'version': PLAN_VERSION, 'languages': []}
+
+    def test_invalid(self, tmpdir):
+        with pytest.raises(PlanError):
+            load_plan(str(tmpdir.join('missing.json')))
+        path = str(tmpdir.join('plan.json'))
+        save_plan(path, {'version': 0})
+        with pytest.raises(PlanError):
+            load_plan(path)
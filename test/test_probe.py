@@ -0,0 +1,94 @@
+"""
+Tests for `kalite_zim.probe`
+"""
+import json
+
+from kalite_zim import probe
+from kalite_zim.transcode import LOW_SUFFIX, remux_args, renditions
+
+
+def ffprobe_output(video_codec='h264', audio_codec='aac', height=360, bit_rate='300000',
+                   format_name='mov,mp4,m4a,3gp,3g2,mj2'):
+    return json.dumps({
+        'streams': [
+            {'codec_type': 'video', 'codec_name': video_codec, 'width': height * 16 // 9, 'height': height},
+            {'codec_type': 'audio', 'codec_name': audio_codec},
+        ],
+        'format': {'format_name': format_name, 'duration': '60.000000', 'size': '2250000', 'bit_rate': bit_rate},
+    })
+
+
+class TestProbe(object):
+
+    def test_parse_probe(self):
+        result = probe.parse_probe(ffprobe_output())
+        assert result == {
+            'container': ['mov', 'mp4', 'm4a', '3gp', '3g2', 'mj2'],
+            'video_codec': 'h264',
+            'audio_codec': 'aac',
+            'width': 640,
+            'height': 360,
+            'duration': 60.0,
+            'bitrate': 300,
+        }
+        # Without a bitrate, it's worked out from the size
+        assert probe.parse_probe(ffprobe_output(bit_rate=None))['bitrate'] == 300
+
+    def test_decide(self):
+        bitrate = probe.max_bitrate('archive')
+        assert probe.decide(None, bitrate) == probe.TRANSCODE
+        assert probe.decide(probe.parse_probe(ffprobe_output()), bitrate) == probe.LINK
+        assert probe.decide(probe.parse_probe(ffprobe_output(bit_rate='2000000')), bitrate) == probe.TRANSCODE
+        assert probe.decide(probe.parse_probe(ffprobe_output(video_codec='mpeg4')), bitrate) == probe.TRANSCODE
+        assert probe.decide(probe.parse_probe(ffprobe_output(audio_codec='vorbis')), bitrate) == probe.TRANSCODE
+        assert probe.decide(probe.parse_probe(ffprobe_output()), bitrate, height=240) == probe.TRANSCODE
+        assert probe.decide(probe.parse_probe(ffprobe_output(format_name='flv')), bitrate) == probe.REMUX
+        webm = ffprobe_output(video_codec='vp8', audio_codec='vorbis', format_name='matroska,webm')
+        assert probe.decide(probe.parse_probe(webm), bitrate) == probe.LINK
+
+    def test_rendition_actions(self):
+        bitrate = probe.max_bitrate('archive')
+        both = renditions('archive', low_height=240)
+        actions = probe.rendition_actions(probe.parse_probe(ffprobe_output(format_name='flv')), both, bitrate,
+                                          low_height=240)
+        assert actions == {
+            '': (probe.REMUX, 'mp4', remux_args('mp4')),
+            LOW_SUFFIX: (probe.TRANSCODE, 'webm', both[LOW_SUFFIX]),
+        }
+        # Videos that are low already don't get another low rendition
+        actions = probe.rendition_actions(probe.parse_probe(ffprobe_output(height=240)), both, bitrate,
+                                          low_height=240)
+        assert actions == {'': (probe.LINK, 'mp4', None)}
+        actions = probe.rendition_actions(None, both, bitrate, low_height=240)
+        assert actions == {
+            '': (probe.TRANSCODE, 'webm', both['']),
+            LOW_SUFFIX: (probe.TRANSCODE, 'webm', both[LOW_SUFFIX]),
+        }
+
+    def test_display_size(self):
+        assert probe.display_size(None) == (probe.PLAYER_WIDTH, probe.PLAYER_HEIGHT)
+        assert probe.display_size({'width': 480, 'height': 360}) == (480, 360)
+        assert probe.display_size({'width': 1280, 'height': 720}) == (640, 360)
+        assert probe.display_size({'width': 1280, 'height': 720}, height=240) == (427, 240)
+
+    def test_cache(self, tmpdir):
+        video_path = str(tmpdir.join('abc.mp4'))
+        cache = probe.ProbeCache(str(tmpdir.join('cache')))
+        assert cache.get(video_path, [10, 1.5]) is None
+        cache.put(video_path, [10, 1.5], {'height': 360})
+        cache.save()
+        cache = probe.ProbeCache(str(tmpdir.join('cache')))
+        assert cache.get(video_path, [10, 1.5]) == {'height': 360}
+        assert cache.get(video_path, [11, 1.5]) is None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_cache_merges(self, tmpdir):
+        first = probe.ProbeCache(str(tmpdir.join('cache')))
+        second = probe.ProbeCache(str(tmpdir.join('cache')))
+        first.put(str(tmpdir.join('a.mp4')), [10, 1.5], {'height': 360})
+        second.put(str(tmpdir.join('b.mp4')), [10, 1.5], {'height': 240})
+        first.save()
+        second.save()
+        cache = probe.ProbeCache(str(tmpdir.join('cache')))
+        assert cache.get(str(tmpdir.join('a.mp4')), [10, 1.5]) == {'height': 360}
+        assert cache.get(str(tmpdir.join('b.mp4')), [10, 1.5]) == {'height': 240}
@@ -0,0 +1,86 @@
+"""
+Tests for `kalite_zim.render`
+"""
+import io
+import os
+
+import pytest
+
+django = pytest.importorskip('django')
+pytest.importorskip('kalite')
+
+from django.conf import settings  # noqa: E402
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'kalite_zim', 'templates')
+
+if not settings.configured:
+    settings.configure(TEMPLATE_DIRS=[TEMPLATE_DIR])
+
+from django.template import Context, Template  # noqa: E402
+
+from kalite_zim import render  # noqa: E402
+from kalite_zim.tree import TopicTree  # noqa: E402
+
+
+def make_tree(depth, fan_out):
+    tree = TopicTree()
+    level = [tree.add(None, 'root', 'Topic', 'Root')]
+    for d in range(depth):
+        next_level = []
+        for node in level:
+            for i in range(fan_out):
+                kind = 'Video' if d == depth - 1 else 'Topic'
+                next_level.append(tree.add(node, '{}-{}'.format(node.id, i), kind, 'Title <{}>'.format(i)))
+        level = next_level
+    return tree
+
+
+def menus_without_fragments(node, parents):
+    """
+    The menus of a page rendered from the template for every page, marking
+    the items on the page's path like the page template used to
+    """
+    with io.open(os.path.join(TEMPLATE_DIR, 'kalite_zim', 'menu.html'), encoding='utf-8') as f:
+        source = f.read().replace(
+            '{{ marker|safe }}',
+            '{% if child in parents or child.id == topic.id %} class="active"{% endif %}',
+        )
+    template = Template(source)
+    return [
+        {
+            "depth": parent.depth,
+            "html": template.render(Context({"parent": parent, "parents": parents, "topic": node})).rstrip(),
+        }
+        for parent in reversed(parents)
+    ]
+
+
+class TestMenus(object):
+
+    def test_same_as_without_fragments(self):
+        tree = make_tree(3, 3)
+        fragments = render.precompile_menus(tree)
+        assert len(fragments) == 1 + 3 + 9
+        for node in tree.nodes:
+            parents = render.topic_parents(tree, node)
+            expected = menus_without_fragments(node, parents)
+            assert render.topic_menus(tree, node, parents) == expected
+            # Every menu but the page's own one has an item marked
+            active = sum(menu['html'].count('class="active"') for menu in expected)
+            assert active == len(parents) - (1 if node.children else 0)
+
+        # Menus that weren't precompiled are rendered when needed
+        render._menus.clear()
+        node = tree.root.children[2].children[1]
+        parents = render.topic_parents(tree, node)
+        assert render.topic_menus(tree, node, parents) == menus_without_fragments(node, parents)
+
+    def test_fragment_active(self):
+        tree = make_tree(1, 2)
+        fragment = render.MenuFragment.render(tree.root)
+        assert render.MENU_MARKER not in fragment.html
+        assert fragment.active('unknown') == fragment.html
+        html = fragment.active('root-1')
+        assert html.count('class="active"') == 1
+        assert html.index('class="active"') > html.index('root-0.html')
+        assert html.index('class="active"') < html.index('root-1.html')
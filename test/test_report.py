@@ -0,0 +1,48 @@
+"""
+Tests for `kalite_zim.report`
+"""
+import json
+import os
+
+from kalite_zim.report import ExportReport
+
+
+def _busy():
+    return sum(i * i for i in range(20000))
+
+
+class TestExportReport(object):
+
+    def test_phases(self, tmpdir):
+        report = ExportReport()
+        with report.phase('annotate') as stage:
+            _busy()
+            stage.add(items=3)
+        report.stage('download').add(bytes=100, item='video', seconds=1.5)
+        with report.phase('annotate'):
+            pass
+
+        path = str(tmpdir.join('report.json'))
+        report.save(path, language='en')
+        saved = json.load(open(path))
+        assert saved['language'] == 'en'
+        assert [phase['name'] for phase in saved['phases']] == ['annotate', 'download']
+        annotate, download = saved['phases']
+        assert annotate['items'] == 3
+        assert annotate['wall_seconds'] >= 0
+        assert annotate['cpu_seconds'] is not None
+        # Overlapping stages aren't timed as a whole
+        assert download['cpu_seconds'] is None
+        assert download['bytes_written'] == 100
+        assert download['slowest'] == [{'item': 'video', 'seconds': 1.5}]
+
+    def test_profile(self, tmpdir):
+        report = ExportReport(profile=True)
+        with report.phase('render'):
+            _busy()
+        with report.phase('zimwriterfs', python=False):
+            pass
+        path = str(tmpdir.join('report.prof'))
+        top = report.dump_profile(path, top=5)
+        assert os.path.getsize(path) > 0
+        assert '_busy' in top
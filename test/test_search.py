@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for `kalite_zim.search`
+"""
+from __future__ import unicode_literals
+
+import json
+import os
+import subprocess
+
+from distutils.spawn import find_executable
+
+import pytest
+
+from kalite_zim.search import SearchIndex, tokenize
+
+SEARCH_JS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'kalite_zim', 'static', 'js',
+                         'search.js')
+
+# Runs search.js without a browser and prints the tokens of each text read
+# from stdin
+NODE_TOKENIZE = """
+var fs = require('fs'), vm = require('vm');
+var context = {$: function() {}, window: {}};
+vm.runInNewContext(fs.readFileSync(process.argv[1], 'utf8') + '\\n;this.db = search;', context);
+var texts = JSON.parse(fs.readFileSync(0, 'utf8'));
+console.log(JSON.stringify(texts.map(context.db.tokenize)));
+"""
+
+# Texts and their tokens, for both search.py and search.js
+TOKEN_VECTORS = [
+    ("Counting: small numbers (1-10), a x", ['counting', 'small', 'numbers', '10']),
+    ("Équations du second degré", ['equations', 'du', 'second', 'degre']),
+    ("«Über» naïve—café", ['uber', 'naive', 'cafe']),
+    ("हिन्दी भाषा", ['हिन्दी', 'भाषा']),
+    ("गणित: संख्याएँ", ['गणित', 'संख्याएँ']),
+    ("中文 数学，学习。", ['中文', '数学', '学习']),
+    ("snake_case", ['snake_case']),
+]
+
+
+class TestTokenize(object):
+
+    def test_words(self):
+        assert tokenize("Counting: small numbers (1-10), a x") == ['counting', 'small', 'numbers', '10']
+        assert tokenize("Équations du second degré") == ['equations', 'du', 'second', 'degre']
+        assert tokenize(None) == []
+
+    def test_vectors(self):
+        for text, tokens in TOKEN_VECTORS:
+            assert tokenize(text) == tokens
+
+    def test_same_as_search_js(self):
+        node = find_executable('node') or find_executable('nodejs')
+        if not node:
+            pytest.skip("node is needed to run search.js")
+        process = subprocess.Popen([node, '-e', NODE_TOKENIZE, SEARCH_JS], stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE)
+        texts = [text for text, __ in TOKEN_VECTORS]
+        stdout_data, __ = process.communicate(json.dumps(texts).encode('utf-8'))
+        assert process.returncode == 0
+        assert json.loads(stdout_data.decode('utf-8')) == [tokenize(text) for text in texts]
+
+
+class TestSearchIndex(object):
+
+    def _index(self, **kwargs):
+        index = SearchIndex(**kwargs)
+        index.add("Math", "math.html", "Topic", "All of math")
+        index.add("Counting", "counting.html", "Topic", "Learn counting")
+        index.add("Counting to ten", "v1.html", "Video", "Math with small numbers")
+        return index
+
+    def test_postings(self):
+        index = self._index()
+        assert index.documents[2] == ["Counting to ten", "v1.html", "V"]
+        # In the title, or only in the description
+        assert index.postings['math'] == [0 * 2 + 1, 2 * 2]
+        assert index.postings['counting'] == [1 * 2 + 1, 2 * 2 + 1]
+
+    def test_shards(self):
+        index = SearchIndex(max_postings=3, stop_fraction=1)
+        for n in range(4):
+            index.add("count{}".format(n), "{}.html".format(n), "Video")
+        index.add("co", "co.html", "Video")
+        index.add("math", "math.html", "Video")
+        shards = index.shards()
+        # "co" got too large and was split, down to single terms
+        assert shards == {
+            'co': ['co'],
+            'count0': ['count0'], 'count1': ['count1'], 'count2': ['count2'], 'count3': ['count3'],
+            'ma': ['math'],
+        }
+
+    def test_stop_terms(self):
+        index = SearchIndex(max_postings=2)
+        for n in range(4):
+            index.add("The video {}".format(n), "{}.html".format(n), "Video", "about the video")
+        assert index.stop_terms() == ['about', 'the', 'video']
+        assert 'the' not in [term for terms in index.shards().values() for term in terms]
+
+    def test_write(self, tmpdir):
+        index = self._index(chunk_size=2)
+        names = index.write(str(tmpdir))
+        assert names[-1] == 'index.json'
+        assert sorted(os.listdir(str(tmpdir))) == sorted(names)
+
+        meta = json.load(open(str(tmpdir.join('index.json'))))
+        assert meta['documents'] == 3
+        assert meta['stop'] == []
+        terms = {}
+        for number, prefix in enumerate(meta['shards']):
+            shard = json.load(open(str(tmpdir.join('s{}.json'.format(number)))))
+            assert all(term.startswith(prefix) for term in shard)
+            terms.update(shard)
+        assert terms == index.postings
+        chunks = [json.load(open(str(tmpdir.join('d{}.json'.format(n))))) for n in range(2)]
+        assert chunks[0] + chunks[1] == index.documents
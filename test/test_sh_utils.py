@@ -0,0 +1,55 @@
+"""
+Tests for `kalite_zim.anythumbnailer.sh_utils`
+"""
+from io import BytesIO
+import os
+
+from kalite_zim.anythumbnailer import sh_utils
+
+
+class TestShUtils(object):
+
+    def test_run_returns_bytesio(self):
+        output = sh_utils.run(('tr', 'a-z', 'A-Z'), input_=BytesIO(b'hello'))
+        assert output.read() == b'HELLO'
+
+    def test_run_failure(self):
+        assert sh_utils.run(('false',)) is None
+
+    def test_stream_pipeline(self, tmpdir):
+        src = tmpdir.join('src.txt')
+        src.write('hello world')
+        output = sh_utils.run_stream(
+            [('tr', 'a-z', 'A-Z'), ('tr', ' ', '_')],
+            input_=str(src),
+        )
+        assert output.read() == b'HELLO_WORLD'
+
+    def test_stream_to_file(self, tmpdir):
+        dest = str(tmpdir.join('dest.txt'))
+        assert sh_utils.run_stream([('cat',), ('rev',)], input_=BytesIO(b'abc\n'), output=dest) is True
+        assert open(dest, 'rb').read() == b'cba\n'
+
+    def test_stream_to_fd(self, tmpdir):
+        dest = str(tmpdir.join('dest.txt'))
+        with open(dest, 'wb') as f:
+            assert sh_utils.run_stream([('echo', 'fd'),], output=f.fileno()) is True
+        assert open(dest, 'rb').read() == b'fd\n'
+
+    def test_stream_failure_removes_output(self, tmpdir):
+        dest = str(tmpdir.join('dest.txt'))
+        assert sh_utils.run_stream([('echo', 'x'), ('false',)], output=dest) is None
+        assert not os.path.exists(dest)
+
+    def test_early_exit_does_not_hang(self):
+        # head stops reading long before all of the input has been fed
+        output = sh_utils.run_stream(
+            [('cat',), ('head', '-c', '10')],
+            input_=BytesIO(b'x' * (10 * 1024 * 1024)),
+        )
+        # cat is killed by SIGPIPE once head exited, which isn't a failure
+        assert output.read() == b'x' * 10
+
+    def test_upstream_failure(self):
+        assert sh_utils.run_stream([('sh', '-c', 'echo x; exit 3'), ('cat',)]) is None
+        assert sh_utils.run_stream([('yes',), ('false',)]) is None
@@ -0,0 +1,48 @@
+"""
+Tests for `kalite_zim.subtitles`
+"""
+import io
+import os
+
+import pytest
+
+from kalite_zim.subtitles import SubtitleCache, convert_many, srt_key
+
+
+SRT = b"1\n00:00:01,000 --> 00:00:02,500\nHello\n\n2\n00:00:03,000 --> 00:00:04,000\nWorld\n"
+
+
+class TestSubtitles(object):
+
+    def test_cache(self, tmpdir):
+        srt_path = tmpdir.join('abc.srt')
+        srt_path.write_binary(SRT)
+        key = srt_key(str(srt_path))
+        cache = SubtitleCache(str(tmpdir.join('cache')))
+        assert cache.get(key) is None
+        vtt_path = tmpdir.join('cache', key[:2], key + '.vtt')
+        vtt_path.write('WEBVTT', ensure=True)
+        assert cache.get(key) == str(vtt_path)
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    @pytest.mark.parametrize('jobs', [1, 2])
+    def test_convert_many(self, tmpdir, jobs):
+        pytest.importorskip('submarine')
+        cache = SubtitleCache(str(tmpdir.join('cache')))
+        items = []
+        for n in range(3):
+            srt_path = tmpdir.join('{}.srt'.format(n))
+            srt_path.write_binary(SRT.replace(b'World', 'World {}'.format(n).encode('utf-8')))
+            items.append((str(srt_path), cache.path(srt_key(str(srt_path)))))
+        items.append((str(tmpdir.join('missing.srt')), cache.path('0' * 40)))
+
+        results = dict((srt, (vtt, error)) for srt, vtt, error, __ in convert_many(items, jobs=jobs))
+        assert len(results) == 4
+        assert results[items[-1][0]][1] is not None
+        for srt_path, vtt_path in items[:-1]:
+            assert results[srt_path] == (vtt_path, None)
+            with io.open(vtt_path, encoding='utf-8') as f:
+                vtt = f.read()
+            assert vtt.startswith('WEBVTT')
+            assert '00:00:02.500' in vtt
+        assert not [name for name in os.listdir(os.path.dirname(items[0][1])) if name.endswith('.tmp')]
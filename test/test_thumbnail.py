@@ -0,0 +1,103 @@
+"""
+Tests for `kalite_zim.anythumbnailer`
+"""
+import os
+
+from kalite_zim.anythumbnailer import thumbnail_
+
+from . import fake_executable
+
+
+FAKE_FFMPEG = """#!/bin/sh
+# Writes its arguments into the output file, fails for broken inputs and
+# writes an empty file when seeking into short ones like ffmpeg does
+prev=""
+for arg; do
+    if [ "$prev" = "-i" ]; then src=$arg; fi
+    if [ "$prev" = "-ss" ]; then seek=$arg; fi
+    prev=$arg
+    last=$arg
+done
+case "$src" in
+    *broken*) exit 1;;
+    *short*) if [ "$seek" != 0 ]; then : > "$last"; exit 0; fi;;
+esac
+echo "$@" > "$last"
+"""
+
+
+def fake_ffmpeg(tmpdir, monkeypatch):
+    path = fake_executable(tmpdir, 'ffmpeg', FAKE_FFMPEG)
+    monkeypatch.setattr(
+        thumbnail_, 'registry',
+        thumbnail_.ThumbnailerRegistry(thumbnail_.thumbnailers, {'ffmpeg': path})
+    )
+    return path
+
+
+class TestThumbnail(object):
+
+    def test_single_frame_written_to_target(self, tmpdir, monkeypatch):
+        fake_ffmpeg(tmpdir, monkeypatch)
+        dest = str(tmpdir.join('thumb.png'))
+        assert thumbnail_.create_thumbnail_file(str(tmpdir.join('video.mp4')), dest)
+        args = open(dest).read().split()
+        # Seek on the input, then decode and scale a single frame
+        assert args.index('-ss') < args.index('-i')
+        assert args[args.index('-frames:v') + 1] == '1'
+        assert args[args.index('-vf') + 1].startswith('scale=')
+
+    def test_failure_leaves_nothing(self, tmpdir, monkeypatch):
+        fake_ffmpeg(tmpdir, monkeypatch)
+        dest = str(tmpdir.join('thumb.png'))
+        assert not thumbnail_.create_thumbnail_file(str(tmpdir.join('broken.mp4')), dest)
+        assert not os.path.exists(dest)
+
+    def test_short_video_from_start(self, tmpdir, monkeypatch):
+        fake_ffmpeg(tmpdir, monkeypatch)
+        dest = str(tmpdir.join('thumb.png'))
+        assert thumbnail_.create_thumbnail_file(str(tmpdir.join('short.mp4')), dest)
+        args = open(dest).read().split()
+        assert args[args.index('-ss') + 1] == '0'
+        # Also when several frames are taken
+        args = thumbnail_.create_thumbnail(str(tmpdir.join('short.mp4'))).read().split()
+        assert args[args.index(b'-ss') + 1] == b'0'
+
+    def test_unknown_type(self, tmpdir):
+        assert not thumbnail_.create_thumbnail_file(str(tmpdir.join('video.unknown')), str(tmpdir.join('thumb.png')))
+
+    def test_batch_keeps_order(self, tmpdir, monkeypatch):
+        fake_ffmpeg(tmpdir, monkeypatch)
+        names = ['a', 'broken', 'c', 'd', 'e']
+        sources_and_outputs = [
+            (str(tmpdir.join(name + '.mp4')), str(tmpdir.join(name + '.png')))
+            for name in names
+        ]
+        results = list(thumbnail_.create_thumbnail_files(sources_and_outputs, jobs=3))
+        assert [(src, dest) for src, dest, __ in results] == sources_and_outputs
+        assert [success for __, __, success in results] == [True, False, True, True, True]
+
+
+class TestThumbnailerRegistry(object):
+
+    def test_override_and_memoized(self, tmpdir, monkeypatch):
+        path = fake_ffmpeg(tmpdir, monkeypatch)
+        thumbnailer = thumbnail_.thumbnailer_for('video/mp4')
+        assert isinstance(thumbnailer, thumbnail_.ffmpeg)
+        assert thumbnailer.executable == path
+        assert thumbnail_.thumbnailer_for('video/mp4') is thumbnailer
+        assert thumbnail_.thumbnailer_for('video/webm') is thumbnailer
+
+    def test_missing_executable(self, tmpdir):
+        registry = thumbnail_.ThumbnailerRegistry(
+            thumbnail_.thumbnailers,
+            {'ffmpeg': str(tmpdir.join('missing'))},
+        )
+        assert registry.thumbnailer_for('video/mp4') is None
+        assert registry.thumbnailer_for('application/x-unknown') is None
+
+    def test_available(self, tmpdir, monkeypatch):
+        path = fake_ffmpeg(tmpdir, monkeypatch)
+        backends = thumbnail_.available_thumbnailers()
+        assert backends['ffmpeg'] == {'ffmpeg': path}
+        assert set(backends['Poppler']) == set(['pdftoppm', 'pnmtopng', 'pnmtojpeg'])
@@ -0,0 +1,85 @@
+"""
+Tests for `kalite_zim.transcode`
+"""
+import os
+
+from kalite_zim import transcode
+
+from . import fake_executable
+
+
+FAKE_FFMPEG = """#!/bin/sh
+# Writes the pass log it was given into the output file
+prev=""
+for arg; do
+    if [ "$prev" = "-passlogfile" ]; then passlog=$arg; fi
+    prev=$arg
+    last=$arg
+done
+case "$passlog" in
+    *broken*) exit 1;;
+esac
+echo "$passlog" > "$last"
+"""
+
+
+def fake_ffmpeg(tmpdir):
+    return fake_executable(tmpdir, 'ffmpeg', FAKE_FFMPEG)
+
+
+class TestTranscode(object):
+
+    def test_threads_per_job(self):
+        assert transcode.threads_per_job(1, cpu_count=32) == transcode.MAX_THREADS
+        assert transcode.threads_per_job(8, cpu_count=32) == 4
+        assert transcode.threads_per_job(64, cpu_count=32) == 1
+
+    def test_webm_args_threads(self):
+        args = transcode.webm_args('ffmpeg', 'in.mp4', threads=3)
+        assert args[args.index('-threads') + 1] == '3'
+
+    def test_encoder_args(self):
+        args = transcode.encoder_args('fast', height=360)
+        assert args[args.index('-cpu-used') + 1] == '4'
+        assert args[args.index('-vf') + 1] == "scale=-2:'min(360,ih)'"
+        assert '-vf' not in transcode.encoder_args()
+        args = transcode.encoder_args(bitrate=100)
+        assert args[args.index('-b:v') + 1] == '100k'
+        assert args[args.index('-bufsize') + 1] == '200k'
+
+    def test_renditions(self):
+        assert list(transcode.renditions('balanced')) == ['']
+        renditions = transcode.renditions('balanced', low_height=240)
+        assert list(renditions) == ['', transcode.LOW_SUFFIX]
+        assert renditions[transcode.LOW_SUFFIX] == transcode.encoder_args('balanced', 240, transcode.LOW_BITRATE)
+
+    def test_transcode_many_keeps_order(self, tmpdir):
+        ffmpeg = fake_ffmpeg(tmpdir)
+        videos = [
+            (str(tmpdir.join('src%d.mp4' % i)), str(tmpdir.join('dest%d.webm' % i)))
+            for i in range(6)
+        ]
+        results = list(transcode.transcode_many(ffmpeg, videos, jobs=3))
+        assert [dest for dest, __ in results] == [dest for __, dest in videos]
+        assert all(error is None for __, error in results)
+        pass_logs = set(open(dest).read() for __, dest in videos)
+        assert len(pass_logs) == len(videos)
+        assert not any(os.path.exists(log) for log in pass_logs)
+
+    def test_transcode_failure(self, tmpdir, monkeypatch):
+        ffmpeg = fake_ffmpeg(tmpdir)
+        monkeypatch.setattr(transcode.tempfile, 'mkdtemp', lambda prefix: str(tmpdir.mkdir('broken')))
+        dest = str(tmpdir.join('dest.webm'))
+        [(result_dest, error)] = transcode.transcode_many(ffmpeg, [('src.mp4', dest)])
+        assert result_dest == dest
+        assert error.startswith("Error invoking ffmpeg")
+        assert not os.path.exists(dest)
+        assert not os.path.exists(dest + '.partial')
+
+    def test_remux(self, tmpdir):
+        ffmpeg = fake_ffmpeg(tmpdir)
+        assert transcode.remux_args('mp4') == ['-codec', 'copy', '-movflags', '+faststart', '-f', 'mp4']
+        dest = str(tmpdir.join('dest.mp4'))
+        transcode.remux(ffmpeg, 'src.flv', dest, transcode.remux_args('mp4'))
+        assert os.path.exists(dest)
+        assert not os.path.exists(dest + '.partial')
@@ -0,0 +1,87 @@
+"""
+Tests for `kalite_zim.tree`
+"""
+from kalite_zim.tree import TopicTree, TreeWalk
+
+
+def make_tree(depth, fan_out=2):
+    tree = TopicTree()
+    level = [tree.add(None, 'root', 'Topic', 'Root')]
+    for d in range(depth):
+        next_level = []
+        for node in level:
+            for i in range(fan_out):
+                kind = 'Video' if d == depth - 1 else 'Topic'
+                child = tree.add(node, '{}-{}'.format(node.id, i), kind, 'Title', format='mp4')
+                next_level.append(child)
+        level = next_level
+    return tree
+
+
+class TestTopicTree(object):
+
+    def test_parents_by_index(self):
+        tree = make_tree(2)
+        node = tree.root.children[1].children[0]
+        assert node.id == 'root-1-0'
+        assert node.depth == 2
+        assert node.url == 'root-1-0.html'
+        assert tree.parent(node) is tree.root.children[1]
+        assert tree.ancestors(node) == [tree.root.children[1], tree.root]
+        assert tree.parent(tree.root) is None
+
+    def test_compact(self):
+        tree = make_tree(2)
+        videos = tree.root.children[0].children
+        assert not hasattr(videos[0], '__dict__')
+        assert videos[0].kind is videos[1].kind
+        assert videos[0].format is videos[1].format
+        assert videos[0].children == ()
+
+
+class TestTreeWalk(object):
+
+    def test_order(self):
+        tree = make_tree(2)
+        events = []
+        TreeWalk().visit(
+            'a', enter=lambda node, parent: events.append(('a', node.id)),
+        ).visit(
+            'b',
+            enter=lambda node, parent: events.append(('b', node.id)),
+            leave=lambda node, parent: events.append(('leave', node.id)),
+        ).run(tree.root)
+        assert events[:4] == [('a', 'root'), ('b', 'root'), ('a', 'root-0'), ('b', 'root-0')]
+        assert events.index(('leave', 'root-0-1')) < events.index(('leave', 'root-0'))
+        assert events[-1] == ('leave', 'root')
+
+    def test_parent_and_filtering(self):
+        tree = make_tree(2)
+        parents = {}
+
+        def only_first(node, parent):
+            parents[node.id] = parent.id if parent else None
+            if node.children:
+                node.children = node.children[:1]
+
+        walk = TreeWalk().visit('filter', enter=only_first).run(tree.root)
+        assert parents == {'root': None, 'root-0': 'root', 'root-0-0': 'root-0'}
+        assert walk.nodes == 3
+        assert list(walk.timings.keys()) == ['filter']
+
+    def test_children_function(self):
+        tree = {'id': 'root', 'children': [{'id': 'a'}, {'id': 'b', 'children': [{'id': 'c'}]}]}
+        ids = []
+        TreeWalk(
+            children=lambda node: node.get('children', [])
+        ).visit('ids', enter=lambda node, parent: ids.append(node['id'])).run(tree)
+        assert ids == ['root', 'a', 'b', 'c']
+
+    def test_deep_tree(self):
+        tree = TopicTree()
+        node = tree.add(None, 0, 'Topic', '')
+        for i in range(1, 5000):
+            node = tree.add(node, i, 'Topic', '')
+        ids = []
+        TreeWalk().visit('ids', leave=lambda node, parent: ids.append(node.id)).run(tree.root)
+        assert ids == list(reversed(range(5000)))
@@ -0,0 +1,208 @@
+"""
+Tests for `kalite_zim.writers`
+"""
+import os
+import sys
+import types
+
+from collections import OrderedDict
+
+import pytest
+
+from kalite_zim.writers import WRITERS, LibzimWriter, ZimWriter, ZimwriterfsWriter, WriterError, iso_639_3
+
+from . import fake_executable
+
+
+METADATA = {
+    'welcome': 'welcome.html',
+    'favicon': 'static/img/ka_leaf.png',
+    'publisher': 'Learning Equality',
+    'creator': 'KhanAcademy.org',
+    'title': 'Khan Academy (en)',
+    'description': 'Videos from Khan Academy',
+    'language': 'en',
+}
+
+
+class FakeWriter(ZimWriter):
+    """
+    Keeps everything in memory
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(FakeWriter, self).__init__(*args, **kwargs)
+        self.articles = {}
+        self.files = {}
+        self.finalized = False
+
+    def add_article(self, path, html, title=None):
+        self.articles[path] = (title, html)
+
+    def add_file(self, path, src_path):
+        self.files[path] = src_path
+
+    def finalize(self):
+        self.finalized = True
+
+
+def fake_zimwriterfs(tmpdir, exit_code=0):
+    log_path = str(tmpdir.join('zimwriterfs.log'))
+    return fake_executable(tmpdir, 'zimwriterfs', '#!/bin/sh\necho "$@" > "{}"\nexit {}\n'.format(log_path, exit_code))
+
+
+class FakeCreator(object):
+    """
+    Stands in for ``libzim.writer.Creator``, refusing duplicate paths like
+    libzim does
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.items = OrderedDict()
+        self.metadata = {}
+        self.illustrations = {}
+        self.finished = False
+
+    def config_indexing(self, indexing, language):
+        self.indexing = (indexing, language)
+        return self
+
+    def set_mainpath(self, path):
+        self.mainpath = path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.finished = True
+
+    def add_item(self, item):
+        if item.get_path() in self.items:
+            raise RuntimeError("Impossible to add {}, it's already there".format(item.get_path()))
+        self.items[item.get_path()] = item
+
+    def add_metadata(self, name, value):
+        self.metadata[name] = value
+
+    def add_illustration(self, size, data):
+        self.illustrations[size] = data
+
+
+def fake_libzim(monkeypatch):
+    """
+    Install a stand-in for the libzim package with the parts of
+    ``libzim.writer`` that the writer uses
+    """
+    writer = types.ModuleType(str('libzim.writer'))
+    writer.Creator = FakeCreator
+    writer.Item = object
+    writer.StringProvider = lambda content: ('string', content)
+    writer.FileProvider = lambda path: ('file', path)
+    writer.Hint = type(str('Hint'), (object,), {'FRONT_ARTICLE': 'front_article'})
+    libzim = types.ModuleType(str('libzim'))
+    libzim.writer = writer
+    monkeypatch.setitem(sys.modules, 'libzim', libzim)
+    monkeypatch.setitem(sys.modules, 'libzim.writer', writer)
+
+
+class TestWriters(object):
+
+    def test_add_directory(self, tmpdir):
+        static = tmpdir.mkdir('static')
+        static.mkdir('img').join('ka_leaf.png').write('png')
+        static.join('app.js').write('js')
+        writer = FakeWriter('out.zim', str(tmpdir), METADATA)
+        writer.add_directory('static', str(static))
+        assert writer.files == {
+            os.path.join('static', 'app.js'): str(static.join('app.js')),
+            os.path.join('static', 'img', 'ka_leaf.png'): str(static.join('img', 'ka_leaf.png')),
+        }
+
+    def test_zimwriterfs_staging(self, tmpdir):
+        tmp_dir = tmpdir.mkdir('tmp')
+        src = tmpdir.join('video.mp4')
+        src.write('video')
+        writer = ZimwriterfsWriter(
+            str(tmpdir.join('out.zim')), str(tmp_dir), METADATA,
+            zimwriterfs=fake_zimwriterfs(tmpdir)
+        )
+        writer.add_article('a.html', u'<p>\u2011</p>')
+        writer.add_file('khan/video.mp4', str(src))
+        # Adding the same file again is a no-op
+        writer.add_file('khan/video.mp4', str(src))
+        assert os.path.samefile(str(src), str(tmp_dir.join('khan', 'video.mp4')))
+        assert tmp_dir.join('a.html').read_binary() == u'<p>\u2011</p>'.encode('utf-8')
+        writer.finalize()
+        args = tmpdir.join('zimwriterfs.log').read().split()
+        assert args[-2:] == [str(tmp_dir), str(tmpdir.join('out.zim'))]
+
+    def test_zimwriterfs_directory_linked(self, tmpdir):
+        tmp_dir = tmpdir.mkdir('tmp')
+        tmp_dir.mkdir('static').join('stale.css').write('old')
+        static = tmpdir.mkdir('static')
+        static.mkdir('img').join('ka_leaf.png').write('png')
+        writer = ZimwriterfsWriter(
+            str(tmpdir.join('out.zim')), str(tmp_dir), METADATA,
+            zimwriterfs=fake_zimwriterfs(tmpdir)
+        )
+        writer.add_directory('static', str(static))
+        assert not tmp_dir.join('static', 'stale.css').exists()
+        assert os.path.samefile(
+            str(static.join('img', 'ka_leaf.png')),
+            str(tmp_dir.join('static', 'img', 'ka_leaf.png'))
+        )
+
+    def test_zimwriterfs_failure(self, tmpdir):
+        writer = ZimwriterfsWriter(
+            str(tmpdir.join('out.zim')), str(tmpdir), METADATA,
+            zimwriterfs=fake_zimwriterfs(tmpdir, exit_code=1)
+        )
+        with pytest.raises(WriterError):
+            writer.finalize()
+
+    def test_backends(self, monkeypatch):
+        assert WRITERS == {'zimwriterfs': ZimwriterfsWriter, 'libzim': LibzimWriter}
+        monkeypatch.setitem(sys.modules, 'libzim', None)
+        with pytest.raises(WriterError):
+            WRITERS['libzim']('out.zim', 'tmp', METADATA)
+
+    def test_libzim(self, tmpdir, monkeypatch):
+        fake_libzim(monkeypatch)
+        static = tmpdir.mkdir('static')
+        static.mkdir('img').join('ka_leaf.png').write_binary(b'png')
+        video = tmpdir.join('video.webm')
+        video.write('video')
+        writer = LibzimWriter(str(tmpdir.join('out.zim')), str(tmpdir), METADATA)
+        creator = writer.creator
+        assert creator.indexing == (True, 'eng')
+        assert creator.mainpath == 'welcome.html'
+
+        writer.add_article('welcome.html', '<p>Welcome</p>', title='Welcome')
+        writer.add_file('khan/video.webm', str(video))
+        writer.add_directory('static', str(static))
+        # A video in two topics has its page rendered twice
+        writer.add_article('video.html', '<p>Video</p>', title='Video')
+        writer.add_article('video.html', '<p>Video</p>', title='Video')
+        assert list(creator.items) == ['welcome.html', 'khan/video.webm', 'static/img/ka_leaf.png', 'video.html']
+        article = creator.items['welcome.html']
+        assert article.get_title() == 'Welcome'
+        assert article.get_mimetype() == 'text/html'
+        assert article.get_contentprovider() == ('string', '<p>Welcome</p>')
+        assert article.get_hints() == {'front_article': True}
+        video_item = creator.items['khan/video.webm']
+        assert video_item.get_mimetype() == 'video/webm'
+        assert video_item.get_contentprovider() == ('file', str(video))
+        assert video_item.get_hints() == {'front_article': False}
+
+        writer.finalize()
+        assert creator.finished
+        assert creator.illustrations == {48: b'png'}
+        assert creator.metadata['Language'] == 'eng'
+        assert creator.metadata['Title'] == 'Khan Academy (en)'
+
+    def test_iso_639_3(self):
+        assert iso_639_3('en') == 'eng'
+        assert iso_639_3('pt-BR') == 'por'
+        assert iso_639_3('zh_CN') == 'zho'
+        assert iso_639_3('xx') == 'xx'